@@ -0,0 +1,249 @@
+# admission.py
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, request, session
+
+# Priority class of each endpoint. `critical` endpoints are cheap and keep
+# the app usable under load (auth status, metrics, static files), so they
+# are never limited. Endpoints not listed fall in DEFAULT_CLASS.
+CRITICAL = 'critical'
+DEFAULT_CLASS = 'interactive'
+ENDPOINT_CLASSES = {
+    'auth.auth_status': CRITICAL,
+    'auth.logout': CRITICAL,
+    'hello': CRITICAL,
+    'liveness': CRITICAL,
+    'readiness': CRITICAL,
+    'metrics': CRITICAL,
+    'cache_stats': CRITICAL,
+    'fragment_cache_stats': CRITICAL,
+    'live_stream_stats': CRITICAL,
+    'recipe_bp.recipe_stream': CRITICAL,
+    'serve': CRITICAL,
+    'serve_uploaded_file': CRITICAL,
+    # Full lists, searches and exports: many rows per request
+    'recipe_bp.get_all_recipes': 'bulk',
+    'recipe_bp.get_trending_recipes': 'bulk',
+    'recipe_bp.search_recipes_route': 'bulk',
+    'recipe_bp.get_recipes_by_ingredients': 'bulk',
+    'recipe_bp.get_my_saved_recipes': 'bulk',
+    'recipe_bp.export_recipes': 'bulk',
+    # Recipe and image writes
+    'recipe_bp.add_recipe': 'write',
+    'recipe_bp.update_recipe': 'write',
+    'recipe_bp.delete_recipe': 'write',
+    'recipe_bp.batch_recipes': 'write',
+    'recipe_bp.import_recipes': 'write',
+    'upload_bp.start_upload': 'write',
+    'upload_bp.put_chunk': 'write',
+    'upload_bp.finalize_upload': 'write',
+}
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request cannot be admitted. `reason` is 'queue_full' or
+    'timeout'.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for one priority class, with a bounded wait queue.
+
+    A request runs if fewer than `limit` requests of its class are running.
+    Otherwise it waits up to `max_wait` seconds, behind at most `queue`
+    others, and is rejected after that. The limit adapts to latency
+    (additive increase, multiplicative decrease). A request that finishes
+    within `target` seconds while the class is busy raises the limit by
+    1/limit, so the limit grows by about one per round of requests. A
+    slower request cuts it by `backoff`. Cuts happen at most once per
+    `target` seconds, so one slow burst counts once.
+    """
+
+    def __init__(self, name, initial, minimum, maximum, queue, max_wait, target, backoff=0.9):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.queue = queue
+        self.max_wait = max_wait
+        self.target = target
+        self.backoff = backoff
+        self.inflight = 0
+        self.waiting = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.max_wait))
+
+    def acquire(self):
+        with self._condition:
+            if self.inflight < int(self.limit):
+                self.inflight += 1
+                return
+            if self.waiting >= self.queue:
+                raise Overloaded('queue_full')
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.inflight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Overloaded('timeout')
+                    self._condition.wait(remaining)
+                self.inflight += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self, seconds=None):
+        """
+        Frees a slot. `seconds` is the request's service time, or None to
+        leave the limit alone.
+        """
+        with self._condition:
+            busy = self.inflight >= int(self.limit) or self.waiting
+            self.inflight -= 1
+            if seconds is not None:
+                now = time.monotonic()
+                if seconds > self.target:
+                    if now - self._last_decrease >= self.target:
+                        self.limit = max(self.minimum, self.limit * self.backoff)
+                        self._last_decrease = now
+                elif busy:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify(max(1, int(self.limit) - self.inflight))
+
+    def stats(self):
+        return {'limit': int(self.limit), 'inflight': self.inflight, 'waiting': self.waiting}
+
+
+class TokenBuckets:
+    """
+    Per-key token buckets: a key may spend `burst` tokens at once and
+    regains `rate` tokens per second. Buckets are per process; beyond
+    `max_keys` the least recently used are dropped (a dropped bucket
+    starts full again).
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """
+        Spends one token. Returns 0 on success, or the seconds until a
+        token is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def _overloaded_response(message, retry_after, status):
+    response = jsonify(message=message)
+    response.headers['Retry-After'] = str(retry_after)
+    return response, status
+
+
+def rate_limited(bucket):
+    """
+    Decorator limiting how often each logged-in user may call the view,
+    with the token bucket named `bucket` in RATE_LIMITS. Excess calls get a
+    429 with Retry-After. Apply it below login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            buckets = current_app.extensions.get('rate_limits', {}).get(bucket)
+            if buckets is not None:
+                wait = buckets.take(session.get('user_id'))
+                if wait:
+                    current_app.extensions['metrics'].increment('recipe_app_rate_limited_total', (('bucket', bucket),))
+                    return _overloaded_response("Too many requests, please slow down.", math.ceil(wait), 429)
+            return view(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _admit():
+    limiters = current_app.extensions['admission']
+    limiter = limiters.get(ENDPOINT_CLASSES.get(request.endpoint, DEFAULT_CLASS)) if request.endpoint else None
+    if limiter is None:
+        return None
+    try:
+        limiter.acquire()
+    except Overloaded as e:
+        current_app.extensions['metrics'].increment(
+            'recipe_app_admission_rejected_total', (('class', limiter.name), ('reason', e.reason)))
+        return _overloaded_response("The server is busy, please try again in a moment.", limiter.retry_after, 503)
+    g.admission = [limiter, time.perf_counter(), None]
+    return None
+
+
+def _measure(response):
+    # Service time up to the first byte, so a long streamed export does not
+    # count as slow
+    admission = g.get('admission')
+    if admission is not None:
+        admission[2] = time.perf_counter() - admission[1]
+    return response
+
+
+def _release(exc):
+    admission = g.pop('admission', None)
+    if admission is not None:
+        limiter, _, seconds = admission
+        limiter.release(seconds)
+
+
+def init_app(app):
+    """
+    Installs admission control for the classes in ADMISSION_CLASSES, unless
+    ADMISSION_ENABLED is off, and the per-user rate limits in RATE_LIMITS.
+    Queue depth, running requests and limits appear on GET /metrics.
+    """
+    app.extensions['rate_limits'] = {
+        name: TokenBuckets(rate, burst) for name, (rate, burst) in app.config['RATE_LIMITS'].items()
+    }
+    if not app.config['ADMISSION_ENABLED']:
+        return
+    limiters = app.extensions['admission'] = {
+        name: AdaptiveLimiter(name, **settings) for name, settings in app.config['ADMISSION_CLASSES'].items()
+    }
+
+    def collect():
+        for name, limiter in limiters.items():
+            stats = limiter.stats()
+            labels = (('class', name),)
+            yield 'recipe_app_admission_inflight', labels, stats['inflight']
+            yield 'recipe_app_admission_queue_depth', labels, stats['waiting']
+            yield 'recipe_app_admission_limit', labels, stats['limit']
+
+    app.extensions['metrics'].add_collector(collect)
+    app.before_request(_admit)
+    app.after_request(_measure)
+    app.teardown_request(_release)
@@ -1,217 +1,196 @@
 # app.py
-from flask import Flask, send_from_directory, jsonify, session, request
+from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
-from models import db, User, Recipe
+from models import db
 from auth_routes import auth_bp
-from werkzeug.utils import secure_filename
+from recipe_routes import recipe_bp
+from upload_routes import upload_bp
+import upload_routes
+import ingredients
+import search
+import counters
+import migrations
+import cache
+import images
+import assets
+import database
+import trending
+import bulk
+import transfer
+import instrumentation
+import json_provider
+import fragments
+import changelog
+import similar
+import live
+import passwords
+import admission
+import health
 import os
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def start_background_threads(app):
+    """
+    Starts the app's background threads: the like-counter buffer, the
+    trending rescorer and the change-log compactor. Threads do not survive
+    fork, so a preforking server (serve.py) creates the app with
+    background=False and calls this in each worker.
+    """
+    counters.start_background(app)
+    trending.start_background(app)
+    changelog.start_background(app)
 
 
-def create_app():
+def create_app(background=True):
 
-    # Initialize Flask with the correct static folder path
-    app = Flask(__name__, static_folder='../frontend/static')
+    # Frontend files are served from the asset manifest (see assets.py)
+    app = Flask(__name__, static_folder=None)
 
     CORS(app, supports_credentials=True)
 
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///recipe_app.db'
+    # Engine profile: DATABASE_URL selects PostgreSQL, otherwise a WAL-mode SQLite file
+    app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    app.config['DATABASE_MAX_OVERFLOW'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    app.config['DATABASE_POOL_TIMEOUT'] = 30
+    app.config['DATABASE_POOL_RECYCLE'] = 30 * 60
+    # Send read-only routes to a separate pool (DATABASE_READ_URL or the primary database)
+    app.config['DATABASE_READ_POOL'] = os.environ.get('DATABASE_READ_POOL') == '1'
+    database.configure(app)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'your_super_secret_key')
 
     UPLOAD_FOLDER = os.path.join(app.root_path, 'uploads')
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
     app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
+    app.config['RECIPES_PAGE_SIZE'] = 24
+    app.config['RECIPES_MAX_PAGE_SIZE'] = 100
+    # Largest POST /api/recipes/batch request; one IN-list chunk keeps it to a fixed statement count
+    app.config['RECIPES_BATCH_MAX'] = 500
+    # POST /api/recipes/import lets any logged-in user create recipes for any creator,
+    # so it is only meant for seeding environments
+    app.config['RECIPES_IMPORT_ENABLED'] = os.environ.get('RECIPES_IMPORT_ENABLED') == '1'
+    # max-age for recipe read responses; 0 makes caches revalidate every time
+    app.config['RECIPES_CACHE_MAX_AGE'] = 0
+    # Buffer like-count increments in memory and flush them in batches.
+    # Either way, list pages see like counts at most one flush interval late.
+    app.config['LIKE_COUNTER_WRITE_BEHIND'] = os.environ.get('LIKE_COUNTER_WRITE_BEHIND') == '1'
+    app.config['LIKE_COUNTER_FLUSH_INTERVAL'] = 1.0
+    # Response cache for recipe reads: 'local' (per process), 'redis' (shared) or 'none'
+    app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'local')
+    app.config['RESPONSE_CACHE_REDIS_URL'] = os.environ.get('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    app.config['RESPONSE_CACHE_TTL'] = 60
+    # Widths of the resized variants generated for every uploaded image
+    app.config['IMAGE_VARIANT_WIDTHS'] = (320, 640, 1280)
+    app.config['IMAGE_WORKERS'] = 2
+    # Chunked uploads: partial files live outside the served upload folder
+    app.config['UPLOAD_PARTIAL_FOLDER'] = os.path.join(app.instance_path, 'partial_uploads')
+    app.config['UPLOAD_MAX_SIZE'] = 16 * 1024 * 1024
+    app.config['UPLOAD_CHUNK_SIZE'] = 1024 * 1024
+    app.config['UPLOAD_SESSION_TTL'] = 24 * 60 * 60
+    # Trending feed: score decay and how often every score is refreshed (0 disables)
+    app.config['TRENDING_GRAVITY'] = 1.8
+    app.config['TRENDING_RESCORE_INTERVAL'] = 300
+    app.config['TRENDING_BATCH_SIZE'] = 500
+    # Recipe change log behind GET /api/recipes/changes: entries per response, how long
+    # entries are kept (clients further behind must reload), how often it is compacted
+    # and, on PostgreSQL, how often committed entries are settled into it
+    app.config['RECIPE_CHANGES_PAGE_SIZE'] = 500
+    app.config['RECIPE_CHANGES_RETENTION'] = 7 * 24 * 60 * 60
+    app.config['RECIPE_CHANGES_COMPACT_INTERVAL'] = 60 * 60
+    app.config['RECIPE_CHANGES_SETTLE_INTERVAL'] = 0.5
+    # "Similar recipes" MinHash/LSH index: signature bands x rows, and the largest k per request
+    app.config['SIMILAR_BANDS'] = 24
+    app.config['SIMILAR_ROWS'] = 3
+    app.config['SIMILAR_MAX_K'] = 50
+    # Live updates: GET /api/recipes/stream redirects to a server-sent event stream served
+    # by an asyncio server on RECIPE_STREAM_HOST:RECIPE_STREAM_PORT. Outside debug mode,
+    # set RECIPE_STREAM_URL to the public URL a proxy routes to that server (e.g.
+    # https://example.com/api/recipes/stream); without it the route answers 503. The
+    # 'local' broker only sees this process's changes; with several workers use
+    # 'changelog', which also polls the recipe change log.
+    app.config['RECIPE_STREAM_ENABLED'] = os.environ.get('RECIPE_STREAM_ENABLED', '1') == '1'
+    app.config['RECIPE_STREAM_HOST'] = os.environ.get('RECIPE_STREAM_HOST', '127.0.0.1')
+    app.config['RECIPE_STREAM_PORT'] = int(os.environ.get('RECIPE_STREAM_PORT', 5001))
+    app.config['RECIPE_STREAM_URL'] = os.environ.get('RECIPE_STREAM_URL')
+    app.config['RECIPE_STREAM_BROKER'] = os.environ.get('RECIPE_STREAM_BROKER', 'local')
+    app.config['RECIPE_STREAM_POLL_INTERVAL'] = 1.0
+    # At most one event per recipe per interval, carrying its latest state
+    app.config['RECIPE_STREAM_MIN_INTERVAL'] = 1.0
+    app.config['RECIPE_STREAM_HEARTBEAT'] = 15
+    app.config['RECIPE_STREAM_MAX_IDS'] = 500
+    app.config['RECIPE_STREAM_MAX_CONNECTIONS'] = 10000
+    # Password hashing: a complete Werkzeug method with its cost parameters (e.g.
+    # 'scrypt:32768:8:1'); hashes made with other parameters are upgraded at the next login.
+    # Hashes run on PASSWORD_HASH_WORKERS processes (0 = inline) with at most
+    # PASSWORD_HASH_MAX_QUEUE more waiting, and logins beyond that get a 503. Keep the sum
+    # well below the number of request threads so logins cannot occupy all of them.
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    app.config['PASSWORD_HASH_MAX_QUEUE'] = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 2))
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10
+    app.config['PASSWORD_HASH_NICE'] = 5
+    # Admission control: each endpoint belongs to a priority class (admission.ENDPOINT_CLASSES).
+    # A class runs at most `limit` requests at once, adapted between minimum and maximum to
+    # keep service time under `target` seconds; up to `queue` more wait at most `max_wait`
+    # seconds and the rest get a 503 with Retry-After. Critical endpoints are never limited.
+    # Waiting requests hold a server thread, so give the server more threads than that.
+    app.config['ADMISSION_ENABLED'] = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+    app.config['ADMISSION_CLASSES'] = {
+        'interactive': dict(initial=16, minimum=4, maximum=32, queue=32, max_wait=0.5, target=0.25),
+        'bulk': dict(initial=4, minimum=1, maximum=16, queue=8, max_wait=2.0, target=1.0),
+        'write': dict(initial=2, minimum=1, maximum=8, queue=8, max_wait=5.0, target=2.0),
+    }
+    # Per-user token buckets (tokens per second, burst) used by admission.rate_limited
+    app.config['RATE_LIMITS'] = {'toggle': (2.0, 20)}
+    # Fingerprinted, pre-compressed frontend assets are built here from FRONTEND_FOLDER
+    app.config['FRONTEND_FOLDER'] = os.path.join(app.root_path, '../frontend')
+    app.config['ASSETS_OUTPUT_FOLDER'] = os.path.join(app.instance_path, 'assets')
+    app.config['ASSETS_BUILD_ON_STARTUP'] = os.environ.get('ASSETS_BUILD_ON_STARTUP', '1') == '1'
+    # Request instrumentation: GET /metrics, Server-Timing headers, and warnings for
+    # routes running more than SQL_QUERY_BUDGET statements or taking SLOW_REQUEST_SECONDS
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+    app.config['SERVER_TIMING_HEADER'] = True
+    app.config['SQL_QUERY_BUDGET'] = 20
+    app.config['SLOW_REQUEST_SECONDS'] = 0.5
+    # 'orjson' (fast, needs the orjson package) or 'default' (Flask's standard json module)
+    app.config['JSON_PROVIDER'] = os.environ.get('JSON_PROVIDER', 'orjson')
+    # Per-recipe serialized JSON reused by list responses; 0 disables it
+    app.config['FRAGMENT_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
 
     db.init_app(app)
+    database.init_app(app)
+    instrumentation.init_app(app)
+    json_provider.init_app(app)
+    admission.init_app(app)
+    migrations.init_app(app)
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(recipe_bp, url_prefix='/api')
+    app.register_blueprint(upload_bp, url_prefix='/api/uploads')
 
     with app.app_context():
-        db.create_all()
-
-    # --- Recipe API Routes ---
-    @app.route('/api/recipes', methods=['GET'])
-    def get_all_recipes():
-        recipes = Recipe.query.all()
-        return jsonify([recipe.to_dict() for recipe in recipes])
-
-    @app.route('/api/recipes', methods=['POST'])
-    def add_recipe():
-        try:
-            user_id = session.get('user_id')
-            if not user_id:
-                return jsonify({'message': 'Unauthorized'}), 401
-
-            if 'image' not in request.files or request.files['image'].filename == '':
-                return jsonify({'message': 'No image file uploaded'}), 400
-
-            image_file = request.files['image']
-            if image_file and allowed_file(image_file.filename):
-                filename = secure_filename(image_file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                image_file.save(filepath)
-            else:
-                return jsonify({'message': 'Invalid file type'}), 400
-
-            data = request.form
-
-            # Defensive check for required fields in form data
-            required_fields = ['title', 'description', 'ingredients', 'instructions']
-            for field in required_fields:
-                if field not in data or not data.get(field).strip():
-                    return jsonify({'message': f'Missing required field: {field}'}), 400
-
-            new_recipe = Recipe(
-                title=data['title'],
-                description=data['description'],
-                ingredients=data['ingredients'],
-                instructions=data['instructions'],
-                creator_id=user_id,
-                image_filename=filename
-            )
-            db.session.add(new_recipe)
-            db.session.commit()
-            return jsonify({'message': 'Recipe added successfully!'}), 201
-
-        except Exception as e:
-            # Log the full traceback for debugging
-            import traceback
-            print("Exception in add_recipe:", e)
-            traceback.print_exc()
-            return jsonify({'message': 'Internal server error'}), 500
-
-
-    @app.route('/api/recipes/<int:recipe_id>', methods=['GET'])
-    def get_recipe(recipe_id):
-        recipe = Recipe.query.get_or_404(recipe_id)
-        return jsonify(recipe.to_dict())
-
-    @app.route('/api/recipes/<int:recipe_id>', methods=['PUT'])
-    def update_recipe(recipe_id):
-        user_id = session.get('user_id')
-        recipe = Recipe.query.get_or_404(recipe_id)
-
-        if not user_id or recipe.creator_id != user_id:
-            return jsonify({'message': 'Unauthorized to edit this recipe'}), 403
-
-        data = request.form
-
-        if 'image' in request.files and request.files['image'].filename != '':
-            image_file = request.files['image']
-            if image_file and allowed_file(image_file.filename):
-                if recipe.image_filename:
-                    old_filepath = os.path.join(app.config['UPLOAD_FOLDER'], recipe.image_filename)
-                    if os.path.exists(old_filepath):
-                        os.remove(old_filepath)
-                filename = secure_filename(image_file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                image_file.save(filepath)
-                recipe.image_filename = filename
-            else:
-                return jsonify({'message': 'Invalid file type for image update'}), 400
-
-        recipe.title = data.get('title', recipe.title)
-        recipe.description = data.get('description', recipe.description)
-        recipe.ingredients = data.get('ingredients', recipe.ingredients)
-        recipe.instructions = data.get('instructions', recipe.instructions)
-
-        db.session.commit()
-        return jsonify({'message': 'Recipe updated successfully!'}), 200
-
-    @app.route('/api/recipes/<int:recipe_id>', methods=['DELETE'])
-    def delete_recipe(recipe_id):
-        user_id = session.get('user_id')
-        recipe = Recipe.query.get_or_404(recipe_id)
-
-        if not user_id or recipe.creator_id != user_id:
-            return jsonify({'message': 'Unauthorized to delete this recipe'}), 403
-
-        if recipe.image_filename:
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], recipe.image_filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-
-        db.session.delete(recipe)
-        db.session.commit()
-        return jsonify({'message': 'Recipe deleted successfully!'}), 200
-
-    @app.route('/api/recipes/<int:recipe_id>/save', methods=['POST'])
-    def toggle_save_recipe(recipe_id):
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'message': 'Unauthorized'}), 401
-
-        user = User.query.get_or_404(user_id)
-        recipe = Recipe.query.get_or_404(recipe_id)
-
-        if recipe in user.saved_recipes:
-            user.saved_recipes.remove(recipe)
-            db.session.commit()
-            return jsonify({'message': 'Recipe unsaved.', 'saved': False}), 200
-        else:
-            user.saved_recipes.append(recipe)
-            db.session.commit()
-            return jsonify({'message': 'Recipe saved!', 'saved': True}), 200
-
-    @app.route('/api/recipes/<int:recipe_id>/like', methods=['POST'])
-    def toggle_like_recipe(recipe_id):
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'message': 'Unauthorized'}), 401
-
-        user = User.query.get_or_404(user_id)
-        recipe = Recipe.query.get_or_404(recipe_id)
-
-        if recipe in user.liked_recipes:
-            user.liked_recipes.remove(recipe)
-            recipe.likes = max(0, recipe.likes - 1)
-            db.session.commit()
-            return jsonify({'message': 'Recipe unliked.', 'liked': False, 'likes': recipe.likes}), 200
-        else:
-            user.liked_recipes.append(recipe)
-            recipe.likes += 1
-            db.session.commit()
-            return jsonify({'message': 'Recipe liked!', 'liked': True, 'likes': recipe.likes}), 200
-
-    @app.route('/api/my-saved-recipes', methods=['GET'])
-    def get_my_saved_recipes():
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'message': 'Unauthorized'}), 401
-
-        user = User.query.get_or_404(user_id)
-        saved_recipes = user.saved_recipes.all()
-        return jsonify([recipe.to_dict() for recipe in saved_recipes])
-
-    @app.route('/api/my-saved-recipes-status', methods=['GET'])
-    def get_my_saved_recipes_status():
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'savedRecipeIds': []}), 200
-
-        user = User.query.get_or_404(user_id)
-        saved_ids = [recipe.id for recipe in user.saved_recipes]
-        return jsonify({'savedRecipeIds': saved_ids}), 200
-
-    @app.route('/api/my-liked-recipes-status', methods=['GET'])
-    def get_my_liked_recipes_status():
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'likedRecipeIds': []}), 200
-
-        user = User.query.get_or_404(user_id)
-        liked_ids = [recipe.id for recipe in user.liked_recipes]
-        return jsonify({'likedRecipeIds': liked_ids}), 200
+        migrations.upgrade()
+    ingredients.init_app(app)
+    search.init_app(app)
+    counters.init_app(app)
+    trending.init_app(app)
+    changelog.init_app(app)
+    similar.init_app(app)
+    live.init_app(app)
+    passwords.init_app(app)
+    cache.init_app(app)
+    fragments.init_app(app)
+    images.init_app(app)
+    upload_routes.init_app(app)
+    bulk.init_app(app)
+    transfer.init_app(app)
+    assets.init_app(app)
+    health.init_app(app)
 
     @app.route('/api/hello')
     def hello():
@@ -219,19 +198,26 @@ def create_app():
 
     @app.route('/uploads/<path:filename>')
     def serve_uploaded_file(filename):
+        if filename.startswith(images.IMMUTABLE_PREFIXES):
+            # Content-addressed files never change under the same URL
+            response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=31536000)
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            return response
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-        
 
     # Route to serve the main index.html file for all non-API paths
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve(path):
-        if path != "" and os.path.exists(os.path.join(app.root_path, '../frontend', path)):
-            return send_from_directory(os.path.join(app.root_path, '../frontend'), path)
-        else:
-            return send_from_directory(os.path.join(app.root_path, '../frontend'), 'index.html')
-
-
+        response = assets.asset_response('/' + path if path else '')
+        if response is not None:
+            return response
+        if path.startswith('static/'):
+            return jsonify(message="Not found"), 404
+        return assets.asset_response('')
+
+    if background:
+        start_background_threads(app)
     return app
 
 
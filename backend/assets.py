@@ -0,0 +1,189 @@
+# assets.py
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import textwrap
+from collections import namedtuple
+
+import click
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip variants are built
+    brotli = None
+
+# Files under these extensions are fingerprinted and pre-compressed
+COMPRESSIBLE = ('.js', '.css', '.html', '.svg', '.json', '.txt')
+HASH_LENGTH = 12
+MANIFEST_NAME = 'manifest.json'
+# Hashed files never change under the same URL
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed URLs (index.html, original asset names) must be revalidated
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# One servable file: its bytes per content encoding ('identity', 'gzip',
+# 'br'), content type, ETag and whether it may be cached forever.
+Asset = namedtuple('Asset', ['bodies', 'mimetype', 'etag', 'immutable'])
+
+_STATIC_REF = re.compile(r'(?P<attr>(?:src|href)=")(?P<url>/static/[^"]+)(?P<end>")')
+
+
+def _fingerprinted(relative_path, digest):
+    root, ext = os.path.splitext(relative_path)
+    return f'{root}.{digest[:HASH_LENGTH]}{ext}'
+
+
+def _write_atomically(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _write_with_variants(out_dir, relative_path, data):
+    """
+    Writes a file plus its .gz and .br variants. Returns the encodings written.
+    """
+    path = os.path.join(out_dir, relative_path)
+    _write_atomically(path, data)
+    encodings = ['identity']
+    if relative_path.endswith(COMPRESSIBLE):
+        _write_atomically(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        encodings.append('gzip')
+        if brotli is not None:
+            _write_atomically(path + '.br', brotli.compress(data, quality=11))
+            encodings.append('br')
+    return encodings
+
+
+def _rewrite_index(html, urls):
+    """
+    Points index.html at the fingerprinted files and adds an import map, so
+    the modules' relative imports (e.g. './state.js') also resolve to the
+    fingerprinted names without rewriting the modules themselves.
+    """
+    html = _STATIC_REF.sub(lambda m: m.group('attr') + urls.get(m.group('url'), m.group('url')) + m.group('end'), html)
+    modules = {url: hashed for url, hashed in urls.items() if url.endswith('.js')}
+    import_map = textwrap.indent(json.dumps({'imports': modules}, indent=4, sort_keys=True), ' ' * 8)
+    tag = f'    <script type="importmap">\n{import_map}\n    </script>\n'
+    return html.replace('</head>', tag + '</head>', 1)
+
+
+def build_assets(frontend_dir, out_dir):
+    """
+    Fingerprints every file under frontend_dir/static, writes them with
+    gzip/brotli variants to out_dir, rewrites index.html to reference the
+    fingerprinted names and writes a manifest describing the result.
+    """
+    manifest = {'files': {}}
+    urls = {}
+    static_dir = os.path.join(frontend_dir, 'static')
+    for root, _, filenames in os.walk(static_dir):
+        for filename in sorted(filenames):
+            source = os.path.join(root, filename)
+            relative_path = os.path.relpath(source, frontend_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            hashed_path = _fingerprinted(relative_path, digest)
+            encodings = _write_with_variants(out_dir, hashed_path, data)
+            urls['/' + relative_path] = '/' + hashed_path
+            manifest['files']['/' + relative_path] = {'path': hashed_path, 'hash': digest, 'encodings': encodings}
+
+    with open(os.path.join(frontend_dir, 'index.html'), encoding='utf-8') as f:
+        index = _rewrite_index(f.read(), urls).encode('utf-8')
+    encodings = _write_with_variants(out_dir, 'index.html', index)
+    manifest['index'] = {'path': 'index.html', 'hash': hashlib.sha256(index).hexdigest(), 'encodings': encodings}
+
+    _write_atomically(os.path.join(out_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def _read_asset(out_dir, entry, immutable):
+    bodies = {}
+    suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+    for encoding in entry['encodings']:
+        with open(os.path.join(out_dir, entry['path'] + suffixes[encoding]), 'rb') as f:
+            bodies[encoding] = f.read()
+    mimetype = mimetypes.guess_type(entry['path'])[0] or 'application/octet-stream'
+    return Asset(bodies, mimetype, entry['hash'][:HASH_LENGTH], immutable)
+
+
+def load_manifest(out_dir):
+    """
+    Loads a built manifest into a {url path: Asset} lookup table. Each asset
+    is reachable under its fingerprinted URL (cached forever) and its
+    original URL (revalidated), and index.html under ''.
+    """
+    with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    table = {}
+    for url, entry in manifest['files'].items():
+        table['/' + entry['path']] = _read_asset(out_dir, entry, immutable=True)
+        table[url] = table['/' + entry['path']]._replace(immutable=False)
+    table[''] = _read_asset(out_dir, manifest['index'], immutable=False)
+    return table
+
+
+def _sources_newer_than(frontend_dir, path):
+    built_at = os.path.getmtime(path)
+    for root, _, filenames in os.walk(frontend_dir):
+        for filename in filenames:
+            if os.path.getmtime(os.path.join(root, filename)) > built_at:
+                return True
+    return False
+
+
+def _negotiate(asset):
+    """
+    Picks the best pre-compressed body the client accepts.
+    """
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.bodies and request.accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+
+def asset_response(url_path):
+    """
+    Builds the response for an asset URL ('' for index.html), or returns
+    None if the URL is not in the manifest.
+    """
+    asset = current_app.extensions['assets'].get(url_path)
+    if asset is None:
+        return None
+    encoding = _negotiate(asset)
+    response = current_app.response_class(asset.bodies[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+    response.set_etag(f'{asset.etag}-{encoding}')
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    """
+    Builds the assets when there is no manifest yet or, unless
+    ASSETS_BUILD_ON_STARTUP is off, when the sources are newer than it, then
+    loads the lookup table.
+    """
+    frontend_dir = app.config['FRONTEND_FOLDER']
+    out_dir = app.config['ASSETS_OUTPUT_FOLDER']
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint and pre-compress the frontend assets."""
+        manifest = build_assets(frontend_dir, out_dir)
+        click.echo(f"Built {len(manifest['files'])} assets into {out_dir}.")
+
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path) or (
+            app.config['ASSETS_BUILD_ON_STARTUP'] and _sources_newer_than(frontend_dir, manifest_path)):
+        build_assets(frontend_dir, out_dir)
+    app.extensions['assets'] = load_manifest(out_dir)
@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app
 from models import db, User
 from functools import wraps
+import passwords
 
 auth_bp = Blueprint('auth', __name__)
 
+@auth_bp.errorhandler(passwords.HashingBusy)
+def hashing_busy(e):
+    # Fail fast: the client retries instead of holding a request worker
+    current_app.extensions['metrics'].increment('recipe_app_password_hash_rejected_total', (('reason', e.reason),))
+    response = jsonify(message="The server is busy, please try again in a moment.")
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -24,8 +33,7 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify(message="User with that email already exists."), 409
 
-    new_user = User(email=email)
-    new_user.set_password(password)
+    new_user = User(email=email, password_hash=passwords.hash_password(password))
 
     db.session.add(new_user)
     db.session.commit()
@@ -40,9 +48,19 @@ def login():
     email = data.get('email')
     password = data.get('password')
 
+    if not email or not password:
+        return jsonify(message="Email and password are required."), 400
+
     user = User.query.filter_by(email=email).first()
 
-    if user and user.check_password(password):
+    if user and passwords.verify_password(user.password_hash, password):
+        if passwords.needs_rehash(user.password_hash):
+            # Upgrade hashes made with older parameters while the password is at hand
+            try:
+                user.password_hash = passwords.hash_password(password)
+                db.session.commit()
+            except passwords.HashingBusy:
+                db.session.rollback()
         session['user_id'] = user.id
         session['user_email'] = user.email
         return jsonify(message="Logged in successfully!", userId=user.id, userEmail=user.email), 200
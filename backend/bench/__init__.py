@@ -0,0 +1,27 @@
+# bench/__init__.py
+"""
+Load-testing and regression benchmarks for the recipe API.
+
+Run from the backend directory against a scratch database, never the real
+instance/recipe_app.db:
+
+    python -m bench generate --db /tmp/bench.db --users 2000 --recipes 20000
+    python -m bench run --db /tmp/bench.db --mode inprocess --concurrency 8 \\
+        --requests 5000 --out /tmp/run.json
+    python -m bench run --db /tmp/bench.db --baseline bench-baseline.json
+    python -m bench similar --db /tmp/bench.db --queries 200 -k 10
+    python -m bench auth --db /tmp/bench.db --workers 8 --login-clients 16
+    python -m bench startup --db /tmp/bench.db --workers 4
+
+`generate` builds a deterministic data set (datagen.py), `run` replays a
+weighted endpoint mix against create_app() in-process or over a local WSGI
+server (driver.py) and reports latency percentiles, throughput, SQL
+statements per request and peak RSS, optionally compared with a saved JSON
+baseline (report.py). `similar` measures the recall and latency of the
+similar-recipes index against brute force (similar.py). `auth` measures
+read latency alone and during a login storm, with login throughput and
+503 rate, on a server limited to a fixed number of workers (auth.py).
+`startup` starts serve.py and reports the time until it is ready, the
+first-request latency, the parent's and each worker's RSS, PSS and unique
+memory (Linux only), and failed requests during a HUP reload (startup.py).
+"""
@@ -0,0 +1,126 @@
+# bench/__main__.py
+import os
+import sys
+
+import click
+
+
+def _create_app(db_path):
+    # Point the app at the scratch database before it is created
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(db_path)
+    os.environ.setdefault('ASSETS_BUILD_ON_STARTUP', '0')
+    from app import create_app
+    app = create_app()
+    # The periodic rescore would add noise to the measurements
+    rescorer = app.extensions.get('trending_rescorer')
+    if rescorer is not None:
+        rescorer.stop()
+    return app
+
+
+@click.group()
+def cli():
+    """Benchmarks for the recipe API."""
+
+
+@cli.command()
+@click.option('--db', 'db_path', required=True, help='Scratch SQLite file to fill.')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--recipes', default=10000, show_default=True)
+@click.option('--likes-per-user', default=20, show_default=True)
+@click.option('--saves-per-user', default=5, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+def generate(db_path, users, recipes, likes_per_user, saves_per_user, seed):
+    """Generate a deterministic data set."""
+    from .datagen import generate as generate_data
+    app = _create_app(db_path)
+    with app.app_context():
+        summary = generate_data(users, recipes, likes_per_user, saves_per_user, seed)
+    click.echo(', '.join(f'{key}={value}' for key, value in summary.items()))
+
+
+@cli.command()
+@click.option('--db', 'db_path', required=True, help='SQLite file filled by `generate`.')
+@click.option('--mode', type=click.Choice(['inprocess', 'wsgi']), default='inprocess', show_default=True)
+@click.option('--concurrency', default=4, show_default=True)
+@click.option('--requests', default=2000, show_default=True)
+@click.option('--warmup', default=200, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+@click.option('--out', type=click.Path(dir_okay=False), help='Write the report as JSON (e.g. a new baseline).')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Compare with a saved report.')
+@click.option('--threshold', default=0.10, show_default=True, help='Allowed regression, as a fraction.')
+def run(db_path, mode, concurrency, requests, warmup, seed, out, baseline, threshold):
+    """Replay the endpoint mix and report latency, throughput, SQL and RSS."""
+    from . import driver, report as reports
+    app = _create_app(db_path)
+    samples, elapsed = driver.run(app, mode=mode, concurrency=concurrency, requests=requests, warmup=warmup, seed=seed)
+    settings = {'mode': mode, 'concurrency': concurrency, 'requests': requests, 'warmup': warmup, 'seed': seed}
+    report = reports.build_report(samples, elapsed, settings)
+    click.echo(reports.format_table(report))
+    if out:
+        reports.save(report, out)
+    if baseline:
+        regressions = reports.compare(report, reports.load(baseline), threshold)
+        for regression in regressions:
+            click.echo(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        click.echo(f'No regressions beyond {threshold:.0%} of {baseline}.')
+
+
+@cli.command('similar')
+@click.option('--db', 'db_path', required=True, help='SQLite file filled by `generate`.')
+@click.option('--queries', default=200, show_default=True)
+@click.option('-k', default=10, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+def similar_command(db_path, queries, k, seed):
+    """Compare the similar-recipes index with brute force: recall and latency."""
+    from .similar import evaluate
+    app = _create_app(db_path)
+    with app.app_context():
+        result = evaluate(queries, k, seed)
+    click.echo(', '.join(f'{key}={value}' for key, value in result.items()))
+
+
+@cli.command('auth')
+@click.option('--db', 'db_path', required=True, help='SQLite file filled by `generate`.')
+@click.option('--workers', default=8, show_default=True, help='Requests the server runs at once, like sync workers.')
+@click.option('--login-clients', default=16, show_default=True)
+@click.option('--read-clients', default=4, show_default=True)
+@click.option('--duration', default=10.0, show_default=True, help='Seconds per phase.')
+@click.option('--hash-workers', type=int, help='Overrides PASSWORD_HASH_WORKERS; 0 hashes inline.')
+@click.option('--hash-max-queue', type=int, help='Overrides PASSWORD_HASH_MAX_QUEUE.')
+@click.option('--hash-method', help='Overrides PASSWORD_HASH_METHOD; the generated users are rehashed as they log in.')
+@click.option('--seed', default=1, show_default=True)
+def auth_command(db_path, workers, login_clients, read_clients, duration, hash_workers, hash_max_queue, hash_method, seed):
+    """Measure login throughput and read latency under a login storm."""
+    from .auth import evaluate
+    if hash_workers is not None:
+        os.environ['PASSWORD_HASH_WORKERS'] = str(hash_workers)
+    if hash_max_queue is not None:
+        os.environ['PASSWORD_HASH_MAX_QUEUE'] = str(hash_max_queue)
+    if hash_method:
+        os.environ['PASSWORD_HASH_METHOD'] = hash_method
+    app = _create_app(db_path)
+    result = evaluate(app, workers, login_clients, read_clients, duration, seed)
+    click.echo(', '.join(f'{key}={value}' for key, value in result.items()))
+
+
+@cli.command('startup')
+@click.option('--db', 'db_path', required=True, help='SQLite file filled by `generate`.')
+@click.option('--workers', default=2, show_default=True, help='Worker processes of serve.py.')
+@click.option('--threads', default=8, show_default=True, help='Request threads per worker.')
+@click.option('--clients', default=4, show_default=True)
+@click.option('--requests', default=2000, show_default=True, help='Reads before the second memory sample.')
+@click.option('--warm-up/--no-warm-up', default=True, show_default=True)
+@click.option('--reload/--no-reload', default=True, show_default=True, help='Also measure a HUP reload under load.')
+@click.option('--seed', default=1, show_default=True)
+def startup_command(db_path, workers, threads, clients, requests, warm_up, reload, seed):
+    """Measure serve.py startup time, memory per worker and reloads."""
+    from .startup import evaluate
+    result = evaluate(db_path, workers, threads, clients, requests, warm_up, reload, seed)
+    click.echo(', '.join(f'{key}={value}' for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,98 @@
+# bench/auth.py
+import random
+import threading
+import time
+
+from .driver import HTTPClient, LocalServer, load_context
+from .report import percentile
+
+# Anonymous reads that must stay fast while logins are hashing
+_READ_PATHS = (
+    lambda rng, ctx: '/api/recipes?limit=24',
+    lambda rng, ctx: '/api/recipes/trending?limit=24',
+    lambda rng, ctx: f"/api/recipes/{rng.choice(ctx['recipe_ids'])}",
+)
+
+
+def _reader(server, context, seed, deadline, latencies, lock):
+    rng = random.Random(seed)
+    client = HTTPClient(server.host, server.port)
+    local = []
+    while time.perf_counter() < deadline:
+        path = rng.choice(_READ_PATHS)(rng, context)
+        started = time.perf_counter()
+        client.request('GET', path)
+        local.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local)
+
+
+def _login_client(server, context, seed, deadline, outcomes, lock):
+    rng = random.Random(seed)
+    client = HTTPClient(server.host, server.port)
+    local = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status = client.login(rng.choice(context['emails']))
+        local.append((status, time.perf_counter() - started))
+    with lock:
+        outcomes.extend(local)
+
+
+def _phase(server, context, login_clients, read_clients, duration, seed):
+    latencies, outcomes = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_reader, args=(server, context, seed + i, deadline, latencies, lock))
+        for i in range(read_clients)
+    ] + [
+        threading.Thread(target=_login_client, args=(server, context, seed + 1000 + i, deadline, outcomes, lock))
+        for i in range(login_clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), outcomes
+
+
+def evaluate(app, workers=8, login_clients=16, read_clients=4, duration=10.0, seed=1):
+    """
+    Measures read latency alone, then again while `login_clients` threads
+    log in as fast as they can, on a local server that runs at most
+    `workers` requests at once. Reports read percentiles for both phases
+    and the login throughput, latency and 503 rate of the mixed phase.
+    """
+    context = load_context(app, seed=seed)
+    with LocalServer(app, workers) as server:
+        # Starts the hashing pool outside the measurement
+        HTTPClient(server.host, server.port).login(context['emails'][0])
+        alone, _ = _phase(server, context, 0, read_clients, duration, seed)
+        mixed, outcomes = _phase(server, context, login_clients, read_clients, duration, seed)
+
+    accepted = sorted(seconds for status, seconds in outcomes if status == 200)
+    rejected = sorted(seconds for status, seconds in outcomes if status == 503)
+    result = {
+        'workers': workers,
+        'hash_workers': app.config['PASSWORD_HASH_WORKERS'],
+        'hash_max_queue': app.config['PASSWORD_HASH_MAX_QUEUE'],
+        'hash_method': app.config['PASSWORD_HASH_METHOD'],
+        'logins_ok_per_second': round(len(accepted) / duration, 1),
+        'logins_rejected_per_second': round(len(rejected) / duration, 1),
+        'login_errors': len(outcomes) - len(accepted) - len(rejected),
+        'login_p50_ms': None,
+        'login_p95_ms': None,
+        'rejected_p50_ms': None,
+    }
+    if accepted:
+        result['login_p50_ms'] = round(percentile(accepted, 0.50) * 1000, 1)
+        result['login_p95_ms'] = round(percentile(accepted, 0.95) * 1000, 1)
+    if rejected:
+        result['rejected_p50_ms'] = round(percentile(rejected, 0.50) * 1000, 1)
+    for name, latencies in (('alone', alone), ('mixed', mixed)):
+        result[f'reads_{name}_per_second'] = round(len(latencies) / duration, 1)
+        for label, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            value = percentile(latencies, fraction)
+            result[f'read_{name}_{label}_ms'] = round(value * 1000, 1) if value is not None else None
+    return result
@@ -0,0 +1,108 @@
+# bench/datagen.py
+import datetime
+import itertools
+import json
+import random
+
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Recipe, user_liked_recipes, user_saved_recipes, insert_ignore, chunked
+from counters import recount_likes
+import transfer
+import trending
+
+# Every generated user can log in with this password
+PASSWORD = 'bench-password'
+
+_WORDS = (
+    'salt pepper egg flour sugar butter milk cream garlic onion shallot tomato basil oregano thyme rosemary '
+    'rice pasta noodles chicken beef pork tofu salmon shrimp lemon lime ginger chili cumin paprika yogurt '
+    'cheese spinach kale carrot potato mushroom honey vinegar soy sesame coconut almond oats apple berry'
+).split()
+_DISHES = 'soup stew salad curry pie cake bread tart risotto bowl roast stir-fry casserole pancakes'.split()
+
+
+def user_email(index):
+    return f'bench{index}@example.com'
+
+
+def _zipf_weights(count, exponent):
+    # Popularity falls off with rank, as it does for real recipes and authors
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def recipe_lines(rng, recipes, users, days=90):
+    """
+    Yields NDJSON recipe lines for transfer.import_recipes. A few prolific
+    users write most recipes; creation times spread over the last `days`.
+    """
+    now = datetime.datetime.utcnow()
+    author_weights = list(itertools.accumulate(_zipf_weights(users, 1.1)))
+    for index in range(recipes):
+        author = rng.choices(range(users), cum_weights=author_weights)[0]
+        ingredients = rng.sample(_WORDS, rng.randint(3, 10))
+        title = f'{rng.choice(_WORDS).title()} {rng.choice(_DISHES)} {index}'
+        yield json.dumps({
+            'title': title,
+            'description': ' '.join(rng.choices(_WORDS, k=rng.randint(5, 25))),
+            'ingredients': ', '.join(ingredients),
+            'instructions': ' '.join(rng.choices(_WORDS, k=rng.randint(20, 120))),
+            'created_at': (now - datetime.timedelta(seconds=rng.uniform(0, days * 86400))).isoformat(),
+            'creatorEmail': user_email(author),
+        }) + '\n'
+
+
+def _interactions(rng, user_ids, recipe_ids, mean_per_user, exponent):
+    """
+    Yields (user_id, recipe_id) pairs: each user interacts with a
+    geometrically distributed number of recipes, picked with Zipf weights so
+    a few recipes collect most interactions.
+    """
+    cum_weights = list(itertools.accumulate(_zipf_weights(len(recipe_ids), exponent)))
+    popularity = recipe_ids[:]
+    rng.shuffle(popularity)
+    for user_id in user_ids:
+        count = min(len(recipe_ids), int(rng.expovariate(1.0 / mean_per_user)))
+        for recipe_id in set(rng.choices(popularity, cum_weights=cum_weights, k=count)):
+            yield {'user_id': user_id, 'recipe_id': recipe_id}
+
+
+def _insert_pairs(table, pairs, batch_size=5000):
+    batch = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            db.session.execute(insert_ignore(table), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert_ignore(table), batch)
+    db.session.commit()
+    return db.session.query(table).count()
+
+
+def generate(users=1000, recipes=10000, likes_per_user=20, saves_per_user=5, seed=42):
+    """
+    Fills the current app's database with a deterministic data set: the same
+    arguments always produce the same users, recipes, likes and saves.
+    Must run inside an app context. Returns a summary dict.
+    """
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(PASSWORD)
+    for chunk in chunked(range(users), 5000):
+        db.session.execute(
+            insert_ignore(User.__table__),
+            [{'email': user_email(i), 'password_hash': password_hash, 'state_version': 0} for i in chunk]
+        )
+    db.session.commit()
+
+    report = transfer.import_recipes(recipe_lines(rng, recipes, users))
+    if report.failed:
+        raise RuntimeError(f'{report.failed} generated recipes failed to import: {report.errors[:3]}')
+
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    recipe_ids = [row[0] for row in db.session.query(Recipe.id).order_by(Recipe.id)]
+    likes = _insert_pairs(user_liked_recipes, _interactions(rng, user_ids, recipe_ids, likes_per_user, 1.0))
+    saves = _insert_pairs(user_saved_recipes, _interactions(rng, user_ids, recipe_ids, saves_per_user, 0.8))
+    recount_likes()
+    trending.rescore_all()
+    return {'users': len(user_ids), 'recipes': len(recipe_ids), 'likes': likes, 'saves': saves, 'seed': seed}
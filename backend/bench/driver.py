@@ -0,0 +1,211 @@
+# bench/driver.py
+import http.client
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from http.cookies import SimpleCookie
+
+from werkzeug.serving import make_server
+
+from models import db, User, Recipe
+import instrumentation
+from .datagen import PASSWORD
+
+# One request of the mix; `path(rng, context)` builds the URL. Every client
+# is logged in, so anonymous and personal endpoints can share a mix.
+Endpoint = namedtuple('Endpoint', ['name', 'weight', 'method', 'path'])
+
+# One measured request
+Sample = namedtuple('Sample', ['endpoint', 'seconds', 'status', 'statements'])
+
+_SEARCH_TERMS = ('chicken', 'soup', 'garlic', 'lemon cake', 'rice bowl', 'cheese', 'spicy curry', 'tom')
+
+# The default mix approximates production traffic: mostly feed and detail
+# reads, some search, and a steady share of like/save toggles.
+DEFAULT_MIX = (
+    Endpoint('feed_recent', 25, 'GET', lambda rng, ctx: '/api/recipes?limit=24'),
+    Endpoint('feed_recent_deep', 5, 'GET', lambda rng, ctx: f"/api/recipes?limit=24&cursor={rng.choice(ctx['cursors'])}"),
+    Endpoint('feed_likes', 10, 'GET', lambda rng, ctx: '/api/recipes?sort=likes&limit=24'),
+    Endpoint('feed_trending', 10, 'GET', lambda rng, ctx: '/api/recipes/trending?limit=24'),
+    Endpoint('recipe_detail', 20, 'GET', lambda rng, ctx: f"/api/recipes/{rng.choice(ctx['recipe_ids'])}"),
+    Endpoint('search', 8, 'GET', lambda rng, ctx: f"/api/recipes/search?q={rng.choice(_SEARCH_TERMS).replace(' ', '+')}"),
+    Endpoint('by_ingredients', 4, 'GET', lambda rng, ctx: '/api/recipes/by-ingredients?all=garlic,onion&none=pork'),
+    Endpoint('recipe_state', 6, 'GET', lambda rng, ctx: '/api/me/recipe-state?encoding=ranges'),
+    Endpoint('toggle_like', 8, 'POST', lambda rng, ctx: f"/api/recipes/{rng.choice(ctx['recipe_ids'])}/like"),
+    Endpoint('toggle_save', 4, 'POST', lambda rng, ctx: f"/api/recipes/{rng.choice(ctx['recipe_ids'])}/save"),
+)
+
+STATEMENTS_HEADER = 'X-Bench-SQL-Statements'
+
+
+def install_statement_counter(app):
+    """
+    Returns each request's SQL statement count (from instrumentation.py) in
+    a response header, so both in-process and HTTP clients can read it.
+    """
+    @app.after_request
+    def report_statements(response):
+        stats = instrumentation.current_stats()
+        response.headers[STATEMENTS_HEADER] = str(stats.sql_count if stats else 0)
+        return response
+
+
+def load_context(app, sample_size=2000, seed=0):
+    """
+    Picks the ids, users and deep-page cursors the mix draws from.
+    """
+    rng = random.Random(seed)
+    with app.app_context():
+        recipe_ids = [row[0] for row in db.session.query(Recipe.id).order_by(Recipe.id)]
+        emails = [row[0] for row in db.session.query(User.email).filter(User.email.like('bench%')).order_by(User.id)]
+        client = app.test_client()
+        cursors = []
+        path = '/api/recipes?limit=100&fields=id'
+        while len(cursors) < 20:
+            page = client.get(path).get_json()
+            if not page.get('next_cursor'):
+                break
+            cursors.append(page['next_cursor'])
+            path = f"/api/recipes?limit=100&fields=id&cursor={page['next_cursor']}"
+    if not recipe_ids or not emails:
+        raise RuntimeError('The benchmark database is empty; run `python -m bench generate` first.')
+    return {
+        'recipe_ids': rng.sample(recipe_ids, min(sample_size, len(recipe_ids))),
+        'emails': emails,
+        'cursors': cursors or [''],
+    }
+
+
+class InProcessClient:
+    """
+    Calls the app through Flask's test client, without any network hop.
+    """
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def login(self, email):
+        self._client.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+
+    def request(self, method, path):
+        response = self._client.open(path, method=method)
+        return response.status_code, int(response.headers.get(STATEMENTS_HEADER, 0))
+
+
+class HTTPClient:
+    """
+    Calls a local WSGI server over a keep-alive HTTP connection.
+    """
+
+    def __init__(self, host, port):
+        self._connection = http.client.HTTPConnection(host, port, timeout=30)
+        self._cookie = None
+
+    def login(self, email):
+        status, _, response = self._send('POST', '/api/auth/login', json.dumps({'email': email, 'password': PASSWORD}))
+        cookie = SimpleCookie(response.getheader('Set-Cookie') or '')
+        if 'session' in cookie:
+            self._cookie = f"session={cookie['session'].value}"
+        return status
+
+    def _send(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body else {}
+        if self._cookie:
+            headers['Cookie'] = self._cookie
+        self._connection.request(method, path, body=body, headers=headers)
+        response = self._connection.getresponse()
+        response.read()
+        return response.status, int(response.getheader(STATEMENTS_HEADER) or 0), response
+
+    def request(self, method, path):
+        status, statements, _ = self._send(method, path)
+        return status, statements
+
+
+class WorkerLimit:
+    """
+    WSGI middleware letting at most `workers` requests run at once, like a
+    server with a fixed number of synchronous workers; others wait.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self._slots = threading.Semaphore(workers)
+
+    def __call__(self, environ, start_response):
+        with self._slots:
+            return list(self.app(environ, start_response))
+
+
+class LocalServer:
+    """
+    Runs the app on a threaded werkzeug server on an ephemeral port,
+    optionally limited to `workers` concurrent requests.
+    """
+
+    def __init__(self, app, workers=None):
+        if workers:
+            app = WorkerLimit(app, workers)
+        self._server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.host, self.port = '127.0.0.1', self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bench-server', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+
+
+def _worker(make_client, mix, context, seed, count, samples, lock):
+    rng = random.Random(seed)
+    client = make_client()
+    client.login(rng.choice(context['emails']))
+    weights = [endpoint.weight for endpoint in mix]
+    local = []
+    for _ in range(count):
+        endpoint = rng.choices(mix, weights=weights)[0]
+        path = endpoint.path(rng, context)
+        started = time.perf_counter()
+        status, statements = client.request(endpoint.method, path)
+        local.append(Sample(endpoint.name, time.perf_counter() - started, status, statements))
+    with lock:
+        samples.extend(local)
+
+
+def run(app, mode='inprocess', concurrency=4, requests=2000, warmup=200, mix=DEFAULT_MIX, seed=1):
+    """
+    Replays `requests` requests of the weighted `mix` from `concurrency`
+    threads, each logged in as a generated user, after `warmup` unmeasured
+    requests. `mode` is 'inprocess' (test client) or 'wsgi' (local HTTP
+    server). Returns (samples, elapsed seconds).
+    """
+    install_statement_counter(app)
+    context = load_context(app, seed=seed)
+
+    def execute(make_client):
+        if warmup:
+            _worker(make_client, mix, context, seed, warmup, [], threading.Lock())
+        samples = []
+        lock = threading.Lock()
+        per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        threads = [
+            threading.Thread(target=_worker, args=(make_client, mix, context, seed + 1 + i, n, samples, lock))
+            for i, n in enumerate(per_thread)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    if mode == 'inprocess':
+        return execute(lambda: InProcessClient(app))
+    if mode == 'wsgi':
+        with LocalServer(app) as server:
+            return execute(lambda: HTTPClient(server.host, server.port))
+    raise ValueError(f'Unknown mode: {mode}')
@@ -0,0 +1,119 @@
+# bench/report.py
+import datetime
+import json
+import math
+import platform
+import resource
+import sys
+
+# A metric regresses when it is worse than the baseline by more than the
+# threshold (a fraction, e.g. 0.10 for 10%). Latencies below this many
+# milliseconds are treated as this value, so noise on very fast endpoints
+# does not count as a regression.
+LATENCY_FLOOR_MS = 1.0
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _summarize(samples, elapsed):
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    statements = [sample.statements for sample in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample.status >= 500),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'sql_per_request': round(sum(statements) / len(statements), 2),
+        'sql_max': max(statements),
+    }
+
+
+def build_report(samples, elapsed, settings):
+    """
+    Aggregates samples overall and per endpoint.
+    """
+    endpoints = {}
+    for sample in samples:
+        endpoints.setdefault(sample.endpoint, []).append(sample)
+    return {
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'settings': settings,
+        'elapsed_seconds': round(elapsed, 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'overall': _summarize(samples, elapsed),
+        'endpoints': {name: _summarize(group, elapsed) for name, group in sorted(endpoints.items())},
+    }
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(report, baseline, threshold=0.10):
+    """
+    Returns a list of regression messages: higher p50/p95/p99 latency, more
+    SQL statements per request, lower throughput or higher peak RSS than the
+    baseline, by more than `threshold`.
+    """
+    regressions = []
+
+    def worse(name, metric, current, previous, higher_is_worse=True, floor=0.0):
+        if current is None or previous is None:
+            return
+        current, previous = max(current, floor), max(previous, floor)
+        if higher_is_worse and current > previous * (1 + threshold):
+            regressions.append(f'{name}: {metric} {previous} -> {current}')
+        if not higher_is_worse and current < previous * (1 - threshold):
+            regressions.append(f'{name}: {metric} {previous} -> {current}')
+
+    groups = [('overall', report['overall'], baseline['overall'])]
+    groups += [(name, stats, baseline['endpoints'][name])
+               for name, stats in report['endpoints'].items() if name in baseline['endpoints']]
+    for name, current, previous in groups:
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            worse(name, metric, current[metric], previous[metric], floor=LATENCY_FLOOR_MS)
+        # Statement counts only move with cache hit rates, so they get the
+        # threshold plus half a statement of slack instead of the latency floor
+        if current['sql_per_request'] > previous['sql_per_request'] * (1 + threshold) + 0.5:
+            regressions.append(f"{name}: sql_per_request {previous['sql_per_request']} -> {current['sql_per_request']}")
+    worse('overall', 'throughput_rps', report['overall']['throughput_rps'], baseline['overall']['throughput_rps'],
+          higher_is_worse=False)
+    worse('process', 'peak_rss_mb', report['peak_rss_mb'], baseline['peak_rss_mb'])
+    return regressions
+
+
+def format_table(report):
+    """
+    Renders a report as a fixed-width text table.
+    """
+    columns = ('requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'sql_per_request', 'throughput_rps')
+    header = f"{'endpoint':<20}" + ''.join(f'{column:>16}' for column in columns)
+    lines = [header, '-' * len(header)]
+    rows = list(report['endpoints'].items()) + [('overall', report['overall'])]
+    for name, stats in rows:
+        lines.append(f'{name:<20}' + ''.join(f'{str(stats[column]):>16}' for column in columns))
+    lines.append(f"peak RSS {report['peak_rss_mb']} MB, {report['elapsed_seconds']}s")
+    return '\n'.join(lines)
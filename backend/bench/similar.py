@@ -0,0 +1,76 @@
+# bench/similar.py
+import random
+import time
+
+from flask import current_app
+
+from models import db, RecipeIngredient
+import similar
+from .report import percentile
+
+
+def _ingredient_sets():
+    sets = {}
+    for recipe_id, ingredient_id in db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id):
+        sets.setdefault(recipe_id, set()).add(ingredient_id)
+    return sets
+
+
+def brute_force(sets, recipe_id, k):
+    """
+    Exact top-k by Jaccard similarity against every other recipe, with the
+    same ordering as SimilarityIndex.query.
+    """
+    target = sets[recipe_id]
+    scored = []
+    for other_id, other in sets.items():
+        if other_id == recipe_id:
+            continue
+        shared = len(target & other)
+        if shared:
+            scored.append((shared / (len(target) + len(other) - shared), other_id))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(other_id, score) for score, other_id in scored[:k]]
+
+
+def evaluate(queries=200, k=10, seed=1):
+    """
+    Compares the LSH index with brute force on `queries` random recipes.
+    Recall counts a returned recipe as correct when its similarity is at
+    least the exact k-th best, so ties at the cut-off are not penalized.
+    Must run inside an app context.
+    """
+    index = current_app.extensions['similar_index']
+    started = time.perf_counter()
+    index.refresh()
+    build_seconds = time.perf_counter() - started
+
+    sets = _ingredient_sets()
+    sample = random.Random(seed).sample(sorted(sets), min(queries, len(sets)))
+    index_ms, brute_ms, recalls = [], [], []
+    for recipe_id in sample:
+        started = time.perf_counter()
+        found = similar.similar_recipes(recipe_id, k)
+        index_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        exact = brute_force(sets, recipe_id, k)
+        brute_ms.append((time.perf_counter() - started) * 1000)
+
+        if exact:
+            cutoff = exact[-1][1]
+            recalls.append(sum(1 for _, score in found if score >= cutoff - 1e-9) / len(exact))
+
+    index_ms.sort()
+    brute_ms.sort()
+    return {
+        'recipes': len(sets),
+        'queries': len(sample),
+        'k': k,
+        'build_seconds': round(build_seconds, 2),
+        'recall': round(sum(recalls) / len(recalls), 4) if recalls else None,
+        'index_p50_ms': round(percentile(index_ms, 0.50), 3),
+        'index_p95_ms': round(percentile(index_ms, 0.95), 3),
+        'brute_p50_ms': round(percentile(brute_ms, 0.50), 3),
+        'brute_p95_ms': round(percentile(brute_ms, 0.95), 3),
+    }
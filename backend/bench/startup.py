@@ -0,0 +1,197 @@
+# bench/startup.py
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .driver import HTTPClient
+from .report import percentile
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Anonymous reads, with the routes that warm-up covers
+_READ_PATHS = (
+    lambda rng, ids: '/api/recipes?limit=24',
+    lambda rng, ids: '/api/recipes?sort=likes&limit=24',
+    lambda rng, ids: '/api/recipes/trending?limit=24',
+    lambda rng, ids: f'/api/recipes/{rng.choice(ids)}',
+    lambda rng, ids: f'/api/recipes/{rng.choice(ids)}/similar',
+    lambda rng, ids: '/api/recipes/search?q=chicken',
+)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces; fields resume after ')'
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == pid:
+                children.append(int(entry))
+    return sorted(children)
+
+
+def memory_mb(pid):
+    """
+    Resident memory of a process in MiB from /proc/<pid>/smaps_rollup
+    (Linux only): `rss` counts shared pages in full, `pss` divides them
+    among the processes sharing them, and `uss` is memory only this process
+    uses, i.e. what another worker would add.
+    """
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': round(fields['Rss'] / 1024, 1),
+        'pss': round(fields['Pss'] / 1024, 1),
+        'uss': round((fields['Private_Clean'] + fields['Private_Dirty']) / 1024, 1),
+    }
+
+
+def _workers_memory(master, workers):
+    samples = [memory_mb(pid) for pid in _children(master)[:workers]]
+    return {key: round(sum(sample[key] for sample in samples) / len(samples), 1) for key in ('rss', 'pss', 'uss')}
+
+
+def _wait_ready(port, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            status, _ = HTTPClient('127.0.0.1', port).request('GET', '/healthz/ready')
+            if status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def _reader(port, ids, seed, stop, count, latencies, outcomes, lock):
+    """
+    Reads until `stop` is set or `count` requests are done. A request on a
+    keep-alive connection the server closed is retried once on a new
+    connection, as HTTP clients do for idempotent requests.
+    """
+    rng = random.Random(seed)
+    client = HTTPClient('127.0.0.1', port)
+    local, retried, failed = [], 0, 0
+    while not stop.is_set() and (count is None or len(local) + failed < count):
+        path = rng.choice(_READ_PATHS)(rng, ids)
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                status, _ = client.request('GET', path)
+            except OSError:
+                client = HTTPClient('127.0.0.1', port)
+                status = None
+                retried += attempt == 0
+                continue
+            break
+        if status == 200:
+            local.append(time.perf_counter() - started)
+        else:
+            failed += 1
+    with lock:
+        latencies.extend(local)
+        outcomes['retried'] += retried
+        outcomes['failed'] += failed
+
+
+def _traffic(port, ids, clients, seed, count=None, duration=None, during=None):
+    latencies, outcomes = [], {'retried': 0, 'failed': 0}
+    lock, stop = threading.Lock(), threading.Event()
+    threads = [
+        threading.Thread(target=_reader, args=(port, ids, seed + i, stop, count, latencies, outcomes, lock))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    if duration is not None:
+        time.sleep(duration / 3)
+        if during is not None:
+            during()
+        time.sleep(duration * 2 / 3)
+        stop.set()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), outcomes
+
+
+def evaluate(db_path, workers=2, threads=8, clients=4, requests=2000, warm_up=True, reload=True, seed=1):
+    """
+    Starts `python serve.py` on the database and measures the seconds until
+    /healthz/ready first answers and until every worker runs, then the
+    latency of the first request each client makes. Reports the memory of
+    the parent and the mean per worker, once right after startup and again
+    after `requests` reads. With `reload`, sends HUP while clients keep
+    reading and counts failed and retried requests.
+    """
+    with sqlite3.connect(db_path) as connection:
+        ids = [row[0] for row in connection.execute('SELECT id FROM recipe')]
+    port = _free_port()
+    pidfile = os.path.join(tempfile.mkdtemp(), 'serve.pid')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.abspath(db_path))
+    env.setdefault('ASSETS_BUILD_ON_STARTUP', '0')
+    command = [
+        sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+        '--threads', str(threads), '--pid', pidfile, '--warm-up' if warm_up else '--no-warm-up',
+    ]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=_BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not _wait_ready(port, started + 120):
+            raise RuntimeError('The server did not become ready within 120 seconds.')
+        ready_seconds = time.perf_counter() - started
+        while len(_children(server.pid)) < workers:
+            time.sleep(0.01)
+        all_workers_seconds = time.perf_counter() - started
+        result = {
+            'workers': workers,
+            'threads': threads,
+            'warm_up': warm_up,
+            'ready_seconds': round(ready_seconds, 2),
+            'all_workers_seconds': round(all_workers_seconds, 2),
+        }
+
+        first, _ = _traffic(port, ids, clients, seed, count=1)
+        result['first_request_mean_ms'] = round(sum(first) / len(first) * 1000, 1) if first else None
+        result['first_request_max_ms'] = round(first[-1] * 1000, 1) if first else None
+        for key, value in memory_mb(server.pid).items():
+            result[f'parent_{key}_mb'] = value
+        for key, value in _workers_memory(server.pid, workers).items():
+            result[f'worker_{key}_mb'] = value
+
+        latencies, outcomes = _traffic(port, ids, clients, seed + 100, count=max(1, requests // clients))
+        result['read_p50_ms'] = round(percentile(latencies, 0.50) * 1000, 1) if latencies else None
+        result['read_p95_ms'] = round(percentile(latencies, 0.95) * 1000, 1) if latencies else None
+        for key, value in _workers_memory(server.pid, workers).items():
+            result[f'worker_{key}_after_traffic_mb'] = value
+
+        if reload:
+            latencies, outcomes = _traffic(port, ids, clients, seed + 200, duration=6.0,
+                                           during=lambda: os.kill(server.pid, signal.SIGHUP))
+            result['reload_requests'] = len(latencies) + outcomes['failed']
+            result['reload_failed_requests'] = outcomes['failed']
+            result['reload_retried_requests'] = outcomes['retried']
+        return result
+    finally:
+        server.terminate()
+        server.wait(60)
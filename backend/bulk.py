@@ -0,0 +1,156 @@
+# bulk.py
+import datetime
+import os
+
+import click
+
+from models import db, Recipe, User, UploadSession, user_liked_recipes, user_saved_recipes, chunked
+from ingredients import delete_recipe_ingredients
+from search import unindex_recipes, reindex_recipes
+from versions import bump_catalog_version
+from cache import invalidate_recipe
+from upload_routes import partial_path
+import images
+import trending
+import viewer_state
+import changelog
+import live
+
+# Set-based versions of the per-recipe write paths. Each step issues one
+# statement per chunk of ids (see models.chunked) instead of one per
+# recipe or per affected user, so the statement count of a bulk operation
+# does not grow with how many users liked or saved the recipes.
+
+# Fields a batch update may set, all to the same value for every recipe
+BATCH_UPDATE_FIELDS = ('title', 'description', 'instructions', 'creatorEmail')
+_TEXT_COLUMNS = {'title': Recipe.title, 'description': Recipe.description, 'instructions': Recipe.instructions}
+
+
+class BulkError(ValueError):
+    """
+    Raised when a bulk request is malformed. `status` is the HTTP status to
+    answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def delete_recipes(recipe_ids):
+    """
+    Deletes recipes together with their likes, saves, ingredient and search
+    index entries, trending rows and image references.
+    Runs inside the caller's transaction; pass the result to
+    finish_after_commit once the transaction has committed.
+    """
+    recipe_ids = list(recipe_ids)
+    rows = []
+    for chunk in chunked(recipe_ids):
+        rows.extend(db.session.query(Recipe.image_hash, Recipe.image_filename).filter(Recipe.id.in_(chunk)))
+
+    viewer_state.bump_state_versions_for_recipes(recipe_ids)
+    for chunk in chunked(recipe_ids):
+        db.session.execute(user_saved_recipes.delete().where(user_saved_recipes.c.recipe_id.in_(chunk)))
+        db.session.execute(user_liked_recipes.delete().where(user_liked_recipes.c.recipe_id.in_(chunk)))
+    delete_recipe_ingredients(recipe_ids)
+    unindex_recipes(recipe_ids)
+    trending.remove_recipes(recipe_ids)
+    released = images.release_images(rows)
+    for chunk in chunked(recipe_ids):
+        db.session.execute(Recipe.__table__.delete().where(Recipe.id.in_(chunk)))
+    changelog.record_changes(recipe_ids, changelog.DELETE)
+    bump_catalog_version()
+    return recipe_ids, released
+
+
+def update_recipes(recipe_ids, changes):
+    """
+    Applies the same `changes` (see BATCH_UPDATE_FIELDS) to every recipe.
+    `creatorEmail` transfers ownership to that user.
+    Runs inside the caller's transaction.
+    """
+    unknown = [key for key in changes if key not in BATCH_UPDATE_FIELDS]
+    if unknown or not changes:
+        raise BulkError(f"changes may only contain: {', '.join(BATCH_UPDATE_FIELDS)}.")
+
+    values = {Recipe.version: Recipe.version + 1, Recipe.updated_at: datetime.datetime.utcnow()}
+    for key, column in _TEXT_COLUMNS.items():
+        if key in changes:
+            value = changes[key]
+            if not isinstance(value, str) or (not value.strip() and key != 'description'):
+                raise BulkError(f"{key} must be a non-empty string.")
+            values[column] = value
+    if 'creatorEmail' in changes:
+        creator_id = db.session.query(User.id).filter_by(email=changes['creatorEmail']).scalar()
+        if creator_id is None:
+            raise BulkError("No user with that creatorEmail.", status=404)
+        values[Recipe.creator_id] = creator_id
+
+    for chunk in chunked(recipe_ids):
+        db.session.execute(Recipe.__table__.update().where(Recipe.id.in_(chunk)).values(values))
+    if any(key in changes for key in _TEXT_COLUMNS):
+        reindex_recipes(recipe_ids)
+    changelog.record_changes(recipe_ids)
+    bump_catalog_version()
+    return list(recipe_ids), []
+
+
+def finish_after_commit(recipe_ids, released):
+    """
+    Drops cached responses for the recipes, queues file cleanup for
+    released images and tells live streams about the changes. Call after
+    the transaction has committed.
+    """
+    for recipe_id in recipe_ids:
+        invalidate_recipe(recipe_id)
+    images.collect_after_commit(*released)
+    live.publish(recipe_ids)
+
+
+def purge_user(user_id):
+    """
+    Deletes a user, their recipes, their likes (lowering the like counts of
+    the recipes they liked) and saves, and their upload sessions, without
+    loading any of it through the ORM cascade.
+    Runs inside the caller's transaction. Returns (recipe_ids, released,
+    partial upload paths) for cleanup after commit.
+    """
+    own_ids = [row[0] for row in db.session.query(Recipe.id).filter_by(creator_id=user_id)]
+    recipe_ids, released = delete_recipes(own_ids) if own_ids else ([], [])
+
+    liked = db.select(user_liked_recipes.c.recipe_id).where(user_liked_recipes.c.user_id == user_id)
+    liked_ids = [row[0] for row in db.session.execute(liked)]
+    db.session.execute(
+        Recipe.__table__.update()
+        .where(Recipe.id.in_(liked), Recipe.likes > 0)
+        .values(likes=Recipe.likes - 1, updated_at=datetime.datetime.utcnow())
+    )
+    db.session.execute(user_liked_recipes.delete().where(user_liked_recipes.c.user_id == user_id))
+    db.session.execute(user_saved_recipes.delete().where(user_saved_recipes.c.user_id == user_id))
+
+    tokens = [row[0] for row in db.session.query(UploadSession.token).filter_by(user_id=user_id)]
+    db.session.execute(UploadSession.__table__.delete().where(UploadSession.user_id == user_id))
+    db.session.execute(User.__table__.delete().where(User.id == user_id))
+    deleted = set(recipe_ids)
+    changelog.record_changes([recipe_id for recipe_id in liked_ids if recipe_id not in deleted])
+    bump_catalog_version()
+    return recipe_ids + liked_ids, released, [partial_path(token) for token in tokens]
+
+
+def init_app(app):
+    @app.cli.command('delete-user')
+    @click.argument('email')
+    def delete_user_command(email):
+        """Delete a user and everything they own."""
+        user_id = db.session.query(User.id).filter_by(email=email).scalar()
+        if user_id is None:
+            raise click.ClickException(f'No user {email}.')
+        recipe_ids, released, partial_paths = purge_user(user_id)
+        db.session.commit()
+        finish_after_commit(recipe_ids, released)
+        for path in partial_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        images.pipeline().shutdown(wait=True)
+        click.echo(f'Deleted {email} and {len(recipe_ids)} affected recipes.')
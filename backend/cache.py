@@ -0,0 +1,333 @@
+# cache.py
+import math
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+# A cached value plus what is needed for expiry: the absolute expiry time and
+# how long the value took to compute (used for early refresh).
+Entry = namedtuple('Entry', ['value', 'expires_at', 'compute_seconds'])
+
+# Rough per-entry bookkeeping cost (key, OrderedDict node, Entry tuple).
+ENTRY_OVERHEAD = 200
+
+
+def sizeof(value):
+    """
+    Approximates the memory held by a cached value. Cached values are bytes,
+    strings, numbers or tuples of those.
+    """
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(item) for item in value) + 8 * len(value)
+    return 16
+
+
+class CacheBackend:
+    """
+    Storage interface used by ResponseCache. Backends store Entry tuples and
+    only need to be safe to call from several threads at once.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class LocalCache(CacheBackend):
+    """
+    In-process LRU cache with per-entry TTL and a memory budget.
+
+    When adding an entry would exceed `max_bytes`, least recently used
+    entries are evicted until it fits. Each worker process has its own copy.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, ttl):
+        size = sizeof(entry.value) + len(key) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._bytes + size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._bytes += size
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._bytes -= self._sizes.pop(key)
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by every worker, stored in Redis. Requires the optional
+    `redis` package. Redis does the eviction (configure maxmemory-policy
+    allkeys-lru) and expiry.
+    """
+
+    def __init__(self, url, prefix='recipe-app:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND='redis' requires the redis package.")
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self._client.get(self.prefix + key)
+        if data is None:
+            return None
+        value, compute_seconds, expires_at_wall = pickle.loads(data)
+        # Convert the shared wall-clock expiry back to this process's monotonic clock
+        return Entry(value, time.monotonic() + (expires_at_wall - time.time()), compute_seconds)
+
+    def set(self, key, entry, ttl):
+        data = pickle.dumps((entry.value, entry.compute_seconds, time.time() + ttl))
+        self._client.set(self.prefix + key, data, ex=max(1, math.ceil(ttl)))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+class ResponseCache:
+    """
+    Read-through cache for serialized responses.
+
+    Stampede protection works at two levels: concurrent misses for one key in
+    a process wait for a single computation, and entries close to expiry are
+    refreshed early by one caller with a probability that grows as expiry
+    approaches ("XFetch"), so a hot key rarely expires under load at all.
+    """
+
+    def __init__(self, backend, ttl=60, beta=1.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.beta = beta
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.early_refreshes = 0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _should_refresh_early(self, entry):
+        jitter = entry.compute_seconds * self.beta * -math.log(1.0 - random.random())
+        return time.monotonic() + jitter >= entry.expires_at
+
+    def get_or_compute(self, key, compute, ttl=None, is_fresh=None):
+        """
+        Returns the cached value for `key`, calling `compute()` on a miss.
+        `is_fresh(value)` can reject an entry that the caller knows is out of
+        date, which then counts as stale and is recomputed.
+        """
+        entry = self.backend.get(key)
+        if entry is not None and is_fresh is not None and not is_fresh(entry.value):
+            self.stale += 1
+            entry = None
+        if entry is not None:
+            if not self._should_refresh_early(entry):
+                self.hits += 1
+                return entry.value
+            self.early_refreshes += 1
+
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            # Serve the entry we already have while the leader refreshes it,
+            # or wait for the leader on a cold miss.
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            event.wait()
+            entry = self.backend.get(key)
+            if entry is not None and (is_fresh is None or is_fresh(entry.value)):
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+            return compute()
+
+        self.misses += 1
+        try:
+            started = time.monotonic()
+            value = compute()
+            elapsed = time.monotonic() - started
+            ttl = self.ttl if ttl is None else ttl
+            self.backend.set(key, Entry(value, time.monotonic() + ttl, elapsed), ttl)
+            return value
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            event.set()
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self.backend.delete(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            stale=self.stale,
+            early_refreshes=self.early_refreshes,
+            hit_ratio=round(self.hits / lookups, 4) if lookups else None,
+            **self.backend.stats()
+        )
+
+
+def response_cache():
+    """
+    Returns the app's ResponseCache, or None when caching is disabled.
+    """
+    return current_app.extensions.get('response_cache')
+
+
+def recipe_key(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def invalidate_recipe(recipe_id):
+    """
+    Drops a recipe's cached detail response. List responses need no explicit
+    invalidation: they are keyed by catalog version, which every write bumps.
+    Call after the write has committed.
+    """
+    cache = response_cache()
+    if cache is not None:
+        cache.invalidate(recipe_key(recipe_id))
+
+
+class _Uncacheable(Exception):
+    """
+    Carries a non-200 response out of a cache computation so it is returned
+    to the client but never stored.
+    """
+
+    def __init__(self, response):
+        super().__init__(response.status)
+        self.response = response
+
+
+def cached_list_view(view):
+    """
+    Decorator caching a list view's JSON body per catalog version and query
+    string. Must be applied inside versions.catalog_conditional, which
+    provides the catalog version.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        cache = response_cache()
+        if cache is None:
+            return view(*args, **kwargs)
+
+        def compute():
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                raise _Uncacheable(response)
+            return response.get_data()
+
+        key = f"list:{request.path}:{g.catalog_version}:{request.query_string.decode()}"
+        try:
+            body = cache.get_or_compute(key, compute)
+        except _Uncacheable as e:
+            return e.response
+        return current_app.response_class(body, mimetype='application/json')
+    return decorated_function
+
+
+def create_backend(app):
+    kind = app.config.get('RESPONSE_CACHE_BACKEND', 'local')
+    if kind == 'local':
+        return LocalCache(max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    if kind == 'redis':
+        return RedisCache(app.config['RESPONSE_CACHE_REDIS_URL'])
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {kind}")
+
+
+def init_app(app, backend=None):
+    """
+    Installs the response cache unless RESPONSE_CACHE_BACKEND is 'none'.
+    Pass `backend` to plug in any CacheBackend implementation.
+    """
+    if backend is None:
+        if app.config.get('RESPONSE_CACHE_BACKEND', 'local') == 'none':
+            return
+        backend = create_backend(app)
+    app.extensions['response_cache'] = ResponseCache(
+        backend,
+        ttl=app.config.get('RESPONSE_CACHE_TTL', 60)
+    )
+
+    @app.route('/api/cache/stats')
+    def cache_stats():
+        return jsonify(response_cache().stats())
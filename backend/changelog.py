@@ -0,0 +1,281 @@
+# changelog.py
+import datetime
+import threading
+from collections import namedtuple
+
+import click
+from sqlalchemy import text
+
+from models import db, Counter, insert_ignore
+from versions import counter_state
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+# Written when recipes changed without per-recipe entries (e.g. a like
+# recount); every client behind it must reload the catalog.
+RESYNC = 'resync'
+
+# Counter holding the highest sequence number removed by compaction.
+# Clients whose position is below it have missed entries and must resync.
+FLOOR = 'recipe_changes_floor'
+
+# Key of the PostgreSQL advisory lock that serializes settle()
+SETTLE_LOCK_KEY = 0x52435347
+
+
+class RecipeChange(db.Model):
+    """
+    Append-only log of recipe changes. `seq` orders the entries; with
+    sqlite_autoincrement it is never reused, even after compaction.
+    """
+    __tablename__ = 'recipe_change'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    # Null for RESYNC entries, which concern the whole catalog
+    recipe_id = db.Column(db.Integer, nullable=True)
+    kind = db.Column(db.String(8), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # Finds each recipe's latest entry during compaction
+        db.Index('ix_recipe_change_recipe_seq', 'recipe_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class PendingRecipeChange(db.Model):
+    """
+    PostgreSQL only: log entries whose writing transaction may still be
+    open, with that transaction's id. settle moves them into recipe_change
+    once the transaction has ended, so seq follows commit order.
+    """
+    __tablename__ = 'recipe_change_pending'
+
+    id = db.Column(db.Integer, primary_key=True)
+    txid = db.Column(db.BigInteger, nullable=False, index=True)
+    recipe_id = db.Column(db.Integer, nullable=True)
+    kind = db.Column(db.String(8), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+# Result of read_changes. `upserted` and `deleted` hold each recipe's
+# latest change in the range; `next_since` is the position to poll from.
+ChangeBatch = namedtuple('ChangeBatch', ['resync', 'latest', 'next_since', 'upserted', 'deleted', 'has_more'])
+
+
+def _serialized_commits():
+    # SQLite commits one writer at a time, so seq assigned at insert
+    # already follows commit order
+    return db.session.get_bind().dialect.name == 'sqlite'
+
+
+def _append(rows):
+    if _serialized_commits():
+        db.session.execute(RecipeChange.__table__.insert(), rows)
+    else:
+        txid = db.cast(db.cast(db.func.pg_current_xact_id(), db.Text), db.BigInteger)
+        db.session.execute(PendingRecipeChange.__table__.insert().values(txid=txid), rows)
+
+
+def record_changes(recipe_ids, kind=UPSERT):
+    """
+    Appends one entry per recipe. Runs inside the caller's transaction, so
+    the entries commit or roll back together with the change itself.
+    """
+    now = datetime.datetime.utcnow()
+    rows = [{'recipe_id': recipe_id, 'kind': kind, 'changed_at': now} for recipe_id in dict.fromkeys(recipe_ids)]
+    if rows:
+        _append(rows)
+
+
+def record_resync():
+    """
+    Tells every client to reload the catalog. Use after changes that are
+    not recorded per recipe. Runs inside the caller's transaction.
+    """
+    _append([{'recipe_id': None, 'kind': RESYNC, 'changed_at': datetime.datetime.utcnow()}])
+
+
+def settle():
+    """
+    PostgreSQL only: moves pending entries whose transactions have ended
+    into the log, and returns how many. Transactions commit in any order,
+    so an entry numbered at insert time could become visible after a
+    client had already read past its seq. Settlers take an advisory lock,
+    which makes seq follow the order in which entries settle. Every entry
+    settled later belongs to a transaction that was still open, or had not
+    started, when this one ran.
+    """
+    if _serialized_commits():
+        return 0
+    # Every transaction with an id below the snapshot's xmin has ended
+    xmin = db.session.execute(text('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')).scalar()
+    if db.session.query(PendingRecipeChange.id).filter(PendingRecipeChange.txid < xmin).first() is None:
+        db.session.rollback()
+        return 0
+    db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SETTLE_LOCK_KEY})
+    pending = PendingRecipeChange.__table__
+    ended = db.select(pending.c.recipe_id, pending.c.kind, pending.c.changed_at) \
+        .where(pending.c.txid < xmin) \
+        .order_by(pending.c.txid, pending.c.id)
+    settled = db.session.execute(
+        RecipeChange.__table__.insert().from_select(['recipe_id', 'kind', 'changed_at'], ended)
+    ).rowcount
+    db.session.execute(pending.delete().where(pending.c.txid < xmin))
+    db.session.commit()
+    return settled
+
+
+def latest_seq():
+    """
+    Sequence number of the newest entry; polling from here returns only
+    changes made after this call.
+    """
+    latest = db.session.query(db.func.max(RecipeChange.seq)).scalar()
+    return max(latest or 0, counter_state(FLOOR)[0])
+
+
+def read_changes(since, limit):
+    """
+    Returns the changes after position `since`, at most `limit` log
+    entries' worth, with each recipe reported once as upserted or deleted.
+    `resync` is set when the log no longer covers `since` (compacted past
+    it, or reset) or contains a RESYNC entry after it.
+    """
+    latest = latest_seq()
+    if since < counter_state(FLOOR)[0] or since > latest:
+        return ChangeBatch(True, latest, latest, [], [], False)
+
+    rows = db.session.query(RecipeChange.seq, RecipeChange.recipe_id, RecipeChange.kind) \
+        .filter(RecipeChange.seq > since) \
+        .order_by(RecipeChange.seq) \
+        .limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if any(row.kind == RESYNC for row in rows):
+        return ChangeBatch(True, latest, latest, [], [], False)
+
+    kinds = {}
+    for row in rows:
+        kinds[row.recipe_id] = row.kind
+    return ChangeBatch(
+        False, latest, rows[-1].seq if rows else since,
+        [recipe_id for recipe_id, kind in kinds.items() if kind == UPSERT],
+        [recipe_id for recipe_id, kind in kinds.items() if kind == DELETE],
+        has_more
+    )
+
+
+def _raise_floor(value):
+    db.session.execute(insert_ignore(Counter.__table__).values(name=FLOOR, value=0, updated_at=datetime.datetime.utcnow()))
+    db.session.execute(
+        Counter.__table__.update()
+        .where(Counter.name == FLOOR, Counter.value < value)
+        .values(value=value, updated_at=datetime.datetime.utcnow())
+    )
+
+
+def compact(retention_seconds):
+    """
+    Shrinks the log in two steps. Entries superseded by a newer entry for
+    the same recipe are dropped; a client replaying from any position still
+    sees the newer one, so this never forces a resync. Entries older than
+    `retention_seconds` are dropped as well, and the floor is raised past
+    them so clients that were further behind resync. Returns the number of
+    entries removed.
+    """
+    newest = db.select(db.func.max(RecipeChange.seq)).group_by(RecipeChange.recipe_id)
+    removed = db.session.execute(RecipeChange.__table__.delete().where(RecipeChange.seq.not_in(newest))).rowcount
+
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=retention_seconds)
+    expired = db.session.query(db.func.max(RecipeChange.seq)).filter(RecipeChange.changed_at < cutoff).scalar()
+    if expired is not None:
+        _raise_floor(expired)
+        removed += db.session.execute(RecipeChange.__table__.delete().where(RecipeChange.seq <= expired)).rowcount
+    db.session.commit()
+    return removed
+
+
+class ChangeLogSettler:
+    """
+    PostgreSQL only: background thread running settle every `interval`
+    seconds. Changes reach clients once their transaction has ended and
+    the next settle has run. Every worker process runs one; the advisory
+    lock keeps them from settling at the same time.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='changelog-settle', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    settle()
+                except Exception:
+                    self.app.logger.exception("Change log settle failed")
+                    db.session.rollback()
+
+
+class ChangeLogCompactor:
+    """
+    Background thread running compact every `interval` seconds. Each
+    worker process runs its own, which is harmless: compaction is
+    idempotent. Set RECIPE_CHANGES_COMPACT_INTERVAL to 0 and schedule
+    `flask compact-changes` instead to compact from one place.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='changelog-compact', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    compact(self.app.config['RECIPE_CHANGES_RETENTION'])
+                except Exception:
+                    self.app.logger.exception("Change log compaction failed")
+                    db.session.rollback()
+
+
+def start_background(app):
+    """
+    Starts the periodic compactor unless RECIPE_CHANGES_COMPACT_INTERVAL is
+    0, and on PostgreSQL the settler.
+    """
+    if app.config['RECIPE_CHANGES_COMPACT_INTERVAL']:
+        app.extensions['changelog_compactor'] = ChangeLogCompactor(app, app.config['RECIPE_CHANGES_COMPACT_INTERVAL'])
+    with app.app_context():
+        if not _serialized_commits():
+            app.extensions['changelog_settler'] = ChangeLogSettler(app, app.config['RECIPE_CHANGES_SETTLE_INTERVAL'])
+
+
+def init_app(app):
+    """
+    Registers the compaction and settle CLI commands.
+    """
+    @app.cli.command('compact-changes')
+    def compact_changes_command():
+        """Drop superseded and expired recipe change-log entries."""
+        removed = compact(app.config['RECIPE_CHANGES_RETENTION'])
+        click.echo(f'Removed {removed} change-log entries.')
+
+    @app.cli.command('settle-changes')
+    def settle_changes_command():
+        """Move finished transactions' change-log entries into the log (PostgreSQL)."""
+        settled = settle()
+        click.echo(f'Settled {settled} change-log entries.')
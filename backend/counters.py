@@ -0,0 +1,245 @@
+# counters.py
+import atexit
+import datetime
+import threading
+
+import click
+from flask import current_app
+
+from models import db, Recipe, user_liked_recipes, insert_ignore
+from versions import bump_catalog_version
+import changelog
+
+
+def toggle_membership(table, user_id, recipe_id):
+    """
+    Flips a (user_id, recipe_id) row in an association table with one
+    DELETE and, if nothing was deleted, one INSERT that ignores duplicates.
+
+    Returns (present, delta): whether the row exists afterwards, and the
+    change in row count (-1, 0 or +1) that this call alone caused. Two
+    concurrent toggles can never both count the same row, so counters
+    updated with `delta` stay exact.
+    """
+    deleted = db.session.execute(
+        table.delete().where(table.c.user_id == user_id, table.c.recipe_id == recipe_id)
+    ).rowcount
+    if deleted:
+        return False, -1
+    inserted = db.session.execute(
+        insert_ignore(table).values(user_id=user_id, recipe_id=recipe_id)
+    ).rowcount
+    return True, (1 if inserted else 0)
+
+
+def _increment_statement():
+    return Recipe.__table__.update() \
+        .where(Recipe.id == db.bindparam('recipe_id')) \
+        .values(
+            likes=db.func.coalesce(Recipe.likes, 0) + db.bindparam('delta'),
+            updated_at=db.bindparam('now')
+        )
+
+
+def apply_like_delta(recipe_id, delta):
+    """
+    Adds `delta` to a recipe's like count, either atomically in the current
+    transaction or, in write-behind mode, through the in-memory buffer.
+    The catalog version is not bumped here: call likes_changed_after_commit
+    once the transaction has committed.
+    """
+    if not delta:
+        return
+    buffer = current_app.extensions.get('like_counter')
+    if buffer is not None:
+        buffer.add(recipe_id, delta)
+    else:
+        db.session.execute(_increment_statement(), {'recipe_id': recipe_id, 'delta': delta, 'now': datetime.datetime.utcnow()})
+        changelog.record_changes([recipe_id])
+
+
+def likes_changed_after_commit():
+    """
+    Lets cached list pages pick up committed like-count changes. The
+    catalog bumper bumps the catalog version at most once per interval.
+    Without it, the version is bumped here in a transaction of its own.
+    In write-behind mode the buffer's flush bumps it instead.
+    """
+    if current_app.extensions.get('like_counter') is not None:
+        return
+    bumper = current_app.extensions.get('catalog_bumper')
+    if bumper is not None:
+        bumper.mark()
+        return
+    bump_catalog_version()
+    db.session.commit()
+
+
+def current_likes(recipe_id):
+    """
+    Returns a recipe's like count including increments not yet flushed.
+    """
+    likes = db.session.query(Recipe.likes).filter_by(id=recipe_id).scalar() or 0
+    buffer = current_app.extensions.get('like_counter')
+    if buffer is not None:
+        likes += buffer.pending(recipe_id)
+    return max(0, likes)
+
+
+class LikeCounterBuffer:
+    """
+    Coalesces like-count increments in memory and writes them in batches.
+
+    A popular recipe liked by many users at once then costs one UPDATE per
+    flush instead of one contended row write per request. Deltas are
+    flushed every `interval` seconds, when more than `max_pending` recipes
+    are waiting, and at interpreter exit. A crash loses at most one
+    interval of counts; the like rows themselves are always written
+    synchronously, so `flask recount-likes` can repair the counters.
+    """
+
+    def __init__(self, app, interval=1.0, max_pending=1000):
+        self.app = app
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='like-counter-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def add(self, recipe_id, delta):
+        with self._lock:
+            self._pending[recipe_id] = self._pending.get(recipe_id, 0) + delta
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+
+    def pending(self, recipe_id):
+        with self._lock:
+            return self._pending.get(recipe_id, 0)
+
+    def flush(self):
+        """
+        Writes all buffered deltas in one transaction. Deltas that fail to
+        write are merged back so they are retried on the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            now = datetime.datetime.utcnow()
+            rows = [{'recipe_id': recipe_id, 'delta': delta, 'now': now} for recipe_id, delta in batch.items() if delta]
+            if not rows:
+                return 0
+            try:
+                with self.app.app_context():
+                    db.session.execute(_increment_statement(), rows)
+                    changelog.record_changes([row['recipe_id'] for row in rows])
+                    bump_catalog_version()
+                    db.session.commit()
+            except Exception:
+                with self._lock:
+                    for row in rows:
+                        self._pending[row['recipe_id']] = self._pending.get(row['recipe_id'], 0) + row['delta']
+                self.app.logger.exception("Failed to flush %d like counters", len(rows))
+                return 0
+            return len(rows)
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+class CatalogBumper:
+    """
+    Background thread that bumps the catalog version every `interval`
+    seconds if likes were committed since the last bump. Bumping in every
+    like transaction would queue all likes on the one catalog counter row,
+    and would empty every cached list page on each like.
+    """
+
+    def __init__(self, app, interval=1.0):
+        self.app = app
+        self.interval = interval
+        self._dirty = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='catalog-bump', daemon=True)
+        self._thread.start()
+
+    def mark(self):
+        self._dirty.set()
+
+    def bump(self):
+        """
+        Bumps the catalog version if anything was marked. A failed bump is
+        retried on the next tick.
+        """
+        if not self._dirty.is_set():
+            return False
+        self._dirty.clear()
+        with self.app.app_context():
+            try:
+                bump_catalog_version()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._dirty.set()
+                self.app.logger.exception("Catalog version bump failed")
+                return False
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        self.bump()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.bump()
+
+
+def recount_likes():
+    """
+    Recomputes every recipe's like count from user_liked_recipes.
+    """
+    counts = db.select(db.func.count()) \
+        .where(user_liked_recipes.c.recipe_id == Recipe.id) \
+        .scalar_subquery()
+    db.session.execute(Recipe.__table__.update().values(likes=counts, updated_at=datetime.datetime.utcnow()))
+    changelog.record_resync()
+    bump_catalog_version()
+    db.session.commit()
+
+
+def start_background(app):
+    """
+    Starts the write-behind buffer when LIKE_COUNTER_WRITE_BEHIND is set,
+    and the catalog bumper otherwise.
+    """
+    if app.config.get('LIKE_COUNTER_WRITE_BEHIND'):
+        app.extensions['like_counter'] = LikeCounterBuffer(
+            app,
+            interval=app.config.get('LIKE_COUNTER_FLUSH_INTERVAL', 1.0),
+            max_pending=app.config.get('LIKE_COUNTER_MAX_PENDING', 1000)
+        )
+    else:
+        app.extensions['catalog_bumper'] = CatalogBumper(app, app.config.get('LIKE_COUNTER_FLUSH_INTERVAL', 1.0))
+
+
+def init_app(app):
+    """
+    Registers the recount CLI command.
+    """
+    @app.cli.command('recount-likes')
+    def recount_likes_command():
+        """Recompute recipe like counts from the likes table."""
+        recount_likes()
+        click.echo('Like counts recomputed.')
@@ -0,0 +1,136 @@
+# database.py
+import os
+from functools import wraps
+
+import click
+from flask import g
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+READ_BIND = 'read'
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer; synchronous=NORMAL is durable across application crashes
+# and only loses the last transactions on power loss in WAL mode; the busy
+# timeout makes writers queue for the lock instead of failing with
+# "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative values are in KiB: 64 MiB of page cache per connection
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class RoutingSession(Session):
+    """
+    Session that sends queries made inside a read_only view to the READ_BIND
+    engine, when one is configured. Flushes always go to the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and g.get('read_only') and READ_BIND in self._db.engines:
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """
+    Decorator for views that never write: their queries use the read pool.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return decorated_function
+
+
+def database_url():
+    """
+    Returns DATABASE_URL, or the default SQLite file in the instance folder.
+    """
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return 'sqlite:///recipe_app.db'
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, app, read=False):
+    """
+    Pool settings for one engine. SQLite pools hold connections to the same
+    file; PostgreSQL pools are checked with pre-ping and recycled so
+    connections dropped by the server are replaced transparently.
+    """
+    if url.startswith('sqlite') and (url in ('sqlite://', 'sqlite:///') or ':memory:' in url):
+        # In-memory databases live in a single connection
+        return {}
+    options = {
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DATABASE_POOL_TIMEOUT'],
+    }
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000, 'check_same_thread': False}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = app.config['DATABASE_POOL_RECYCLE']
+        if read:
+            options['execution_options'] = {'postgresql_readonly': True}
+    return options
+
+
+def _set_sqlite_pragmas(read):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if read:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+    return on_connect
+
+
+def configure(app):
+    """
+    Fills in the SQLAlchemy configuration for the primary engine and, when
+    DATABASE_READ_POOL is on, a separate read-only pool (pointing at
+    DATABASE_READ_URL, e.g. a replica, or at the primary database).
+    Call before db.init_app.
+    """
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, app)
+    if app.config['DATABASE_READ_POOL']:
+        read_url = os.environ.get('DATABASE_READ_URL') or url
+        app.config['SQLALCHEMY_BINDS'] = {
+            READ_BIND: dict(url=read_url, **engine_options(read_url, app, read=True)),
+        }
+
+
+def init_app(app):
+    """
+    Installs the connection pragmas on the app's SQLite engines and registers
+    the db-info CLI command. Call after db.init_app.
+    """
+    db = app.extensions['sqlalchemy']
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _set_sqlite_pragmas(read=key == READ_BIND))
+
+    @app.cli.command('db-info')
+    def db_info_command():
+        """Show the database engines and their effective settings."""
+        for key, engine in db.engines.items():
+            click.echo(f"{key or 'primary'}: {engine.url.render_as_string(hide_password=True)} (pool size {engine.pool.size()})")
+            if engine.dialect.name == 'sqlite':
+                with engine.connect() as connection:
+                    for name in list(SQLITE_PRAGMAS) + ['query_only']:
+                        value = connection.execute(text(f'PRAGMA {name}')).scalar()
+                        click.echo(f'  {name} = {value}')
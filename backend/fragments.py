@@ -0,0 +1,109 @@
+# fragments.py
+import time
+
+from flask import current_app, jsonify
+
+from cache import Entry, LocalCache
+from models import RECIPE_FIELDS
+from serializers import serialize_recipes
+
+# Fragments never go stale (a new version gets a new key), so entries only
+# leave the cache through LRU eviction or this long a TTL.
+FRAGMENT_TTL = 24 * 60 * 60
+
+_LIKES_KEY = b'"likes":'
+
+
+class FragmentCache:
+    """
+    Serialized JSON of individual recipes, keyed by (recipe_id, version,
+    fields), in a bounded LRU. The version changes whenever the content of
+    a recipe changes (see versions.touch_recipe), so fragments are never
+    invalidated explicitly.
+
+    `likes` changes on every like without a version bump, so each fragment
+    is stored split around its likes value. Building a response then only
+    formats the current count between the two halves.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.backend = LocalCache(max_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, recipes, fields=None):
+        """
+        Returns the serialized JSON of each recipe, in order, as bytes.
+        Only recipes without a cached fragment are serialized.
+        """
+        fields = tuple(fields or RECIPE_FIELDS)
+        cached_fields = tuple(field for field in fields if field != 'likes')
+        with_likes = len(cached_fields) != len(fields)
+        suffix = ':' + ','.join(fields)
+
+        parts = {}
+        missing = []
+        for recipe in recipes:
+            entry = self.backend.get(f'{recipe.id}:{recipe.version}{suffix}')
+            if entry is None:
+                missing.append(recipe)
+            else:
+                parts[recipe.id] = entry.value
+        self.hits += len(recipes) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            dumps = current_app.json.dumps_bytes
+            expires_at = time.monotonic() + FRAGMENT_TTL
+            for recipe, data in zip(missing, serialize_recipes(missing, cached_fields)):
+                if with_likes:
+                    # The placeholder sorts into place with the other keys;
+                    # `"likes":` can only occur in the output as that key.
+                    data['likes'] = 0
+                    head, _, tail = dumps(data).partition(_LIKES_KEY + b'0')
+                    value = (head + _LIKES_KEY, tail)
+                else:
+                    value = (dumps(data), b'')
+                self.backend.set(f'{recipe.id}:{recipe.version}{suffix}', Entry(value, expires_at, 0), FRAGMENT_TTL)
+                parts[recipe.id] = value
+
+        if not with_likes:
+            return [parts[recipe.id][0] for recipe in recipes]
+        return [b'%s%d%s' % (parts[recipe.id][0], recipe.likes or 0, parts[recipe.id][1]) for recipe in recipes]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=round(self.hits / lookups, 4) if lookups else None,
+            **self.backend.stats()
+        )
+
+
+def recipes_response(recipes, fields=None, **extra):
+    """
+    JSON response of the form {"recipes": [...], **extra} built by
+    concatenating recipe fragments, without encoding the recipes again.
+    Falls back to jsonify when the fragment cache is disabled.
+    """
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        return jsonify(recipes=serialize_recipes(recipes, fields), **extra)
+    head = current_app.json.dumps_bytes(extra)[:-1] + (b',' if extra else b'')
+    body = b'%s"recipes":[%s]}\n' % (head, b','.join(cache.render(recipes, fields)))
+    return current_app.response_class(body, mimetype='application/json')
+
+
+def init_app(app):
+    """
+    Installs the fragment cache unless FRAGMENT_CACHE_MAX_BYTES is 0.
+    """
+    max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    if not max_bytes:
+        return
+    app.extensions['fragment_cache'] = FragmentCache(max_bytes)
+
+    @app.route('/api/cache/fragments/stats')
+    def fragment_cache_stats():
+        return jsonify(app.extensions['fragment_cache'].stats())
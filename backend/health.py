@@ -0,0 +1,29 @@
+# health.py
+import os
+
+from flask import jsonify
+from sqlalchemy import text
+
+from models import db
+
+
+def init_app(app):
+    """
+    Registers the probes for load balancers and process supervisors:
+    GET /healthz/live answers as long as the process serves requests, and
+    GET /healthz/ready also checks that the database answers. Route traffic
+    by readiness; restart a worker only when liveness fails. Both report
+    the worker's pid.
+    """
+    @app.route('/healthz/live')
+    def liveness():
+        return jsonify(status='ok', pid=os.getpid())
+
+    @app.route('/healthz/ready')
+    def readiness():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except Exception:
+            app.logger.exception("Readiness check failed")
+            return jsonify(status='unavailable', pid=os.getpid()), 503
+        return jsonify(status='ok', pid=os.getpid())
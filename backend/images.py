@@ -0,0 +1,381 @@
+# images.py
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, g
+
+from models import db, Recipe, ImageBlob, insert_ignore, chunked
+from versions import bump_catalog_version
+from cache import invalidate_recipe
+import changelog
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are served as-is
+    Image = None
+
+# Uploaded files are stored once per distinct content under
+# UPLOAD_FOLDER/blobs/<first two hash characters>/<sha256>.<ext>, and resized
+# variants under UPLOAD_FOLDER/variants/. Both are named by content hash, so
+# their URLs never change meaning and can be cached forever.
+IMMUTABLE_PREFIXES = ('blobs/', 'variants/')
+COPY_BUFFER_SIZE = 64 * 1024
+
+# Leading bytes of each accepted image format, mapped to the stored extension
+MAGIC_BYTES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MAGIC_LENGTH = max(len(magic) for magic, _ in MAGIC_BYTES)
+
+blob_path = ImageBlob.blob_path
+variant_path = ImageBlob.variant_path
+
+
+def detect_image_type(head):
+    for magic, ext in MAGIC_BYTES:
+        if head.startswith(magic):
+            return ext
+    return None
+
+
+def _absolute(relative_path):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], relative_path)
+
+
+def _hash_to_temp(stream):
+    """
+    Copies a stream to a temporary file in the upload folder while hashing
+    it. Returns (temp_path, sha256, size).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=current_app.config['UPLOAD_FOLDER'], prefix='.upload-')
+    with os.fdopen(fd, 'wb') as out:
+        while True:
+            chunk = stream.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return temp_path, digest.hexdigest(), size
+
+
+def store_file(temp_path, sha256, size, ext, discard_on_rollback=True):
+    """
+    Takes a reference on the blob for an already hashed file, in the
+    caller's transaction, and stages the file. place_after_commit moves it
+    into the blob store once the transaction has committed. Staged files
+    that are never placed (the transaction rolled back) are deleted when
+    the app context ends, unless `discard_on_rollback` is off.
+    Returns the blob's relative path.
+    """
+    relative_path = blob_path(sha256, ext)
+    db.session.execute(insert_ignore(ImageBlob.__table__).values(sha256=sha256, ext=ext, size=size, ref_count=0))
+    db.session.execute(
+        ImageBlob.__table__.update()
+        .where(ImageBlob.sha256 == sha256)
+        .values(ref_count=ImageBlob.ref_count + 1)
+    )
+    g.setdefault('staged_images', []).append((temp_path, relative_path, discard_on_rollback))
+    return relative_path
+
+
+def place_after_commit():
+    """
+    Moves the files staged by store_file into the blob store, or drops them
+    when the blob's file is already there. Call once the transaction that
+    took their references has committed.
+    """
+    for temp_path, relative_path, _ in g.pop('staged_images', []):
+        destination = _absolute(relative_path)
+        if os.path.exists(destination):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.move(temp_path, destination)
+
+
+def _discard_staged(exc):
+    for temp_path, _, discard in g.pop('staged_images', []):
+        if discard and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def store_upload(file_storage):
+    """
+    Stores an uploaded werkzeug FileStorage by content hash.
+    Returns (sha256, relative_path). Raises ValueError if the content is
+    not a PNG, JPEG or GIF image.
+    """
+    temp_path, sha256, size = _hash_to_temp(file_storage.stream)
+    with open(temp_path, 'rb') as f:
+        ext = detect_image_type(f.read(MAGIC_LENGTH))
+    if ext is None:
+        os.remove(temp_path)
+        raise ValueError("File is not a PNG, JPEG or GIF image.")
+    return sha256, store_file(temp_path, sha256, size, ext)
+
+
+def release_image(recipe):
+    """
+    Drops the recipe's reference to its image. Content-addressed blobs are
+    only deleted once no recipe references them; legacy files (stored before
+    hashing) are deleted when no other recipe uses the same filename.
+    Runs inside the caller's transaction; the returned value must be passed
+    to collect_after_commit once the transaction has committed.
+    """
+    if recipe.image_hash:
+        db.session.execute(
+            ImageBlob.__table__.update()
+            .where(ImageBlob.sha256 == recipe.image_hash)
+            .values(ref_count=ImageBlob.ref_count - 1)
+        )
+        return ('blob', recipe.image_hash)
+    if recipe.image_filename:
+        return ('legacy', recipe.image_filename)
+    return None
+
+
+def _adjust_references(references, sign):
+    # One UPDATE per distinct count instead of one per blob
+    by_count = {}
+    for sha256, count in references.items():
+        by_count.setdefault(count, []).append(sha256)
+    for count, hashes in by_count.items():
+        for chunk in chunked(hashes):
+            db.session.execute(
+                ImageBlob.__table__.update()
+                .where(ImageBlob.sha256.in_(chunk))
+                .values(ref_count=ImageBlob.ref_count + sign * count)
+            )
+
+
+def retain_images(hashes):
+    """
+    Takes one reference per entry of `hashes` on existing blobs, e.g. for
+    imported recipes that point at already stored images.
+    Runs inside the caller's transaction.
+    """
+    references = {}
+    for sha256 in hashes:
+        references[sha256] = references.get(sha256, 0) + 1
+    _adjust_references(references, 1)
+
+
+def release_images(images):
+    """
+    Set-based release_image for many recipes at once. Takes
+    (image_hash, image_filename) pairs and drops one blob reference per pair
+    with one UPDATE per distinct reference count. Returns the released
+    references, to be passed to collect_after_commit.
+    """
+    references = {}
+    legacy = set()
+    for image_hash, image_filename in images:
+        if image_hash:
+            references[image_hash] = references.get(image_hash, 0) + 1
+        elif image_filename:
+            legacy.add(image_filename)
+    _adjust_references(references, -1)
+    return [('blob', sha256) for sha256 in references] + [('legacy', filename) for filename in legacy]
+
+
+def collect_after_commit(*released):
+    """
+    Queues deletion of the files behind released image references, as one
+    background job.
+    """
+    released = [reference for reference in released if reference is not None]
+    if released:
+        pipeline().submit(_collect_all, released)
+
+
+def _collect_all(released):
+    for kind, key in released:
+        _collect(kind, key)
+
+
+def _collect(kind, key):
+    if kind == 'legacy':
+        if db.session.query(Recipe.id).filter_by(image_filename=key).first() is None:
+            path = _absolute(key)
+            if os.path.exists(path):
+                os.remove(path)
+        return
+
+    blob = db.session.get(ImageBlob, key)
+    if blob is None or blob.ref_count > 0:
+        return
+    paths = [blob_path(blob.sha256, blob.ext)] + [variant_path(blob.sha256, w, f) for w, f in blob.variants()]
+    # Delete the row only if it is still unreferenced, and unlink the files
+    # while the delete holds the row's write lock. A store_file for the same
+    # content then commits after this transaction, and its
+    # place_after_commit puts the file back.
+    deleted = db.session.execute(
+        ImageBlob.__table__.delete().where(ImageBlob.sha256 == key, ImageBlob.ref_count <= 0)
+    ).rowcount
+    if not deleted:
+        db.session.rollback()
+        return
+    for relative_path in paths:
+        path = _absolute(relative_path)
+        if os.path.exists(path):
+            os.remove(path)
+    db.session.commit()
+
+
+def _save_atomically(image, relative_path, fmt, **options):
+    path = _absolute(relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.variant-')
+    with os.fdopen(fd, 'wb') as out:
+        image.save(out, fmt, **options)
+    os.replace(temp_path, path)
+
+
+def _generate_variants(sha256):
+    """
+    Generates the resized WebP and fallback variants of one blob.
+    """
+    blob = db.session.get(ImageBlob, sha256)
+    if blob is None or blob.status == 'ready':
+        return
+    if Image is None:
+        blob.status = 'original'
+        db.session.commit()
+        return
+
+    try:
+        with Image.open(_absolute(blob_path(blob.sha256, blob.ext))) as source:
+            image = ImageOps.exif_transpose(source)
+            has_alpha = image.mode in ('RGBA', 'LA', 'P') and (image.mode != 'P' or 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+            blob.width, blob.height = image.size
+
+            fallback = 'png' if has_alpha else 'jpg'
+            widths = sorted({min(w, image.width) for w in current_app.config['IMAGE_VARIANT_WIDTHS']})
+            for width in widths:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+                _save_atomically(resized, variant_path(sha256, width, 'webp'), 'WEBP', quality=80, method=4)
+                if fallback == 'jpg':
+                    _save_atomically(resized, variant_path(sha256, width, 'jpg'), 'JPEG', quality=82, progressive=True, optimize=True)
+                else:
+                    _save_atomically(resized, variant_path(sha256, width, 'png'), 'PNG', optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Unreadable, truncated or too many pixels to decode safely
+        current_app.logger.exception("Could not generate variants for image %s", sha256)
+        blob.status = 'failed'
+        db.session.commit()
+        return
+
+    blob.variant_widths = ','.join(map(str, widths))
+    blob.fallback_format = fallback
+    blob.status = 'ready'
+    # The recipes' serialized `image` field changes, so their validators must too
+    recipe_ids = [row[0] for row in db.session.query(Recipe.id).filter_by(image_hash=sha256)]
+    if recipe_ids:
+        Recipe.query.filter(Recipe.id.in_(recipe_ids)).update(
+            {Recipe.version: Recipe.version + 1, Recipe.updated_at: datetime.datetime.utcnow()},
+            synchronize_session=False
+        )
+        changelog.record_changes(recipe_ids)
+        bump_catalog_version()
+    db.session.commit()
+    for recipe_id in recipe_ids:
+        invalidate_recipe(recipe_id)
+
+
+def process_after_commit(sha256):
+    """
+    Queues variant generation for a newly stored blob.
+    """
+    if sha256:
+        pipeline().submit(_generate_variants, sha256)
+
+
+class ImagePipeline:
+    """
+    Bounded worker pool for image work that must not block requests:
+    generating variants and deleting unreferenced files. Each job runs in
+    its own app context.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-pipeline')
+
+    def submit(self, fn, *args):
+        return self._executor.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        with self.app.app_context():
+            try:
+                fn(*args)
+            except Exception:
+                self.app.logger.exception("Image job %s%r failed", fn.__name__, args)
+                db.session.rollback()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def pipeline():
+    return current_app.extensions['image_pipeline']
+
+
+def migrate_legacy_images():
+    """
+    Moves images stored before content addressing into the blob store and
+    queues their variants. Returns the number of recipes migrated.
+    """
+    migrated = 0
+    recipes = Recipe.query.filter(Recipe.image_hash.is_(None), Recipe.image_filename.isnot(None)).all()
+    for recipe in recipes:
+        legacy_filename = recipe.image_filename
+        path = _absolute(legacy_filename)
+        if not os.path.exists(path) or '.' not in legacy_filename:
+            continue
+        with open(path, 'rb') as source:
+            temp_path, sha256, size = _hash_to_temp(source)
+        ext = legacy_filename.rsplit('.', 1)[1].lower()
+        recipe.image_hash = sha256
+        recipe.image_filename = store_file(temp_path, sha256, size, 'jpg' if ext == 'jpeg' else ext)
+        db.session.commit()
+        place_after_commit()
+        if db.session.query(Recipe.id).filter_by(image_filename=legacy_filename).first() is None:
+            os.remove(path)
+        process_after_commit(sha256)
+        migrated += 1
+    return migrated
+
+
+def init_app(app):
+    app.extensions['image_pipeline'] = ImagePipeline(app, app.config.get('IMAGE_WORKERS', 2))
+    app.teardown_appcontext(_discard_staged)
+
+    @app.cli.command('migrate-images')
+    def migrate_images_command():
+        """Move legacy uploads into the content-addressed store and build variants."""
+        count = migrate_legacy_images()
+        pipeline().shutdown(wait=True)
+        click.echo(f'Migrated {count} images.')
+
+    @app.cli.command('regenerate-image-variants')
+    def regenerate_image_variants_command():
+        """Regenerate resized variants for every stored image."""
+        ImageBlob.query.update({ImageBlob.status: 'pending'})
+        db.session.commit()
+        for (sha256,) in db.session.query(ImageBlob.sha256):
+            process_after_commit(sha256)
+        pipeline().shutdown(wait=True)
+        click.echo('Image variants regenerated.')
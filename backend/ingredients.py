@@ -0,0 +1,230 @@
+# ingredients.py
+import re
+
+import click
+from sqlalchemy import and_, exists, func, select
+
+from models import db, Recipe, Ingredient, RecipeIngredient, insert_ignore, chunked
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def canonicalize(name):
+    """
+    Returns the canonical form of an ingredient name: trimmed, lowercased and
+    with runs of whitespace collapsed to a single space.
+    """
+    return _WHITESPACE.sub(' ', name.strip()).lower()
+
+
+def split_ingredients(text):
+    """
+    Splits a comma-separated ingredient string into (canonical, display)
+    pairs, dropping blanks and repeated ingredients.
+    """
+    seen = set()
+    pairs = []
+    for part in (text or '').split(','):
+        display = _WHITESPACE.sub(' ', part.strip())
+        canonical = display.lower()
+        if canonical and canonical not in seen:
+            seen.add(canonical)
+            pairs.append((canonical, display))
+    return pairs
+
+
+def parse_ingredient_list(raw):
+    """
+    Parses a comma-separated query argument into a list of canonical names.
+    """
+    return [canonical for canonical, _ in split_ingredients(raw)]
+
+
+def ingredient_ids(names, create=False):
+    """
+    Maps canonical ingredient names to ids. With `create`, missing names are
+    inserted first; otherwise they are left out of the result.
+    """
+    names = set(names)
+    if not names:
+        return {}
+    if create:
+        db.session.execute(insert_ignore(Ingredient.__table__), [{'name': name, 'recipe_count': 0} for name in names])
+    ids = {}
+    for chunk in chunked(names):
+        ids.update(db.session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(chunk)))
+    return ids
+
+
+def _adjust_counts(ids, delta):
+    if ids:
+        db.session.execute(
+            Ingredient.__table__.update()
+            .where(Ingredient.id.in_(ids))
+            .values(recipe_count=Ingredient.recipe_count + delta)
+        )
+
+
+def sync_recipe_ingredients(recipe_id, text):
+    """
+    Replaces a recipe's normalized ingredient rows with those parsed from
+    `text` and keeps the per-ingredient recipe counts up to date.
+    Runs inside the caller's transaction.
+    """
+    pairs = split_ingredients(text)
+    ids = ingredient_ids([canonical for canonical, _ in pairs], create=True)
+
+    old_ids = {row[0] for row in db.session.query(RecipeIngredient.ingredient_id).filter_by(recipe_id=recipe_id)}
+    new_ids = set(ids.values())
+
+    db.session.execute(RecipeIngredient.__table__.delete().where(RecipeIngredient.recipe_id == recipe_id))
+    if pairs:
+        db.session.execute(RecipeIngredient.__table__.insert(), [
+            {'recipe_id': recipe_id, 'ingredient_id': ids[canonical], 'position': position, 'display': display}
+            for position, (canonical, display) in enumerate(pairs)
+        ])
+    _adjust_counts(old_ids - new_ids, -1)
+    _adjust_counts(new_ids - old_ids, 1)
+
+
+def _insert_recipe_ingredients(texts):
+    """
+    Parses {recipe_id: ingredient text} and inserts the rows for all of them
+    with one executemany. Returns the inserted ingredient ids, one per row.
+    """
+    parsed = {recipe_id: split_ingredients(text) for recipe_id, text in texts.items()}
+    ids = ingredient_ids({canonical for pairs in parsed.values() for canonical, _ in pairs}, create=True)
+    values = [
+        {'recipe_id': recipe_id, 'ingredient_id': ids[canonical], 'position': position, 'display': display}
+        for recipe_id, pairs in parsed.items()
+        for position, (canonical, display) in enumerate(pairs)
+    ]
+    if values:
+        db.session.execute(RecipeIngredient.__table__.insert(), values)
+    return [value['ingredient_id'] for value in values]
+
+
+def add_recipe_ingredients(texts):
+    """
+    Indexes the ingredients of many new recipes at once, given
+    {recipe_id: ingredient text}. Runs inside the caller's transaction.
+    """
+    increments = {}
+    for ingredient_id in _insert_recipe_ingredients(texts):
+        increments[ingredient_id] = increments.get(ingredient_id, 0) + 1
+    by_count = {}
+    for ingredient_id, count in increments.items():
+        by_count.setdefault(count, []).append(ingredient_id)
+    for count, ingredient_ids in by_count.items():
+        for chunk in chunked(ingredient_ids):
+            _adjust_counts(chunk, count)
+
+
+def delete_recipe_ingredients(recipe_ids):
+    """
+    Removes recipes from the ingredient index. Ingredient counts are lowered
+    with one UPDATE per distinct decrement rather than one per recipe.
+    Runs inside the caller's transaction.
+    """
+    for chunk in chunked(recipe_ids):
+        decrements = {}
+        rows = db.session.query(RecipeIngredient.ingredient_id, func.count()) \
+            .filter(RecipeIngredient.recipe_id.in_(chunk)) \
+            .group_by(RecipeIngredient.ingredient_id)
+        for ingredient_id, count in rows:
+            decrements.setdefault(count, []).append(ingredient_id)
+        db.session.execute(RecipeIngredient.__table__.delete().where(RecipeIngredient.recipe_id.in_(chunk)))
+        for count, ingredient_ids in decrements.items():
+            _adjust_counts(ingredient_ids, -count)
+
+
+def find_recipe_ids(all_of=(), any_of=(), none_of=(), before_id=None, limit=24):
+    """
+    Returns up to `limit` recipe ids (newest first) whose ingredients include
+    every name in `all_of`, at least one name in `any_of` and none of the
+    names in `none_of`.
+
+    The scan is driven by the posting list of the rarest required ingredient
+    (or the union of the `any_of` lists, or the recipe table when neither is
+    given); every other condition is an indexed EXISTS probe per candidate.
+    Because candidates come out of the (ingredient_id, recipe_id) index in id
+    order, the query stops as soon as `limit` matches are found.
+    """
+    all_of, any_of, none_of = set(all_of), set(any_of), set(none_of)
+    ids = ingredient_ids(all_of | any_of | none_of)
+
+    if any(name not in ids for name in all_of):
+        return []
+    any_ids = [ids[name] for name in any_of if name in ids]
+    if any_of and not any_ids:
+        return []
+    none_ids = [ids[name] for name in none_of if name in ids]
+    required = [ids[name] for name in all_of]
+
+    driver = RecipeIngredient.__table__.alias('driver')
+    if required:
+        counts = dict(db.session.query(Ingredient.id, Ingredient.recipe_count).filter(Ingredient.id.in_(required)))
+        rarest = min(required, key=lambda ingredient_id: counts.get(ingredient_id, 0))
+        required.remove(rarest)
+        recipe_col = driver.c.recipe_id
+        query = select(recipe_col).where(driver.c.ingredient_id == rarest)
+    elif any_ids:
+        recipe_col = driver.c.recipe_id
+        query = select(recipe_col).where(driver.c.ingredient_id.in_(any_ids)).distinct()
+        any_ids = []
+    else:
+        recipe_col = Recipe.id
+        query = select(recipe_col)
+
+    def has(ingredient_filter):
+        probe = RecipeIngredient.__table__.alias()
+        return exists().where(and_(probe.c.recipe_id == recipe_col, ingredient_filter(probe)))
+
+    for ingredient_id in required:
+        query = query.where(has(lambda probe, i=ingredient_id: probe.c.ingredient_id == i))
+    if any_ids:
+        query = query.where(has(lambda probe: probe.c.ingredient_id.in_(any_ids)))
+    if none_ids:
+        query = query.where(~has(lambda probe: probe.c.ingredient_id.in_(none_ids)))
+    if before_id is not None:
+        query = query.where(recipe_col < before_id)
+
+    query = query.order_by(recipe_col.desc()).limit(limit)
+    return [row[0] for row in db.session.execute(query)]
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuilds the normalized ingredient tables from Recipe.ingredients.
+    """
+    db.session.execute(RecipeIngredient.__table__.delete())
+    db.session.execute(Ingredient.__table__.delete())
+    last_id = 0
+    while True:
+        rows = db.session.query(Recipe.id, Recipe.ingredients) \
+            .filter(Recipe.id > last_id).order_by(Recipe.id).limit(batch_size).all()
+        if not rows:
+            break
+        _insert_recipe_ingredients(dict(rows))
+        last_id = rows[-1][0]
+
+    counts = select(func.count()).where(RecipeIngredient.ingredient_id == Ingredient.id).scalar_subquery()
+    db.session.execute(Ingredient.__table__.update().values(recipe_count=counts))
+    db.session.commit()
+
+
+def init_app(app):
+    """
+    Registers the CLI command and backfills the index for databases created
+    before ingredients were normalized.
+    """
+    @app.cli.command('rebuild-ingredient-index')
+    def rebuild_ingredient_index_command():
+        """Rebuild the normalized ingredient index from recipe rows."""
+        rebuild_index()
+        click.echo('Ingredient index rebuilt.')
+
+    with app.app_context():
+        if db.session.query(RecipeIngredient.recipe_id).first() is None \
+                and db.session.query(Recipe.id).filter(Recipe.ingredients != '').first() is not None:
+            rebuild_index()
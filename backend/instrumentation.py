@@ -0,0 +1,263 @@
+# instrumentation.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+
+from models import db
+
+# Upper bounds of the latency histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the SQL statements-per-request histogram buckets
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+# Statements kept per request for the slow-request log
+MAX_RECORDED_STATEMENTS = 200
+
+
+class RequestStats:
+    """
+    What one request spent its time on. Lives in `g` for the length of the
+    request; SQL statements run by background threads are not counted.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.statements = []
+
+    def record_statement(self, statement, seconds):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append((seconds, statement))
+
+
+def current_stats():
+    """
+    Returns the RequestStats of the current request, or None outside one.
+    """
+    if not has_app_context():
+        return None
+    return g.get('request_stats')
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Adds the time spent in the block to the request's serialization time.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.serialize_seconds += time.perf_counter() - started
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Per-process request metrics, rendered in the Prometheus text format.
+    With several worker processes each one reports its own numbers, so
+    scrape them per worker or add them up in Prometheus.
+    """
+
+    HISTOGRAMS = {
+        'recipe_app_request_duration_seconds': ('Request latency.', DURATION_BUCKETS),
+        'recipe_app_request_sql_statements': ('SQL statements per request.', STATEMENT_BUCKETS),
+        'recipe_app_request_sql_duration_seconds': ('Time spent in SQL per request.', DURATION_BUCKETS),
+        'recipe_app_request_serialize_duration_seconds': ('Time spent serializing per request.', DURATION_BUCKETS),
+    }
+    COUNTERS = {
+        'recipe_app_slow_requests_total': 'Requests slower than SLOW_REQUEST_SECONDS.',
+        'recipe_app_sql_budget_exceeded_total': 'Requests that ran more than SQL_QUERY_BUDGET statements.',
+        'recipe_app_password_hash_rejected_total': 'Logins and registrations refused because password hashing was saturated.',
+        'recipe_app_admission_rejected_total': 'Requests shed with a 503 because their priority class was saturated.',
+        'recipe_app_rate_limited_total': 'Requests refused with a 429 by a per-user rate limit.',
+    }
+    # Current values, read from the collectors at render time
+    GAUGES = {
+        'recipe_app_admission_inflight': 'Requests running per priority class.',
+        'recipe_app_admission_queue_depth': 'Requests waiting for a slot per priority class.',
+        'recipe_app_admission_limit': 'Current adaptive concurrency limit per priority class.',
+    }
+
+    def __init__(self):
+        self._histograms = {name: {} for name in self.HISTOGRAMS}
+        self._counters = {name: {} for name in self.COUNTERS}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collector):
+        """
+        Registers a callable returning (gauge name, labels, value) tuples.
+        """
+        self._collectors.append(collector)
+
+    def reset(self):
+        """
+        Clears every histogram and counter, e.g. after warm-up requests.
+        """
+        with self._lock:
+            for series in list(self._histograms.values()) + list(self._counters.values()):
+                series.clear()
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(self.HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def increment(self, name, labels):
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in self.HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+            for name, help_text in self.COUNTERS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        gauges = {name: [] for name in self.GAUGES}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                gauges[name].append((labels, value))
+        for name, help_text in self.GAUGES.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for labels, value in sorted(gauges[name]):
+                lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record_statement(statement, time.perf_counter() - started)
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def _server_timing(stats, total):
+    return (
+        f'app;dur={total * 1000:.1f}, '
+        f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} statements", '
+        f'serialize;dur={stats.serialize_seconds * 1000:.1f}'
+    )
+
+
+def _log_slow_request(stats, endpoint, total):
+    slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)[:10]
+    details = ''.join(f'\n  {seconds * 1000:8.1f} ms  {" ".join(statement.split())}' for seconds, statement in slowest)
+    current_app.logger.warning(
+        "Slow request %s %s (%s): %.0f ms, %d SQL statements in %.0f ms, serialization %.0f ms. Slowest statements:%s",
+        request.method, request.path, endpoint, total * 1000,
+        stats.sql_count, stats.sql_seconds * 1000, stats.serialize_seconds * 1000, details
+    )
+
+
+def _finish_request(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    metrics = current_app.extensions['metrics']
+    metrics.observe('recipe_app_request_duration_seconds',
+                    (('endpoint', endpoint), ('method', request.method), ('status', response.status_code)), total)
+    labels = (('endpoint', endpoint),)
+    metrics.observe('recipe_app_request_sql_statements', labels, stats.sql_count)
+    metrics.observe('recipe_app_request_sql_duration_seconds', labels, stats.sql_seconds)
+    metrics.observe('recipe_app_request_serialize_duration_seconds', labels, stats.serialize_seconds)
+
+    budget = current_app.config['SQL_QUERY_BUDGET']
+    if budget and stats.sql_count > budget:
+        metrics.increment('recipe_app_sql_budget_exceeded_total', labels)
+        current_app.logger.warning(
+            "Route %s (%s %s) ran %d SQL statements, over the budget of %d",
+            endpoint, request.method, request.path, stats.sql_count, budget
+        )
+    slow = current_app.config['SLOW_REQUEST_SECONDS']
+    if slow and total > slow:
+        metrics.increment('recipe_app_slow_requests_total', labels)
+        _log_slow_request(stats, endpoint, total)
+    if current_app.config['SERVER_TIMING_HEADER']:
+        response.headers['Server-Timing'] = _server_timing(stats, total)
+    return response
+
+
+def init_app(app):
+    """
+    Times every request and counts its SQL statements and serialization
+    time. Results go to GET /metrics, a Server-Timing header, a warning for
+    routes over SQL_QUERY_BUDGET and a log entry for slow requests. Streamed
+    responses are measured up to the first byte.
+    """
+    app.extensions['metrics'] = Metrics()
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    app.after_request(_finish_request)
+
+    if app.config['METRICS_ENABLED']:
+        @app.route('/metrics')
+        def metrics():
+            return Response(app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,75 @@
+# json_provider.py
+from flask.json.provider import DefaultJSONProvider, _default
+
+from instrumentation import timed_serialization
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Flask's standard json provider, counting encoding time as serialization
+    (see instrumentation.py).
+    """
+
+    def dumps(self, obj, **kwargs):
+        with timed_serialization():
+            return super().dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj):
+        """
+        Compact UTF-8 JSON, for building response bodies by concatenation.
+        """
+        return self.dumps(obj, separators=(',', ':')).encode()
+
+
+class OrjsonProvider(TimedJSONProvider):
+    """
+    json provider backed by the optional `orjson` package. Output matches
+    the standard provider (sorted keys, Flask's encoding of dates, UUIDs and
+    dataclasses) except that non-ASCII text is written as UTF-8 instead of
+    being escaped.
+    """
+
+    def __init__(self, app):
+        try:
+            import orjson
+        except ImportError:
+            raise RuntimeError("JSON_PROVIDER='orjson' requires the orjson package.")
+        super().__init__(app)
+        self._orjson = orjson
+        self._options = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj):
+        with timed_serialization():
+            return self._orjson.dumps(obj, default=_default, option=self._options)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    'default': TimedJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def init_app(app):
+    """
+    Installs the json provider named by JSON_PROVIDER as `app.json`.
+    """
+    name = app.config.get('JSON_PROVIDER', 'default')
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown JSON_PROVIDER: {name}")
+    app.json = PROVIDERS[name](app)
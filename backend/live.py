@@ -0,0 +1,471 @@
+# live.py
+import asyncio
+import json
+import socket
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from flask import current_app, jsonify, request
+
+from models import db, Recipe, chunked
+import changelog
+
+LIKES = 'likes'
+UPDATE = 'update'
+DELETE = 'delete'
+
+STREAM_PATH = '/api/recipes/stream'
+# Longest request head the stream server reads (the id list is in the URL)
+_MAX_REQUEST_BYTES = 16 * 1024
+_REQUEST_TIMEOUT = 10
+# Several worker processes can serve the same port; the kernel spreads
+# connections between them
+_REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+# Client reconnection delay sent with every stream, in milliseconds
+_RETRY_MS = 5000
+
+_STREAM_HEADERS = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/event-stream\r\n'
+    b'Cache-Control: no-cache\r\n'
+    b'Connection: close\r\n'
+    b'Access-Control-Allow-Origin: *\r\n'
+    b'X-Accel-Buffering: no\r\n'
+    b'\r\n'
+)
+# State of a recipe whose baseline has not been loaded yet
+_UNKNOWN = object()
+_STATUS_TEXT = {400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+
+def load_states(recipe_ids):
+    """
+    Returns {recipe_id: (likes, version)} for the recipes that exist. Like
+    increments still buffered in this process are included.
+    """
+    buffer = current_app.extensions.get('like_counter')
+    states = {}
+    for chunk in chunked(recipe_ids):
+        rows = db.session.query(Recipe.id, Recipe.likes, Recipe.version).filter(Recipe.id.in_(chunk))
+        for recipe_id, likes, version in rows:
+            likes = likes or 0
+            if buffer is not None:
+                likes += buffer.pending(recipe_id)
+            states[recipe_id] = (max(0, likes), version)
+    return states
+
+
+def parse_ids(value, max_ids):
+    try:
+        ids = {int(part) for part in value.split(',') if part}
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of recipe ids.")
+    if not ids:
+        raise ValueError("ids is required.")
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} recipe ids per stream.")
+    return ids
+
+
+def encode_event(kind, data):
+    return f'event: {kind}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+class Broker:
+    """
+    Delivers the ids of changed recipes to a LiveHub. `publish` is called
+    by request threads once their transaction has committed; `start` runs
+    on the hub's event loop.
+    """
+
+    hub = None
+
+    def start(self, hub):
+        self.hub = hub
+
+    def publish(self, recipe_ids):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """
+    Hands changes straight to the hub of this process. It only sees the
+    changes made by this process, so it suits a single worker.
+    """
+
+    def publish(self, recipe_ids):
+        self.hub.mark_threadsafe(recipe_ids)
+
+
+class ChangeLogBroker(LocalBroker):
+    """
+    Also polls the recipe change log every `interval` seconds, so changes
+    made by any worker, and like counts flushed by write-behind buffers,
+    reach the subscribers of every worker. Changes made by this process
+    are still delivered at once.
+    """
+
+    def __init__(self, interval=1.0, page_size=500):
+        self.interval = interval
+        self.page_size = page_size
+
+    def start(self, hub):
+        super().start(hub)
+        hub.loop.create_task(self._poll())
+
+    async def _poll(self):
+        since = None
+        while True:
+            try:
+                if since is None:
+                    since = await self.hub.run_in_app(changelog.latest_seq)
+                else:
+                    since = await self.hub.run_in_app(self._read, since)
+            except Exception:
+                self.hub.app.logger.exception("Polling the recipe change log failed")
+            await asyncio.sleep(self.interval)
+
+    def _read(self, since):
+        while True:
+            batch = changelog.read_changes(since, self.page_size)
+            if batch.resync:
+                self.hub.mark_threadsafe(None)
+                return batch.next_since
+            self.hub.mark_threadsafe(batch.upserted + batch.deleted)
+            since = batch.next_since
+            if not batch.has_more:
+                return since
+
+
+class _Subscriber:
+    def __init__(self, ids):
+        self.ids = ids
+        # Newest unsent event per recipe, so a slow client never queues
+        # more than one event per recipe it watches
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, recipe_id, event):
+        self.pending[recipe_id] = event
+        self.ready.set()
+
+
+class LiveHub:
+    """
+    Server-sent event fan-out of recipe changes. It runs an asyncio server
+    on its own thread, so an open stream costs a coroutine rather than a
+    request thread.
+
+    Clients connect to GET /api/recipes/stream?ids=1,2,3 and receive
+    `likes`, `update` and `delete` events for those recipes. The broker
+    marks changed recipes dirty. A dirty recipe that someone watches is
+    loaded and announced at most once per `min_interval` seconds, so a
+    burst of likes becomes one event with the latest count. An event is
+    only sent when the loaded state differs from the last one announced.
+    """
+
+    def __init__(self, app, broker, min_interval=1.0, heartbeat=15.0, max_ids=500, max_connections=10000):
+        self.app = app
+        self.broker = broker
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+        self.max_ids = max_ids
+        self.max_connections = max_connections
+        self.loop = None
+        self.connections = 0
+        self.events_sent = 0
+        self._server = None
+        self._start_lock = threading.Lock()
+        # Database work runs off the event loop, one call at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='live-load')
+        self._watchers = defaultdict(set)
+        # Last announced (likes, version) per watched recipe; None once deleted
+        self._states = {}
+        self._dirty = set()
+        self._last_loaded = {}
+        self._wakeup = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    def ensure_started(self, host, port):
+        """
+        Binds the stream server and starts the event loop thread, once.
+        Raises OSError if the port cannot be bound.
+        """
+        with self._start_lock:
+            if self.running:
+                return
+            started = threading.Event()
+            errors = []
+            thread = threading.Thread(target=self._run, args=(host, port, started, errors), name='live-stream', daemon=True)
+            thread.start()
+            started.wait()
+            if errors:
+                raise errors[0]
+
+    def _run(self, host, port, started, errors):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(asyncio.start_server(
+                self._handle, host, port, limit=_MAX_REQUEST_BYTES, reuse_port=_REUSE_PORT))
+        except OSError as e:
+            errors.append(e)
+            started.set()
+            self.loop.close()
+            return
+        self._wakeup = asyncio.Event()
+        self.broker.start(self)
+        self.loop.create_task(self._flush())
+        self._server = server
+        started.set()
+        self.loop.run_forever()
+
+    def stop(self):
+        if self.running:
+            self._server.close()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def run_in_app(self, function, *args):
+        """
+        Runs `function` inside an app context on the database thread and
+        returns an awaitable for its result.
+        """
+        def call():
+            with self.app.app_context():
+                return function(*args)
+        return self.loop.run_in_executor(self._executor, call)
+
+    def mark_threadsafe(self, recipe_ids):
+        """
+        Marks recipes as changed from any thread. None marks every watched
+        recipe, e.g. after a change-log resync.
+        """
+        self.loop.call_soon_threadsafe(self._mark, None if recipe_ids is None else list(recipe_ids))
+
+    def _mark(self, recipe_ids):
+        if recipe_ids is None:
+            recipe_ids = self._watchers
+        self._dirty.update(recipe_id for recipe_id in recipe_ids if recipe_id in self._watchers)
+        if self._dirty:
+            self._wakeup.set()
+
+    async def _flush(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            now = self.loop.time()
+            due, retry_at = [], None
+            for recipe_id in list(self._dirty):
+                ready_at = self._last_loaded.get(recipe_id, 0) + self.min_interval
+                if recipe_id not in self._watchers:
+                    self._dirty.discard(recipe_id)
+                elif ready_at <= now:
+                    self._dirty.discard(recipe_id)
+                    due.append(recipe_id)
+                else:
+                    retry_at = ready_at if retry_at is None else min(retry_at, ready_at)
+            if due:
+                for recipe_id in due:
+                    self._last_loaded[recipe_id] = now
+                try:
+                    self._announce(due, await self.run_in_app(load_states, due))
+                except Exception:
+                    self.app.logger.exception("Loading %d changed recipes for the live stream failed", len(due))
+                    self._dirty.update(due)
+                    retry_at = now + self.min_interval
+            if retry_at is not None:
+                self.loop.call_at(retry_at, self._wakeup.set)
+
+    def _announce(self, recipe_ids, states):
+        for recipe_id in recipe_ids:
+            watchers = self._watchers.get(recipe_id)
+            if not watchers:
+                continue
+            state = states.get(recipe_id)
+            previous = self._states.get(recipe_id, _UNKNOWN)
+            if state == previous:
+                continue
+            self._states[recipe_id] = state
+            if state is None:
+                event = encode_event(DELETE, {'id': recipe_id})
+            elif previous is None or (previous is not _UNKNOWN and previous[1] != state[1]):
+                event = encode_event(UPDATE, {'id': recipe_id, 'likes': state[0]})
+            else:
+                event = encode_event(LIKES, {'id': recipe_id, 'likes': state[0]})
+            for subscriber in watchers:
+                subscriber.push(recipe_id, event)
+
+    async def _watch(self, subscriber):
+        for recipe_id in subscriber.ids:
+            self._watchers[recipe_id].add(subscriber)
+        # Record the current state of recipes nobody watched yet, so the
+        # first change can be told apart as a like or an edit
+        unknown = [recipe_id for recipe_id in subscriber.ids if recipe_id not in self._states]
+        if unknown:
+            states = await self.run_in_app(load_states, unknown)
+            for recipe_id in unknown:
+                if recipe_id in self._watchers:
+                    self._states.setdefault(recipe_id, states.get(recipe_id))
+
+    def _unwatch(self, subscriber):
+        for recipe_id in subscriber.ids:
+            watchers = self._watchers.get(recipe_id)
+            if watchers is None:
+                continue
+            watchers.discard(subscriber)
+            if not watchers:
+                del self._watchers[recipe_id]
+                self._states.pop(recipe_id, None)
+                self._last_loaded.pop(recipe_id, None)
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), _REQUEST_TIMEOUT)
+            method, target, _ = head.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError, ValueError):
+            writer.close()
+            return
+        url = urlsplit(target)
+        if url.path != STREAM_PATH:
+            return await self._reply_error(writer, 404, "Not found.")
+        if method != 'GET':
+            return await self._reply_error(writer, 405, "Method not allowed.")
+        try:
+            ids = parse_ids(parse_qs(url.query).get('ids', [''])[0], self.max_ids)
+        except ValueError as e:
+            return await self._reply_error(writer, 400, str(e))
+        if self.connections >= self.max_connections:
+            return await self._reply_error(writer, 503, "Too many live connections.")
+
+        subscriber = _Subscriber(ids)
+        self.connections += 1
+        try:
+            writer.write(_STREAM_HEADERS + f'retry: {_RETRY_MS}\n\n'.encode())
+            await self._watch(subscriber)
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from timing the stream out and finds
+                    # clients that went away
+                    writer.write(b': ping\n\n')
+                else:
+                    subscriber.ready.clear()
+                    events, subscriber.pending = subscriber.pending, {}
+                    writer.write(b''.join(events.values()))
+                    self.events_sent += len(events)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        except Exception:
+            self.app.logger.exception("Live stream failed")
+        finally:
+            self.connections -= 1
+            self._unwatch(subscriber)
+            writer.close()
+
+    async def _reply_error(self, writer, status, message):
+        body = json.dumps({'message': message}).encode()
+        writer.write(
+            f'HTTP/1.1 {status} {_STATUS_TEXT[status]}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Access-Control-Allow-Origin: *\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'connections': self.connections,
+            'watched_recipes': len(self._watchers),
+            'dirty_recipes': len(self._dirty),
+            'events_sent': self.events_sent,
+        }
+
+
+def publish(recipe_ids):
+    """
+    Reports changed (created, edited, liked or deleted) recipes to the live
+    stream. Call after the transaction has committed.
+    """
+    hub = current_app.extensions.get('live_hub')
+    if hub is not None and hub.running:
+        hub.broker.publish(recipe_ids)
+
+
+def stream_url():
+    """
+    Returns the URL of the stream server, starting it on first use, or
+    None when live updates are disabled or the port cannot be bound.
+    Outside debug mode RECIPE_STREAM_URL must be set: a URL derived from
+    the request's host would point remote clients at a port that is bound
+    to localhost and skip the proxy that terminates TLS.
+    """
+    hub = current_app.extensions.get('live_hub')
+    if hub is None:
+        return None
+    if not current_app.config['RECIPE_STREAM_URL'] and not current_app.debug:
+        current_app.logger.error(
+            "Live updates need RECIPE_STREAM_URL: the public URL that a proxy routes to "
+            "RECIPE_STREAM_HOST:RECIPE_STREAM_PORT"
+        )
+        return None
+    try:
+        hub.ensure_started(current_app.config['RECIPE_STREAM_HOST'], current_app.config['RECIPE_STREAM_PORT'])
+    except OSError:
+        current_app.logger.exception("Could not start the live stream server")
+        return None
+    if current_app.config['RECIPE_STREAM_URL']:
+        return current_app.config['RECIPE_STREAM_URL']
+    host = urlsplit(request.host_url).hostname
+    if ':' in host:
+        host = f'[{host}]'
+    return f'{request.scheme}://{host}:{hub.port}{STREAM_PATH}'
+
+
+def create_broker(app):
+    kind = app.config.get('RECIPE_STREAM_BROKER', 'local')
+    if kind == 'local':
+        return LocalBroker()
+    if kind == 'changelog':
+        return ChangeLogBroker(app.config['RECIPE_STREAM_POLL_INTERVAL'], app.config['RECIPE_CHANGES_PAGE_SIZE'])
+    raise ValueError(f"Unknown RECIPE_STREAM_BROKER: {kind}")
+
+
+def init_app(app, broker=None):
+    """
+    Creates the live-update hub unless RECIPE_STREAM_ENABLED is off. Its
+    server starts on the first GET /api/recipes/stream, so CLI commands
+    never bind the port. Pass `broker` to plug in any Broker implementation.
+    """
+    if not app.config['RECIPE_STREAM_ENABLED']:
+        return
+    if broker is None:
+        broker = create_broker(app)
+    app.extensions['live_hub'] = LiveHub(
+        app,
+        broker,
+        min_interval=app.config['RECIPE_STREAM_MIN_INTERVAL'],
+        heartbeat=app.config['RECIPE_STREAM_HEARTBEAT'],
+        max_ids=app.config['RECIPE_STREAM_MAX_IDS'],
+        max_connections=app.config['RECIPE_STREAM_MAX_CONNECTIONS'],
+    )
+
+    @app.route('/api/recipes/stream/stats')
+    def live_stream_stats():
+        return jsonify(app.extensions['live_hub'].stats())
@@ -0,0 +1,192 @@
+# migrations.py
+import datetime
+import re
+import sys
+
+import click
+from sqlalchemy import inspect, text
+
+from models import db
+
+# Versioned schema changes for databases created by older versions of the
+# app. db.create_all() only creates missing tables, so every change to an
+# existing table (new column, new index) gets a migration here. Migrations
+# run in order, each in its own transaction, and must be safe to re-run
+# (use IF NOT EXISTS / check before altering), because a database upgraded
+# before versioning existed may already contain some of their changes.
+# A newly created database gets every table and index from the models and is
+# stamped with the latest version without running anything.
+
+_CREATE_VERSION_TABLE = text(
+    "CREATE TABLE IF NOT EXISTS schema_migration ("
+    "  version INTEGER PRIMARY KEY,"
+    "  name VARCHAR(100) NOT NULL,"
+    "  applied_at TIMESTAMP NOT NULL"
+    ")"
+)
+
+
+def _add_column(connection, table, column, ddl):
+    existing = {c['name'] for c in inspect(connection).get_columns(table)}
+    if column not in existing:
+        connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}'))
+
+
+def _create_index(connection, name, table, columns):
+    connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+
+
+def _versioning_columns(connection):
+    _add_column(connection, 'user', 'state_version', "INTEGER NOT NULL DEFAULT 0")
+    _add_column(connection, 'recipe', 'updated_at', "TIMESTAMP")
+    _add_column(connection, 'recipe', 'version', "INTEGER NOT NULL DEFAULT 1")
+    _add_column(connection, 'recipe', 'image_hash', "VARCHAR(64)")
+    _create_index(connection, 'ix_recipe_image_hash', 'recipe', ['image_hash'])
+
+
+def _reverse_association_indexes(connection):
+    _create_index(connection, 'ix_user_saved_recipes_recipe_user', 'user_saved_recipes', ['recipe_id', 'user_id'])
+    _create_index(connection, 'ix_user_liked_recipes_recipe_user', 'user_liked_recipes', ['recipe_id', 'user_id'])
+
+
+def _feed_indexes(connection):
+    _create_index(connection, 'ix_recipe_created_at_id', 'recipe', ['created_at', 'id'])
+    _create_index(connection, 'ix_recipe_likes_id', 'recipe', ['likes', 'id'])
+    _create_index(connection, 'ix_recipe_creator_id', 'recipe', ['creator_id'])
+
+
+def _widen_password_hash(connection):
+    # scrypt hashes are longer than 128 characters; SQLite does not enforce VARCHAR lengths
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+
+
+# (version, name, function taking a connection). Append only.
+MIGRATIONS = [
+    (1, 'versioning and image columns', _versioning_columns),
+    (2, 'reverse association indexes', _reverse_association_indexes),
+    (3, 'feed and creator indexes', _feed_indexes),
+    (4, 'wider password hashes', _widen_password_hash),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    return connection.execute(text("SELECT max(version) FROM schema_migration")).scalar() or 0
+
+
+def _record(connection, version, name):
+    connection.execute(
+        text("INSERT INTO schema_migration (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {'version': version, 'name': name, 'applied_at': datetime.datetime.utcnow()}
+    )
+
+
+def upgrade():
+    """
+    Creates missing tables and applies pending migrations.
+    Returns the list of (version, name) migrations that were applied.
+    """
+    engine = db.engine
+    fresh = not inspect(engine).has_table('recipe')
+    # Only the primary: the read bind is the same database or a replica
+    db.create_all(bind_key=None)
+    with engine.begin() as connection:
+        connection.execute(_CREATE_VERSION_TABLE)
+        if fresh and current_version(connection) == 0:
+            for version, name, _ in MIGRATIONS:
+                _record(connection, version, name)
+            return []
+
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        with engine.begin() as connection:
+            if version <= current_version(connection):
+                continue
+            migrate(connection)
+            _record(connection, version, name)
+        applied.append((version, name))
+    return applied
+
+
+# Queries on hot paths, as the routes issue them. check_query_plans fails if
+# any of them has to scan a whole table, which means an index is missing.
+HOT_QUERIES = {
+    'feed by recent': (
+        "SELECT id FROM recipe WHERE created_at < :value OR (created_at = :value AND id < :id) "
+        "ORDER BY created_at DESC, id DESC LIMIT 25",
+        {'value': datetime.datetime(2024, 1, 1), 'id': 1}
+    ),
+    'feed by likes': (
+        "SELECT id FROM recipe WHERE likes < :value OR (likes = :value AND id < :id) "
+        "ORDER BY likes DESC, id DESC LIMIT 25",
+        {'value': 10, 'id': 1}
+    ),
+    'recipes by creator': ("SELECT id FROM recipe WHERE creator_id = :id", {'id': 1}),
+    'recipes by image': ("SELECT id FROM recipe WHERE image_hash = :sha", {'sha': ''}),
+    'savers of recipe': ("SELECT user_id FROM user_saved_recipes WHERE recipe_id = :id", {'id': 1}),
+    'likers of recipe': ("SELECT user_id FROM user_liked_recipes WHERE recipe_id = :id", {'id': 1}),
+    'saved by user': ("SELECT recipe_id FROM user_saved_recipes WHERE user_id = :id", {'id': 1}),
+    'liked by user': ("SELECT recipe_id FROM user_liked_recipes WHERE user_id = :id", {'id': 1}),
+    'recipes by ingredient': (
+        "SELECT recipe_id FROM recipe_ingredient WHERE ingredient_id = :id AND recipe_id < :before "
+        "ORDER BY recipe_id DESC LIMIT 25",
+        {'id': 1, 'before': 1000}
+    ),
+    'trending feed': (
+        "SELECT recipe.id FROM recipe JOIN recipe_trending ON recipe_trending.recipe_id = recipe.id "
+        "WHERE recipe_trending.score < :score OR (recipe_trending.score = :score AND recipe_trending.recipe_id < :id) "
+        "ORDER BY recipe_trending.score DESC, recipe_trending.recipe_id DESC LIMIT 25",
+        {'score': 1.0, 'id': 1}
+    ),
+    'expired uploads': ("SELECT token FROM upload_session WHERE updated_at < :cutoff", {'cutoff': datetime.datetime(2024, 1, 1)}),
+}
+
+# SQLite reports a full table scan as a bare "SCAN <table>"; scans through an
+# index say "USING INDEX" / "USING COVERING INDEX".
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def check_query_plans():
+    """
+    Runs EXPLAIN QUERY PLAN for each hot query.
+    Returns {query name: [full scan plan lines]} for the queries that fail.
+    Only SQLite plans are checked.
+    """
+    failures = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql), params)
+        scans = [row[-1] for row in rows if _FULL_SCAN.match(row[-1])]
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+def init_app(app):
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations."""
+        applied = upgrade()
+        for version, name in applied:
+            click.echo(f'Applied migration {version}: {name}')
+        click.echo(f'Schema is at version {LATEST_VERSION}.')
+
+    @app.cli.command('db-version')
+    def db_version_command():
+        """Show the schema version of the database."""
+        with db.engine.connect() as connection:
+            click.echo(f'Schema version {current_version(connection)} (latest {LATEST_VERSION}).')
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Fail if a hot query needs a full table scan."""
+        if db.engine.dialect.name != 'sqlite':
+            click.echo('Query plan checks only run against SQLite.')
+            return
+        failures = check_query_plans()
+        for name, scans in failures.items():
+            click.echo(f'{name}: {"; ".join(scans)}')
+        if failures:
+            sys.exit(1)
+        click.echo(f'All {len(HOT_QUERIES)} hot queries use an index.')
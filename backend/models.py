@@ -2,20 +2,25 @@
 import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy_serializer import SerializerMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from database import RoutingSession
 
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Keyed (user_id, recipe_id) for "what did this user save/like"; the reverse
+# index serves "who saved/liked this recipe".
 user_saved_recipes = db.Table(
     'user_saved_recipes',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('recipe_id', db.Integer, db.ForeignKey('recipe.id'), primary_key=True)
+    db.Column('recipe_id', db.Integer, db.ForeignKey('recipe.id'), primary_key=True),
+    db.Index('ix_user_saved_recipes_recipe_user', 'recipe_id', 'user_id')
 )
 
 user_liked_recipes = db.Table(
     'user_liked_recipes',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('recipe_id', db.Integer, db.ForeignKey('recipe.id'), primary_key=True)
+    db.Column('recipe_id', db.Integer, db.ForeignKey('recipe.id'), primary_key=True),
+    db.Index('ix_user_liked_recipes_recipe_user', 'recipe_id', 'user_id')
 )
 
 class User(db.Model, SerializerMixin):
@@ -23,7 +28,10 @@ class User(db.Model, SerializerMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
+    # Bumped whenever the user's liked or saved set changes; used as the
+    # validator for /api/me/recipe-state.
+    state_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     saved_recipes = db.relationship(
         'Recipe',
@@ -46,12 +54,6 @@ class User(db.Model, SerializerMixin):
         cascade='all, delete-orphan'
     )
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
     def __repr__(self):
         return f'<User {self.email}>'
 
@@ -66,26 +68,245 @@ class Recipe(db.Model, SerializerMixin):
     image_filename = db.Column(db.String(255), nullable=True)
     likes = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Last change of any kind, including the like count
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Content version, bumped when the recipe itself is edited (not on likes)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Content hash of the image in the blob store (see images.py); null for
+    # images uploaded before content addressing.
+    image_hash = db.Column(db.String(64), nullable=True, index=True)
 
     # Foreign key to link recipe to its creator
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    image_blob = db.relationship(
+        'ImageBlob',
+        primaryjoin='foreign(Recipe.image_hash) == ImageBlob.sha256',
+        viewonly=True
+    )
+
+    # Feed orders (see pagination.SORT_COLUMNS) and ownership lookups
+    __table_args__ = (
+        db.Index('ix_recipe_created_at_id', 'created_at', 'id'),
+        db.Index('ix_recipe_likes_id', 'likes', 'id'),
+        db.Index('ix_recipe_creator_id', 'creator_id'),
+    )
+
+    # Normalized ingredient rows, kept in sync by ingredients.sync_recipe_ingredients.
+    # The rows are written with set-based SQL, so the relationship is read-only.
+    ingredient_rows = db.relationship(
+        'RecipeIngredient',
+        order_by='RecipeIngredient.position',
+        viewonly=True
+    )
+
     serialize_only = ('id', 'title', 'description', 'ingredients', 'instructions', 'image_filename', 'likes', 'created_at', 'creator_id')
 
-    def to_dict(self):
-        # Override to_dict to handle ingredients as a list
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'ingredients': [i.strip() for i in self.ingredients.split(',')] if self.ingredients else [],
-            'instructions': self.instructions,
-            'image_filename': self.image_filename,
-            'likes': self.likes,
-            'created_at': self.created_at.isoformat(),
-            'creatorId': self.creator_id,
-            'creatorEmail': self.creator.email
-        }
+    def to_dict(self, fields=None, relations=None):
+        # Override to_dict to handle ingredients as a list.
+        # `fields` restricts the output to a subset of RECIPE_FIELDS so that
+        # deferred columns are never loaded for fields nobody asked for.
+        # `relations` supplies values for related-row fields that were
+        # batch-loaded up front (see serializers.serialize_recipes).
+        if fields is None:
+            fields = RECIPE_FIELDS
+        data = {}
+        for field in fields:
+            if relations is not None and field in relations:
+                data[field] = relations[field]
+            else:
+                data[field] = _RECIPE_FIELD_GETTERS[field](self)
+        return data
     
     def __repr__(self):
         return f'<Recipe {self.title}>'
+
+
+class Ingredient(db.Model):
+    __tablename__ = 'ingredient'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Canonical form: lowercased with whitespace collapsed (see ingredients.canonicalize)
+    name = db.Column(db.String(120), unique=True, nullable=False)
+    # Number of recipes using this ingredient, used to pick the rarest
+    # posting list when intersecting.
+    recipe_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Ingredient {self.name}>'
+
+class RecipeIngredient(db.Model):
+    __tablename__ = 'recipe_ingredient'
+
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id'), primary_key=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id'), primary_key=True)
+    # Position in the recipe's ingredient list and the text as the user wrote it
+    position = db.Column(db.Integer, nullable=False)
+    display = db.Column(db.String(255), nullable=False)
+
+    # Inverted index: ingredient -> recipes, in recipe id order
+    __table_args__ = (
+        db.Index('ix_recipe_ingredient_ingredient_recipe', 'ingredient_id', 'recipe_id'),
+    )
+
+
+# SQLite limits the number of bound parameters per statement, so IN lists are
+# split into chunks of this size.
+IN_CLAUSE_CHUNK_SIZE = 500
+
+
+def chunked(values, size=IN_CLAUSE_CHUNK_SIZE):
+    """
+    Yields successive lists of at most `size` items from `values`.
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class ImageBlob(db.Model):
+    __tablename__ = 'image_blob'
+
+    # Uploaded image content, stored once per distinct sha256 and shared by
+    # every recipe that uploaded the same bytes.
+    sha256 = db.Column(db.String(64), primary_key=True)
+    ext = db.Column(db.String(8), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    # 'pending' until the pipeline has run, then 'ready', 'original'
+    # (no image library available) or 'failed'
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    # Comma-separated widths of the generated variants
+    variant_widths = db.Column(db.String(64), nullable=True)
+    # Format of the non-WebP variants: 'jpg', or 'png' for images with alpha
+    fallback_format = db.Column(db.String(8), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    @staticmethod
+    def blob_path(sha256, ext):
+        return f'blobs/{sha256[:2]}/{sha256}.{ext}'
+
+    @staticmethod
+    def variant_path(sha256, width, fmt):
+        return f'variants/{sha256[:2]}/{sha256}-{width}.{fmt}'
+
+    def variants(self):
+        """
+        Returns the (width, format) pair of every generated variant.
+        """
+        if not self.variant_widths:
+            return []
+        widths = [int(w) for w in self.variant_widths.split(',')]
+        return [(w, fmt) for fmt in ('webp', self.fallback_format) for w in widths]
+
+    def to_dict(self):
+        # Original URL plus, once variants exist, a srcset string per format
+        info = {
+            'url': f'/uploads/{self.blob_path(self.sha256, self.ext)}',
+            'width': self.width,
+            'height': self.height,
+            'srcset': {},
+        }
+        for fmt in ('webp', self.fallback_format):
+            entries = [
+                f'/uploads/{self.variant_path(self.sha256, w, f)} {w}w'
+                for w, f in self.variants() if f == fmt
+            ]
+            if entries:
+                info['srcset'][fmt] = ', '.join(entries)
+        return info
+
+
+def image_field(blob, image_filename):
+    """
+    Value of a serialized recipe's `image` field.
+    """
+    if blob is not None:
+        return blob.to_dict()
+    if image_filename:
+        return {'url': f'/uploads/{image_filename}', 'width': None, 'height': None, 'srcset': {}}
+    return None
+
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_session'
+
+    # A resumable chunked upload (see upload_routes.py). The bytes live in
+    # UPLOAD_PARTIAL_FOLDER/<token>.part until a recipe claims them.
+    token = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Extension detected from the file's magic bytes, not its name
+    ext = db.Column(db.String(8), nullable=True)
+    total_size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.Integer, nullable=False, default=0)
+    sha256 = db.Column(db.String(64), nullable=True)
+    # 'open' while chunks are arriving, 'complete' once finalized
+    status = db.Column(db.String(16), nullable=False, default='open')
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'token': self.token,
+            'size': self.total_size,
+            'offset': self.received,
+            'status': self.status,
+            'sha256': self.sha256,
+        }
+
+
+class RecipeTrending(db.Model):
+    __tablename__ = 'recipe_trending'
+
+    # Precomputed time-decayed popularity (see trending.py). The trending
+    # feed reads recipes in (score, recipe_id) order from this table only.
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    scored_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_recipe_trending_score_recipe', 'score', 'recipe_id'),
+    )
+
+
+class Counter(db.Model):
+    __tablename__ = 'counter'
+
+    # Named, monotonically increasing values shared by all workers,
+    # e.g. the catalog version used as an HTTP validator.
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+def insert_ignore(table):
+    """
+    Returns an INSERT for `table` that silently skips rows which would violate
+    a primary key or unique constraint.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+
+_RECIPE_FIELD_GETTERS = {
+    'id': lambda r: r.id,
+    'title': lambda r: r.title,
+    'description': lambda r: r.description,
+    'ingredients': lambda r: [row.display for row in r.ingredient_rows],
+    'instructions': lambda r: r.instructions,
+    'image_filename': lambda r: r.image_filename,
+    'image': lambda r: image_field(r.image_blob, r.image_filename),
+    'likes': lambda r: r.likes,
+    'created_at': lambda r: r.created_at.isoformat(),
+    'creatorId': lambda r: r.creator_id,
+    'creatorEmail': lambda r: r.creator.email,
+}
+
+# Public field names of a serialized recipe, in response order.
+RECIPE_FIELDS = tuple(_RECIPE_FIELD_GETTERS)
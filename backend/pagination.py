@@ -0,0 +1,148 @@
+# pagination.py
+import base64
+import datetime
+import json
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+
+from models import Recipe, RECIPE_FIELDS
+
+# Sort orders supported by the recipe feed. Every order is a descending
+# (column, id) pair so the next page can be found with a single index seek,
+# no matter how deep into the feed the client is.
+SORT_COLUMNS = {
+    'recent': Recipe.created_at,
+    'likes': Recipe.likes,
+}
+
+# Cursor kinds whose sort value is a number (likes, trending score, bm25
+# rank). The 'ingredients' cursor carries no value at all.
+NUMERIC_CURSOR_SORTS = {'likes', 'trending', 'search'}
+
+# Columns each serialized field needs. Fields not listed here are either
+# always loaded (id) or come from a relationship.
+FIELD_COLUMNS = {
+    'title': [Recipe.title],
+    'description': [Recipe.description],
+    'instructions': [Recipe.instructions],
+    'image_filename': [Recipe.image_filename],
+    'image': [Recipe.image_filename, Recipe.image_hash],
+    'likes': [Recipe.likes],
+    'created_at': [Recipe.created_at],
+    'creatorId': [Recipe.creator_id],
+    'creatorEmail': [Recipe.creator_id],
+}
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+class InvalidPageRequest(ValueError):
+    """
+    Raised when a client sends a malformed cursor, sort, limit or field list.
+    """
+
+
+def parse_limit(raw, default, maximum):
+    """
+    Parses the `limit` query argument and clamps it to `maximum`.
+    """
+    if raw is None or raw == '':
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer.")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be at least 1.")
+    return min(limit, maximum)
+
+
+def parse_fields(raw):
+    """
+    Parses the comma-separated `fields` query argument.
+    Returns None when every field should be serialized.
+    """
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in RECIPE_FIELDS]
+    if unknown:
+        raise InvalidPageRequest(f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def encode_cursor(sort, value, recipe_id):
+    """
+    Builds an opaque cursor pointing just after the given row.
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, recipe_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """
+    Reverses encode_cursor, checking that the cursor belongs to `sort`.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, recipe_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidPageRequest("Malformed cursor.")
+    if cursor_sort != sort or not isinstance(recipe_id, int) or isinstance(recipe_id, bool):
+        raise InvalidPageRequest("Cursor does not match the requested sort.")
+    if sort == 'recent':
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise InvalidPageRequest("Malformed cursor.")
+    elif sort in NUMERIC_CURSOR_SORTS:
+        # The value goes straight into a SQL bind parameter
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise InvalidPageRequest("Malformed cursor.")
+    elif value is not None:
+        raise InvalidPageRequest("Malformed cursor.")
+    return value, recipe_id
+
+
+def paginate_recipes(sort='recent', cursor=None, limit=24, fields=None):
+    """
+    Returns one page of recipes ordered by (sort column, id) descending.
+
+    Uses keyset pagination: the cursor carries the last row's sort value and
+    id, so each page is a bounded range scan instead of an OFFSET that grows
+    with the page number. When `fields` is given only the columns those
+    fields need are loaded.
+    """
+    if sort not in SORT_COLUMNS:
+        raise InvalidPageRequest(f"Unknown sort: {sort}")
+    sort_column = SORT_COLUMNS[sort]
+
+    query = Recipe.query
+    if fields is not None:
+        # version keys the recipe's cached JSON fragment (see fragments.py)
+        columns = {Recipe.id, Recipe.version, sort_column}
+        for field in fields:
+            columns.update(FIELD_COLUMNS.get(field, []))
+        query = query.options(load_only(*columns))
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        query = query.filter(or_(
+            sort_column < value,
+            and_(sort_column == value, Recipe.id < last_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists.
+    rows = query.order_by(sort_column.desc(), Recipe.id.desc()).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(sort, getattr(last, sort_column.key), last.id)
+    return Page(items, next_cursor)
@@ -0,0 +1,159 @@
+# passwords.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Number of ':'-separated parts of a complete method string, e.g.
+# 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'. Without its cost parameters
+# a method would take Werkzeug's defaults, which change between releases.
+_METHOD_PARTS = {'pbkdf2': 3, 'scrypt': 4}
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing pool is full, a hash took too long or the pool
+    broke again right after being rebuilt. `reason` is 'busy', 'timeout'
+    or 'broken'.
+    """
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def check_method(method):
+    parts = method.split(':')
+    if _METHOD_PARTS.get(parts[0]) != len(parts):
+        raise ValueError(
+            f"PASSWORD_HASH_METHOD must be a complete Werkzeug method such as "
+            f"'pbkdf2:sha256:600000' or 'scrypt:32768:8:1', not {method!r}."
+        )
+
+
+def _lower_priority(niceness):
+    # Runs in each pool process: on a busy machine request threads win the CPU
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords on a bounded pool of worker processes, so a
+    burst of logins can neither hold every request thread nor starve the
+    rest of the app of CPU.
+
+    At most `workers` hashes run at once and `max_queue` more wait. Further
+    calls raise HashingBusy at once instead of queueing, and so do calls
+    whose result takes longer than `timeout` seconds. With `workers` set to
+    0, hashing runs inline in the calling thread.
+    """
+
+    def __init__(self, method, workers=1, max_queue=2, timeout=10.0, niceness=0):
+        check_method(method)
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.niceness = niceness
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        # Started on first use, so a prefork server creates one pool per
+        # worker after forking
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned rather than forked: the app runs background threads,
+                # and a forked child can inherit locks that are never released.
+                # Spawned processes import the main script, so it must keep
+                # its startup code under `if __name__ == '__main__'`.
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_lower_priority,
+                    initargs=(self.niceness,)
+                )
+            return self._pool
+
+    def _discard(self, pool):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _run(self, function, *args):
+        if self._slots is None:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Too many password checks in progress.", 'busy')
+        running = None
+        try:
+            # A pool process that dies (e.g. killed for memory) breaks the
+            # whole pool: rebuild it once, then report the failure as busy
+            for _ in range(2):
+                pool = self._executor()
+                try:
+                    future = pool.submit(function, *args)
+                    return future.result(self.timeout)
+                except TimeoutError:
+                    running = future
+                    raise HashingBusy("Password check timed out.", 'timeout')
+                except BrokenProcessPool:
+                    self._discard(pool)
+            raise HashingBusy("Password hashing processes keep failing.", 'broken')
+        finally:
+            if running is None:
+                self._slots.release()
+            else:
+                # The slot stays taken until the hash finishes, even after a timeout
+                running.add_done_callback(lambda _: self._slots.release())
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        True when a stored hash was made with other parameters than the
+        configured method.
+        """
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        """
+        Stops the pool's processes. A prefork server calls this when a
+        worker exits (see serve.py).
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def hash_password(password):
+    return current_app.extensions['password_hasher'].hash(password)
+
+
+def verify_password(password_hash, password):
+    return current_app.extensions['password_hasher'].verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return current_app.extensions['password_hasher'].needs_rehash(password_hash)
+
+
+def init_app(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+        niceness=app.config['PASSWORD_HASH_NICE'],
+    )
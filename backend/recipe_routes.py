@@ -1,11 +1,29 @@
 # recipe_routes.py
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, jsonify, session, current_app, stream_with_context, redirect
 # Removed UserRecipe and UserLikedRecipe, as they no longer exist in models.py
-from models import db, Recipe, User
+from models import db, Recipe, User, user_saved_recipes, user_liked_recipes
 from auth_routes import login_required
-from werkzeug.utils import secure_filename
-import os
-import uuid
+from pagination import paginate_recipes, parse_fields, parse_limit, encode_cursor, decode_cursor, InvalidPageRequest
+from serializers import serialize_recipes
+from fragments import recipes_response
+from ingredients import sync_recipe_ingredients, find_recipe_ids, parse_ingredient_list
+from search import build_match_query, index_recipe, search_recipes
+from counters import toggle_membership, apply_like_delta, likes_changed_after_commit, current_likes
+import viewer_state
+import trending
+import bulk
+import transfer
+import changelog
+import similar
+import live
+import images
+from upload_routes import claim_upload
+from cache import cached_list_view, invalidate_recipe, recipe_key, response_cache
+from versions import catalog_conditional, bump_catalog_version, touch_recipe, recipe_validators, \
+    is_not_modified, not_modified_response, set_validators
+from database import read_only
+from admission import rate_limited
+import hashlib
 
 # Create a blueprint for recipe-related routes
 recipe_bp = Blueprint('recipe_bp', __name__)
@@ -18,6 +36,27 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
+def store_recipe_image(user_id):
+    """
+    Stores the image sent with a recipe form, either as an `upload_token`
+    from a finished chunked upload or as an inline `image` file.
+    Returns (image_hash, image_filename), or (None, None) if no image was sent.
+    Raises ValueError with a client-facing message for invalid input.
+    """
+    token = request.form.get('upload_token')
+    if token:
+        path, sha256, size, ext = claim_upload(token, user_id)
+        # A rolled back claim keeps the upload session, so keep its file too
+        return sha256, images.store_file(path, sha256, size, ext, discard_on_rollback=False)
+
+    file = request.files.get('image')
+    if file is None or file.filename == '':
+        return None, None
+    if not allowed_file(file.filename):
+        raise ValueError("Invalid image file type. Allowed: png, jpg, jpeg, gif.")
+    # Stored by content hash, so identical uploads share one file
+    return images.store_upload(file)
+
 @recipe_bp.route('/recipes', methods=['POST'])
 @login_required
 def add_recipe():
@@ -34,24 +73,15 @@ def add_recipe():
     if not all([title, description, ingredients, instructions, creator_id]):
         return jsonify(message="Missing required fields."), 400
     
-    # Handle image upload
-    image_filename = None
-    if 'image' in request.files:
-        file = request.files['image']
-        
-        # Check if a file was selected and it's allowed
-        if file and allowed_file(file.filename):
-            try:
-                # Generate a unique filename using UUID to prevent collisions
-                unique_filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-                upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                
-                file.save(upload_path)
-                image_filename = unique_filename
-            except Exception as e:
-                return jsonify(message=f"Error saving image file: {str(e)}"), 500
-        elif file.filename != '':
-            return jsonify(message="Invalid image file type. Allowed: png, jpg, jpeg, gif."), 400
+    # Handle the image, sent inline or as a chunked upload token
+    try:
+        image_hash, image_filename = store_recipe_image(creator_id)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(message=str(e)), 400
+    except OSError as e:
+        db.session.rollback()
+        return jsonify(message=f"Error saving image file: {str(e)}"), 500
     
     if not image_filename:
         return jsonify(message="No image file was uploaded."), 400
@@ -63,28 +93,55 @@ def add_recipe():
             ingredients=ingredients,
             instructions=instructions,
             creator_id=creator_id,
-            image_filename=image_filename
+            image_filename=image_filename,
+            image_hash=image_hash
         )
         db.session.add(new_recipe)
+        db.session.flush()
+        sync_recipe_ingredients(new_recipe.id, ingredients)
+        index_recipe(new_recipe)
+        trending.rescore_recipe(new_recipe.id)
+        changelog.record_changes([new_recipe.id])
+        bump_catalog_version()
         db.session.commit()
+        images.place_after_commit()
+        images.process_after_commit(image_hash)
+        live.publish([new_recipe.id])
         return jsonify(message="Recipe added successfully!", recipe=new_recipe.to_dict()), 201
     except Exception as e:
         db.session.rollback()
-        if image_filename and os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], image_filename)):
-            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], image_filename))
-        print(f"Database error during recipe creation: {e}")
+        current_app.logger.exception("Database error during recipe creation")
         return jsonify(message=f"Error adding recipe to database: {str(e)}"), 500
 
 
 @recipe_bp.route('/recipes/<int:recipe_id>', methods=['GET'])
+@read_only
 def get_recipe(recipe_id):
     """
-    Retrieves a single recipe.
+    Retrieves a single recipe. Conditional requests are answered from the
+    recipe's version columns without loading or serializing the row, and
+    the serialized body is cached under the recipe's ETag.
     """
-    recipe = Recipe.query.get(recipe_id)
-    if not recipe:
+    validators = recipe_validators(recipe_id)
+    if validators is None:
         return jsonify(message="Recipe not found."), 404
-    return jsonify(recipe.to_dict()), 200
+    etag, last_modified = validators
+    if is_not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
+    def compute():
+        recipe = Recipe.query.get(recipe_id)
+        return etag, jsonify(recipe.to_dict()).get_data() if recipe else None
+
+    cache = response_cache()
+    if cache is not None:
+        _, body = cache.get_or_compute(recipe_key(recipe_id), compute, is_fresh=lambda value: value[0] == etag)
+    else:
+        _, body = compute()
+    if body is None:
+        return jsonify(message="Recipe not found."), 404
+    response = current_app.response_class(body, mimetype='application/json')
+    return set_validators(response, etag, last_modified), 200
 
 @recipe_bp.route('/recipes/<int:recipe_id>', methods=['PUT'])
 @login_required
@@ -104,32 +161,38 @@ def update_recipe(recipe_id):
     ingredients_str = request.form.get('ingredients')
     if ingredients_str is not None:
         recipe.ingredients = ingredients_str
+        sync_recipe_ingredients(recipe.id, ingredients_str)
     recipe.instructions = request.form.get('instructions', recipe.instructions)
 
-    if 'image' in request.files and request.files['image'].filename != '':
-        file = request.files['image']
-        if file and allowed_file(file.filename):
-            if recipe.image_filename:
-                old_path = os.path.join(current_app.config['UPLOAD_FOLDER'], recipe.image_filename)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
-
-            unique_filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-            upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(upload_path)
-            recipe.image_filename = unique_filename
-        else:
-            return jsonify(message="Invalid image file type. Allowed: png, jpg, jpeg, gif."), 400
-    
-    if request.form.get('image_removed') == 'true':
-        if recipe.image_filename:
-            old_path = os.path.join(current_app.config['UPLOAD_FOLDER'], recipe.image_filename)
-            if os.path.exists(old_path):
-                os.remove(old_path)
-            recipe.image_filename = None
+    released_image = None
+    try:
+        new_image_hash, new_image_filename = store_recipe_image(recipe.creator_id)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(message=str(e)), 400
+    except OSError as e:
+        db.session.rollback()
+        return jsonify(message=f"Error saving image file: {str(e)}"), 500
+    if new_image_filename:
+        released_image = images.release_image(recipe)
+        recipe.image_filename = new_image_filename
+        recipe.image_hash = new_image_hash
+    elif request.form.get('image_removed') == 'true':
+        released_image = images.release_image(recipe)
+        recipe.image_filename = None
+        recipe.image_hash = None
 
     try:
+        touch_recipe(recipe)
+        index_recipe(recipe)
+        changelog.record_changes([recipe.id])
+        bump_catalog_version()
         db.session.commit()
+        invalidate_recipe(recipe.id)
+        images.place_after_commit()
+        images.collect_after_commit(released_image)
+        images.process_after_commit(new_image_hash)
+        live.publish([recipe.id])
         return jsonify(message="Recipe updated successfully!", recipe=recipe.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -149,83 +212,365 @@ def delete_recipe(recipe_id):
         return jsonify(message="Unauthorized: You can only delete your own recipes."), 403
 
     try:
-        # Before deleting the recipe, remove it from all users' saved and liked lists
-        # This is a key change to handle the db.Table relationship
-        for user in recipe.savers.all():
-            user.saved_recipes.remove(recipe)
-        for user in recipe.likers.all():
-            user.liked_recipes.remove(recipe)
-
-        # Delete the associated image file
-        if recipe.image_filename:
-            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], recipe.image_filename)
-            if os.path.exists(image_path):
-                os.remove(image_path)
-
-        db.session.delete(recipe)
+        # Removes the recipe from every user's saved and liked lists with
+        # set-based deletes; the image file is deleted in the background
+        # once nothing references it
+        result = bulk.delete_recipes([recipe.id])
         db.session.commit()
+        bulk.finish_after_commit(*result)
         return jsonify(message="Recipe deleted successfully!"), 200
     except Exception as e:
         db.session.rollback()
         return jsonify(message=f"Error deleting recipe: {str(e)}"), 500
 
+@recipe_bp.route('/recipes/batch', methods=['POST'])
+@login_required
+def batch_recipes():
+    """
+    Deletes or updates several of the current user's recipes in one
+    transaction.
+
+    Body: {"action": "delete" | "update", "ids": [...], "changes": {...}}.
+    `changes` (update only) may set title, description, instructions and
+    creatorEmail (to transfer ownership), to the same value on every recipe.
+    The whole batch is rejected if any id is not the user's own recipe.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    ids = data.get('ids')
+    if action not in ('delete', 'update'):
+        return jsonify(message="action must be 'delete' or 'update'."), 400
+    if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+        return jsonify(message="ids must be a non-empty list of recipe ids."), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > current_app.config['RECIPES_BATCH_MAX']:
+        return jsonify(message=f"At most {current_app.config['RECIPES_BATCH_MAX']} recipes per batch."), 400
+
+    owned = {row[0] for row in db.session.query(Recipe.id).filter(
+        Recipe.id.in_(ids), Recipe.creator_id == session.get('user_id'))}
+    not_owned = [i for i in ids if i not in owned]
+    if not_owned:
+        return jsonify(message="Unauthorized: You can only change your own recipes.", ids=not_owned), 403
+
+    try:
+        if action == 'delete':
+            result = bulk.delete_recipes(ids)
+        else:
+            result = bulk.update_recipes(ids, data.get('changes') or {})
+        db.session.commit()
+    except bulk.BulkError as e:
+        db.session.rollback()
+        return jsonify(message=str(e)), e.status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(message=f"Error applying batch: {str(e)}"), 500
+    bulk.finish_after_commit(*result)
+    return jsonify(message=f"{len(ids)} recipes {action}d.", action=action, ids=ids), 200
+
 @recipe_bp.route('/recipes', methods=['GET'])
+@read_only
+@catalog_conditional
+@cached_list_view
 def get_all_recipes():
     """
-    Retrieves all recipes from the database.
+    Retrieves one page of recipes.
+
+    Query arguments:
+      sort   -- 'recent' (created_at, newest first) or 'likes' (most liked first)
+      limit  -- page size, capped at RECIPES_MAX_PAGE_SIZE
+      cursor -- the next_cursor value returned with the previous page
+      fields -- comma-separated subset of recipe fields to return
+    """
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['RECIPES_PAGE_SIZE'],
+            current_app.config['RECIPES_MAX_PAGE_SIZE']
+        )
+        fields = parse_fields(request.args.get('fields'))
+        page = paginate_recipes(
+            sort=request.args.get('sort', 'recent'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            fields=fields
+        )
+    except InvalidPageRequest as e:
+        return jsonify(message=str(e)), 400
+    return recipes_response(page.items, fields, next_cursor=page.next_cursor)
+
+@recipe_bp.route('/recipes/export', methods=['GET'])
+@read_only
+@login_required
+def export_recipes():
+    """
+    Streams every recipe as NDJSON, one object per line (see transfer.py).
     """
-    recipes = Recipe.query.all()
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    return current_app.response_class(
+        stream_with_context(transfer.buffered(transfer.export_lines())),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=recipes.ndjson'}
+    )
+
+@recipe_bp.route('/recipes/import', methods=['POST'])
+@login_required
+def import_recipes():
+    """
+    Imports recipes from an NDJSON request body, in batches. Lines that fail
+    validation are listed in the report and skipped; the rest are imported.
+    Requests are limited to MAX_CONTENT_LENGTH, so large imports should be
+    split or use `flask import-recipes`.
+    """
+    if not current_app.config['RECIPES_IMPORT_ENABLED']:
+        return jsonify(message="Bulk import is disabled."), 403
+    report = transfer.import_recipes(request.stream)
+    return jsonify(message=f"Imported {report.imported} recipes.", **report.to_dict()), 200
+
+@recipe_bp.route('/recipes/changes', methods=['GET'])
+@read_only
+def get_recipe_changes():
+    """
+    Returns what changed in the catalog since a change-log position, so a
+    client can patch the recipes it holds instead of reloading them.
+
+    Without `since`, returns only {"latest": seq}: load the catalog, then
+    poll from that position. With `since`, returns {"recipes": [...],
+    "deleted": [...], "next_since": seq, "has_more": bool, "latest": seq},
+    each recipe appearing once in its current form. Continue from
+    next_since; has_more means another request would return more. When the
+    position is no longer covered by the log the answer is
+    {"resync": true, "latest": seq}: reload the catalog and poll from latest.
+    """
+    if 'since' not in request.args:
+        return jsonify(latest=changelog.latest_seq())
+    try:
+        since = int(request.args['since'])
+    except ValueError:
+        return jsonify(message="since must be an integer."), 400
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['RECIPE_CHANGES_PAGE_SIZE'],
+            current_app.config['RECIPE_CHANGES_PAGE_SIZE']
+        )
+    except InvalidPageRequest as e:
+        return jsonify(message=str(e)), 400
+
+    batch = changelog.read_changes(since, limit)
+    if batch.resync:
+        return jsonify(resync=True, latest=batch.latest)
+    recipes = Recipe.query.filter(Recipe.id.in_(batch.upserted)).all() if batch.upserted else []
+    # A recipe upserted and then deleted beyond this batch is reported as deleted now
+    found = {recipe.id for recipe in recipes}
+    deleted = batch.deleted + [recipe_id for recipe_id in batch.upserted if recipe_id not in found]
+    return recipes_response(
+        recipes, deleted=deleted, next_since=batch.next_since, has_more=batch.has_more, latest=batch.latest
+    )
+
+@recipe_bp.route('/recipes/stream', methods=['GET'])
+def recipe_stream():
+    """
+    Redirects to the server-sent event stream of like counts, edits and
+    deletions (see live.py), starting its server on first use.
+
+    Query arguments, passed on to the stream:
+      ids -- comma-separated ids of the recipes to watch
+    """
+    url = live.stream_url()
+    if url is None:
+        return jsonify(message="Live updates are unavailable."), 503
+    query = request.query_string.decode()
+    return redirect(f'{url}?{query}' if query else url, 307)
+
+@recipe_bp.route('/recipes/<int:recipe_id>/similar', methods=['GET'])
+@read_only
+@catalog_conditional
+@cached_list_view
+def get_similar_recipes(recipe_id):
+    """
+    Retrieves the recipes whose ingredients are most like this recipe's,
+    most similar first, with their Jaccard similarity in `scores`.
+
+    Query arguments:
+      k      -- number of recipes, at most SIMILAR_MAX_K (default 10)
+      fields -- comma-separated subset of recipe fields to return
+    """
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify(message="k must be an integer."), 400
+    if not 1 <= k <= current_app.config['SIMILAR_MAX_K']:
+        return jsonify(message=f"k must be between 1 and {current_app.config['SIMILAR_MAX_K']}."), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidPageRequest as e:
+        return jsonify(message=str(e)), 400
+    if not db.session.query(Recipe.id).filter_by(id=recipe_id).first():
+        return jsonify(message="Recipe not found."), 404
+
+    results = similar.similar_recipes(recipe_id, k)
+    recipes = {recipe.id: recipe for recipe in Recipe.query.filter(Recipe.id.in_([i for i, _ in results]))} \
+        if results else {}
+    found = [(recipes[i], score) for i, score in results if i in recipes]
+    return recipes_response([recipe for recipe, _ in found], fields, scores=[round(score, 4) for _, score in found])
+
+@recipe_bp.route('/recipes/trending', methods=['GET'])
+@read_only
+@catalog_conditional
+@cached_list_view
+def get_trending_recipes():
+    """
+    Retrieves one page of recipes ordered by time-decayed popularity.
+    Supports `limit`, `cursor` and `fields` as for GET /recipes.
+    """
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['RECIPES_PAGE_SIZE'],
+            current_app.config['RECIPES_MAX_PAGE_SIZE']
+        )
+        fields = parse_fields(request.args.get('fields'))
+        page = trending.paginate_trending(cursor=request.args.get('cursor'), limit=limit, fields=fields)
+    except InvalidPageRequest as e:
+        return jsonify(message=str(e)), 400
+    return recipes_response(page.items, fields, next_cursor=page.next_cursor)
+
+@recipe_bp.route('/recipes/by-ingredients', methods=['GET'])
+@read_only
+@catalog_conditional
+@cached_list_view
+def get_recipes_by_ingredients():
+    """
+    Finds recipes by ingredient, newest first.
+
+    Query arguments (comma-separated ingredient names, matched case- and
+    whitespace-insensitively):
+      all  -- recipes must use every one of these
+      any  -- recipes must use at least one of these
+      none -- recipes must use none of these
+    plus `limit`, `cursor` and `fields` as for GET /recipes.
+    """
+    all_of = parse_ingredient_list(request.args.get('all'))
+    any_of = parse_ingredient_list(request.args.get('any'))
+    none_of = parse_ingredient_list(request.args.get('none'))
+    if not (all_of or any_of or none_of):
+        return jsonify(message="Provide at least one of all, any or none."), 400
+
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['RECIPES_PAGE_SIZE'],
+            current_app.config['RECIPES_MAX_PAGE_SIZE']
+        )
+        fields = parse_fields(request.args.get('fields'))
+        before_id = None
+        if request.args.get('cursor'):
+            _, before_id = decode_cursor(request.args['cursor'], 'ingredients')
+    except InvalidPageRequest as e:
+        return jsonify(message=str(e)), 400
+
+    recipe_ids = find_recipe_ids(all_of, any_of, none_of, before_id=before_id, limit=limit + 1)
+    page_ids = recipe_ids[:limit]
+    recipes = {recipe.id: recipe for recipe in Recipe.query.filter(Recipe.id.in_(page_ids))} if page_ids else {}
+    next_cursor = encode_cursor('ingredients', None, page_ids[-1]) if len(recipe_ids) > limit else None
+    return recipes_response([recipes[i] for i in page_ids if i in recipes], fields, next_cursor=next_cursor)
+
+@recipe_bp.route('/recipes/search', methods=['GET'])
+@read_only
+@catalog_conditional
+@cached_list_view
+def search_recipes_route():
+    """
+    Full-text search over recipe titles, descriptions and instructions.
+
+    Results are ranked by bm25 (best first) and each recipe carries a
+    `snippet` with the matching terms wrapped in <mark>. The last word of `q`
+    and any word ending in `*` match as prefixes. Supports `limit`, `cursor`
+    and `fields` as for GET /recipes.
+    """
+    match_query = build_match_query(request.args.get('q'))
+    if not match_query:
+        return jsonify(message="Query parameter q is required."), 400
+
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['RECIPES_PAGE_SIZE'],
+            current_app.config['RECIPES_MAX_PAGE_SIZE']
+        )
+        fields = parse_fields(request.args.get('fields'))
+        after = None
+        if request.args.get('cursor'):
+            after = decode_cursor(request.args['cursor'], 'search')
+    except InvalidPageRequest as e:
+        return jsonify(message=str(e)), 400
+
+    hits = search_recipes(match_query, after=after, limit=limit + 1)
+    page = hits[:limit]
+    ids = [recipe_id for recipe_id, _, _ in page]
+    recipes = {recipe.id: recipe for recipe in Recipe.query.filter(Recipe.id.in_(ids))} if ids else {}
+    found = [(recipes[recipe_id], snippet) for recipe_id, _, snippet in page if recipe_id in recipes]
+
+    results = serialize_recipes([recipe for recipe, _ in found], fields)
+    for result, (_, snippet) in zip(results, found):
+        result['snippet'] = snippet
+
+    next_cursor = None
+    if len(hits) > limit:
+        last_id, last_score, _ = page[-1]
+        next_cursor = encode_cursor('search', last_score, last_id)
+    return jsonify(recipes=results, next_cursor=next_cursor)
 
 @recipe_bp.route('/recipes/<int:recipe_id>/save', methods=['POST'])
 @login_required
+@rate_limited('toggle')
 def toggle_save_recipe(recipe_id):
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
-    recipe = Recipe.query.get(recipe_id)
-    if not user or not recipe:
+    if not db.session.query(Recipe.id).filter_by(id=recipe_id).first():
         return jsonify(message="User or Recipe not found."), 404
 
-    if recipe in user.saved_recipes:
-        user.saved_recipes.remove(recipe)
-        db.session.commit()
-        return jsonify(message="Recipe unsaved!", saved=False), 200
-    else:
-        user.saved_recipes.append(recipe)
-        db.session.commit()
+    saved, delta = toggle_membership(user_saved_recipes, user_id, recipe_id)
+    if delta:
+        viewer_state.bump_state_version(user_id)
+    db.session.commit()
+    if saved:
         return jsonify(message="Recipe saved!", saved=True), 200
+    return jsonify(message="Recipe unsaved!", saved=False), 200
 
 @recipe_bp.route('/recipes/<int:recipe_id>/like', methods=['POST'])
 @login_required
+@rate_limited('toggle')
 def toggle_like_recipe(recipe_id):
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
-    recipe = Recipe.query.get(recipe_id)
-    if not user or not recipe:
+    if not db.session.query(Recipe.id).filter_by(id=recipe_id).first():
         return jsonify(message="User or Recipe not found."), 404
 
-    if recipe in user.liked_recipes:
-        user.liked_recipes.remove(recipe)
-        recipe.likes = max(0, recipe.likes - 1)
-        db.session.commit()
-        return jsonify(message="Recipe unliked!", liked=False, likes=recipe.likes), 200
-    else:
-        user.liked_recipes.append(recipe)
-        recipe.likes += 1
-        db.session.commit()
-        return jsonify(message="Recipe liked!", liked=True, likes=recipe.likes), 200
+    liked, delta = toggle_membership(user_liked_recipes, user_id, recipe_id)
+    apply_like_delta(recipe_id, delta)
+    if delta:
+        trending.rescore_recipe(recipe_id)
+        viewer_state.bump_state_version(user_id)
+    db.session.commit()
+    invalidate_recipe(recipe_id)
+    if delta:
+        likes_changed_after_commit()
+        live.publish([recipe_id])
+    likes = current_likes(recipe_id)
+    if liked:
+        return jsonify(message="Recipe liked!", liked=True, likes=likes), 200
+    return jsonify(message="Recipe unliked!", liked=False, likes=likes), 200
 
 @recipe_bp.route('/my-saved-recipes', methods=['GET'])
+@read_only
 @login_required
 def get_my_saved_recipes():
     user_id = session.get('user_id')
     user = User.query.get(user_id)
     if not user:
         return jsonify(message="User not found."), 404
-    saved_recipes = [recipe.to_dict() for recipe in user.saved_recipes.all()]
-    return jsonify(saved_recipes), 200
+    return jsonify(serialize_recipes(user.saved_recipes.all())), 200
 
 @recipe_bp.route('/my-liked-recipes-status', methods=['GET'])
+@read_only
 @login_required
 def get_my_liked_recipes_status():
     user_id = session.get('user_id')
@@ -236,6 +581,7 @@ def get_my_liked_recipes_status():
     return jsonify(likedRecipeIds=liked_recipe_ids), 200
 
 @recipe_bp.route('/my-saved-recipes-status', methods=['GET'])
+@read_only
 @login_required
 def get_my_saved_recipes_status():
     user_id = session.get('user_id')
@@ -244,3 +590,48 @@ def get_my_saved_recipes_status():
         return jsonify(savedRecipeIds=[]), 200
     saved_recipe_ids = [recipe.id for recipe in user.saved_recipes.all()]
     return jsonify(savedRecipeIds=saved_recipe_ids), 200
+
+@recipe_bp.route('/me/recipe-state', methods=['GET'])
+@read_only
+def get_my_recipe_state():
+    """
+    Returns the ids of the recipes the current user has liked and saved.
+
+    Query arguments:
+      encoding   -- 'list' (default), 'delta' or 'ranges' (see viewer_state.encode_ids)
+      recipe_ids -- comma-separated ids; only these recipes are reported
+
+    The response carries an ETag built from the user's state version, so a
+    request with a matching If-None-Match gets a 304 after a single-row read.
+    """
+    encoding = request.args.get('encoding', 'list')
+    if encoding not in viewer_state.ENCODINGS:
+        return jsonify(message=f"Unknown encoding: {encoding}"), 400
+
+    only = None
+    if request.args.get('recipe_ids'):
+        try:
+            only = sorted({int(i) for i in request.args['recipe_ids'].split(',') if i.strip()})
+        except ValueError:
+            return jsonify(message="recipe_ids must be comma-separated integers."), 400
+        if len(only) > current_app.config['RECIPES_MAX_PAGE_SIZE']:
+            return jsonify(message="Too many recipe_ids."), 400
+
+    user_id = session.get('user_id')
+    version = viewer_state.state_version(user_id) if user_id else None
+    if version is None:
+        return jsonify(encoding=encoding, liked=[], saved=[]), 200
+
+    filter_key = ','.join(map(str, only)) if only is not None else '*'
+    etag = f"{user_id}-{version}-{encoding}-{hashlib.sha1(filter_key.encode()).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(
+            encoding=encoding,
+            liked=viewer_state.encode_ids(viewer_state.recipe_ids(user_liked_recipes, user_id, only), encoding),
+            saved=viewer_state.encode_ids(viewer_state.recipe_ids(user_saved_recipes, user_id, only), encoding),
+        )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
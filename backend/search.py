@@ -0,0 +1,229 @@
+# search.py
+import html
+import re
+
+import click
+from sqlalchemy import bindparam, text
+
+from models import db, chunked
+
+# Column weights for bm25, in table column order: a match in the title counts
+# for more than one in the description, which counts for more than one in the
+# instructions.
+BM25_WEIGHTS = (10.0, 4.0, 1.0)
+SNIPPET_TOKENS = 12
+
+# Snippet highlight markers. FTS5 inserts these raw, so they are control
+# characters that cannot appear in user text; they are swapped for <mark>
+# tags after the snippet has been HTML-escaped.
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+_TOKEN = re.compile(r'(\w+)(\*?)', re.UNICODE)
+
+# On SQLite the index is an FTS5 table kept in sync by index_recipe. On
+# PostgreSQL a GIN expression index over the recipe table is used instead,
+# so there is nothing to keep in sync; queries must repeat the expression
+# exactly for the index to apply.
+_PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(instructions, '')), 'C')"
+)
+
+_CREATE_TABLE = text(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts "
+    "USING fts5(title, description, instructions, tokenize='unicode61 remove_diacritics 2')"
+)
+
+_SEARCH = text(
+    "SELECT rowid, score, snippet FROM ("
+    "  SELECT rowid,"
+    "         bm25(recipe_fts, :w_title, :w_description, :w_instructions) AS score,"
+    "         snippet(recipe_fts, -1, :hl_start, :hl_end, '...', :tokens) AS snippet"
+    "  FROM recipe_fts WHERE recipe_fts MATCH :query"
+    ") "
+    "WHERE :after_score IS NULL OR score > :after_score OR (score = :after_score AND rowid > :after_id) "
+    "ORDER BY score, rowid LIMIT :limit"
+)
+
+
+_PG_CREATE_INDEX = text(f"CREATE INDEX IF NOT EXISTS ix_recipe_search ON recipe USING gin (({_PG_DOCUMENT}))")
+
+# ts_rank weights in {D, C, B, A} order, matching BM25_WEIGHTS' proportions
+_PG_SEARCH = text(
+    "SELECT id, score, ts_headline('simple', "
+    "         concat_ws(' ', title, description, instructions), to_tsquery('simple', :query), :headline) AS snippet "
+    "FROM ("
+    "  SELECT id, title, description, instructions,"
+    f"         -ts_rank('{{0, 0.1, 0.4, 1.0}}', {_PG_DOCUMENT}, to_tsquery('simple', :query)) AS score"
+    "  FROM recipe"
+    f"  WHERE {_PG_DOCUMENT} @@ to_tsquery('simple', :query)"
+    ") AS hits "
+    "WHERE CAST(:after_score AS float) IS NULL OR score > :after_score OR (score = :after_score AND id > :after_id) "
+    "ORDER BY score, id LIMIT :limit"
+)
+
+
+def _uses_fts5():
+    return db.session.get_bind().dialect.name == 'sqlite'
+
+
+def build_match_query(q):
+    """
+    Turns free text into an FTS5 MATCH expression.
+
+    Every word becomes a quoted term so FTS5 operators in user input are
+    treated as text. Words ending in `*`, and the last word (so results
+    follow the user while typing), become prefix queries. On PostgreSQL the
+    same rules produce a tsquery expression instead.
+    Returns None when `q` has no searchable words.
+    """
+    terms = _TOKEN.findall(q or '')
+    if not terms:
+        return None
+    fts5 = _uses_fts5()
+    parts = []
+    for position, (word, star) in enumerate(terms):
+        prefix = star or position == len(terms) - 1
+        if fts5:
+            parts.append(f'"{word}"*' if prefix else f'"{word}"')
+        else:
+            parts.append(f'{word}:*' if prefix else word)
+    return ' '.join(parts) if fts5 else ' & '.join(parts)
+
+
+def index_recipe(recipe):
+    """
+    Adds or replaces a recipe's entry in the search index.
+    Runs inside the caller's transaction.
+    """
+    if not _uses_fts5():
+        return
+    unindex_recipe(recipe.id)
+    db.session.execute(
+        text("INSERT INTO recipe_fts (rowid, title, description, instructions) VALUES (:id, :title, :description, :instructions)"),
+        {'id': recipe.id, 'title': recipe.title, 'description': recipe.description or '', 'instructions': recipe.instructions or ''}
+    )
+
+
+def unindex_recipe(recipe_id):
+    """
+    Removes a recipe from the search index. Runs inside the caller's transaction.
+    """
+    if not _uses_fts5():
+        return
+    db.session.execute(text("DELETE FROM recipe_fts WHERE rowid = :id"), {'id': recipe_id})
+
+
+def unindex_recipes(recipe_ids):
+    """
+    Removes several recipes from the search index with one statement per
+    chunk. Runs inside the caller's transaction.
+    """
+    if not _uses_fts5():
+        return
+    for chunk in chunked(recipe_ids):
+        db.session.execute(
+            text("DELETE FROM recipe_fts WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': chunk}
+        )
+
+
+def reindex_recipes(recipe_ids):
+    """
+    Re-reads several recipes into the search index with set-based statements.
+    Runs inside the caller's transaction, after the recipes were updated.
+    """
+    if not _uses_fts5():
+        return
+    unindex_recipes(recipe_ids)
+    for chunk in chunked(recipe_ids):
+        db.session.execute(
+            text(
+                "INSERT INTO recipe_fts (rowid, title, description, instructions) "
+                "SELECT id, title, coalesce(description, ''), coalesce(instructions, '') FROM recipe WHERE id IN :ids"
+            ).bindparams(bindparam('ids', expanding=True)),
+            {'ids': chunk}
+        )
+
+
+def _render_snippet(snippet):
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+
+
+def search_recipes(match_query, after=None, limit=24):
+    """
+    Returns up to `limit` (recipe_id, score, snippet) tuples, best match first.
+
+    `after` is the (score, recipe_id) of the last row of the previous page;
+    results continue strictly after it in (score, rowid) order.
+    """
+    after_score, after_id = after if after else (None, None)
+    if not _uses_fts5():
+        rows = db.session.execute(_PG_SEARCH, {
+            'query': match_query,
+            'headline': f'StartSel={_HIGHLIGHT_START}, StopSel={_HIGHLIGHT_END}, MaxWords={SNIPPET_TOKENS}, MinWords=4',
+            'after_score': after_score,
+            'after_id': after_id,
+            'limit': limit,
+        })
+        return [(recipe_id, score, _render_snippet(snippet)) for recipe_id, score, snippet in rows]
+
+    rows = db.session.execute(_SEARCH, {
+        'query': match_query,
+        'w_title': BM25_WEIGHTS[0],
+        'w_description': BM25_WEIGHTS[1],
+        'w_instructions': BM25_WEIGHTS[2],
+        'hl_start': _HIGHLIGHT_START,
+        'hl_end': _HIGHLIGHT_END,
+        'tokens': SNIPPET_TOKENS,
+        'after_score': after_score,
+        'after_id': after_id,
+        'limit': limit,
+    })
+    return [(recipe_id, score, _render_snippet(snippet)) for recipe_id, score, snippet in rows]
+
+
+def rebuild_index():
+    """
+    Rebuilds the search index from the recipe table and merges its segments.
+    """
+    if not _uses_fts5():
+        db.session.execute(text("REINDEX INDEX ix_recipe_search"))
+        db.session.commit()
+        return
+    db.session.execute(text("DELETE FROM recipe_fts"))
+    db.session.execute(text(
+        "INSERT INTO recipe_fts (rowid, title, description, instructions) "
+        "SELECT id, title, coalesce(description, ''), coalesce(instructions, '') FROM recipe"
+    ))
+    db.session.execute(text("INSERT INTO recipe_fts (recipe_fts) VALUES ('optimize')"))
+    db.session.commit()
+
+
+def init_app(app):
+    """
+    Creates the FTS5 table (or, on PostgreSQL, the GIN index) if needed and
+    registers the rebuild CLI command. A newly created FTS5 table is
+    populated from existing recipes.
+    """
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text recipe search index."""
+        rebuild_index()
+        click.echo('Search index rebuilt.')
+
+    with app.app_context():
+        if not _uses_fts5():
+            db.session.execute(_PG_CREATE_INDEX)
+            db.session.commit()
+            return
+        existed = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recipe_fts'")
+        ).first() is not None
+        db.session.execute(_CREATE_TABLE)
+        db.session.commit()
+        if not existed:
+            rebuild_index()
@@ -0,0 +1,82 @@
+# serializers.py
+from models import db, User, RecipeIngredient, ImageBlob, RECIPE_FIELDS, chunked, image_field
+from instrumentation import timed_serialization
+
+
+def _load_creator_emails(recipes):
+    """
+    Loads the creator email of every recipe with one query per chunk of
+    creator ids, instead of one lazy User load per recipe.
+    """
+    creator_ids = {recipe.creator_id for recipe in recipes}
+    emails = {}
+    for chunk in chunked(creator_ids):
+        rows = db.session.query(User.id, User.email).filter(User.id.in_(chunk))
+        emails.update(rows)
+    return {recipe.id: emails.get(recipe.creator_id) for recipe in recipes}
+
+
+def _load_ingredients(recipes):
+    """
+    Loads the normalized ingredient lists of every recipe, in list order.
+    """
+    ingredients = {recipe.id: [] for recipe in recipes}
+    for chunk in chunked(ingredients):
+        rows = db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.display) \
+            .filter(RecipeIngredient.recipe_id.in_(chunk)) \
+            .order_by(RecipeIngredient.recipe_id, RecipeIngredient.position)
+        for recipe_id, display in rows:
+            ingredients[recipe_id].append(display)
+    return ingredients
+
+
+def _load_images(recipes):
+    """
+    Loads the image blobs of every recipe to build their `image` fields.
+    """
+    hashes = {recipe.image_hash for recipe in recipes if recipe.image_hash}
+    blobs = {}
+    for chunk in chunked(hashes):
+        blobs.update((blob.sha256, blob) for blob in ImageBlob.query.filter(ImageBlob.sha256.in_(chunk)))
+    return {recipe.id: image_field(blobs.get(recipe.image_hash), recipe.image_filename) for recipe in recipes}
+
+
+# Fields that come from related rows, mapped to a loader that fetches the
+# value for a whole list of recipes at once and returns {recipe_id: value}.
+RELATION_LOADERS = {
+    'creatorEmail': _load_creator_emails,
+    'ingredients': _load_ingredients,
+    'image': _load_images,
+}
+
+
+def serialize_recipes(recipes, fields=None):
+    """
+    Serializes a list of recipes to the same shape as Recipe.to_dict.
+
+    Related-row fields are loaded with one batched query per relation, so the
+    number of queries does not grow with the number of recipes.
+    """
+    if fields is None:
+        fields = RECIPE_FIELDS
+    recipes = list(recipes)
+    if not recipes:
+        return []
+
+    loaded = {
+        field: loader(recipes)
+        for field, loader in RELATION_LOADERS.items()
+        if field in fields
+    }
+    with timed_serialization():
+        return [
+            recipe.to_dict(fields, relations={field: values[recipe.id] for field, values in loaded.items()})
+            for recipe in recipes
+        ]
+
+
+def serialize_recipe(recipe, fields=None):
+    """
+    Serializes a single recipe through the same path as serialize_recipes.
+    """
+    return serialize_recipes([recipe], fields)[0]
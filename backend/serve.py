@@ -0,0 +1,119 @@
+# serve.py
+"""
+Production entry point. Loads and warms the app once, then forks worker
+processes that share its memory copy-on-write:
+
+    python serve.py --bind 0.0.0.0:8000 --workers 4 --pid /run/recipe-app.pid
+
+Before it listens, the parent creates the app (schema upgrade, trending
+backfill, asset manifest) and replays warmup.WARM_UP_PATHS. It then closes
+its database connections and freezes its objects out of the garbage
+collector, so that collections in the workers do not write to the shared
+pages. Each worker starts its own background threads after the fork.
+
+Live updates (GET /api/recipes/stream) are served on a separate port,
+RECIPE_STREAM_PORT on RECIPE_STREAM_HOST. Put a proxy in front of it and
+set RECIPE_STREAM_URL to the public URL of the stream.
+
+Signals to the parent process:
+  HUP   replaces the workers gracefully with new forks of the loaded app.
+  USR2  starts a new parent with the code now on disk, sharing the
+        listening socket. Its workers accept once it has warmed up. Then
+        send TERM to the old parent, whose workers finish what they are
+        serving and exit: a deploy without downtime.
+  TERM  exits after in-flight requests finish, waiting at most
+        --graceful-timeout seconds. INT and QUIT exit at once.
+"""
+import gc
+import os
+
+import click
+from gunicorn.app.base import BaseApplication
+
+# The app is imported inside RecipeServer.load: password hashing spawns
+# processes that import this script, and they do not need the app.
+
+
+def _post_fork(server, worker):
+    from app import start_background_threads
+    start_background_threads(server.app.wsgi())
+
+
+def _worker_exit(server, worker):
+    # The hashing pool's processes would otherwise outlive the worker
+    server.app.wsgi().extensions['password_hasher'].shutdown()
+
+
+class RecipeServer(BaseApplication):
+    """
+    gunicorn with the recipe app preloaded and warmed in the parent.
+    """
+
+    def __init__(self, options, warm_up=True):
+        self.options = options
+        self.warm_up = warm_up
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import create_app
+        from models import db
+        import warmup
+        app = create_app(background=False)
+        if app.config['RECIPE_STREAM_ENABLED'] and not app.config['RECIPE_STREAM_URL']:
+            app.logger.error("RECIPE_STREAM_URL is not set, so GET /api/recipes/stream will answer 503. "
+                             "Route a public URL to RECIPE_STREAM_HOST:RECIPE_STREAM_PORT and set it.")
+        if self.warm_up:
+            failed = {path: status for path, status in warmup.warm_up(app).items() if status >= 500}
+            if failed:
+                app.logger.warning("Warm-up requests failed: %s", failed)
+        # Workers must not share the parent's database connections
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        gc.freeze()
+        return app
+
+
+@click.command()
+@click.option('--bind', envvar='SERVE_BIND', default='127.0.0.1:8000', show_default=True,
+              help='HOST:PORT or unix:PATH to listen on.')
+@click.option('--workers', envvar='SERVE_WORKERS', type=int, default=os.cpu_count() or 1, show_default=True,
+              help='Worker processes.')
+@click.option('--threads', envvar='SERVE_THREADS', default=32, show_default=True,
+              help='Request threads per worker. Requests waiting for admission hold one.')
+@click.option('--timeout', default=60, show_default=True,
+              help='Seconds a silent worker is given before it is killed and replaced.')
+@click.option('--graceful-timeout', default=30, show_default=True,
+              help='Seconds workers get to finish in-flight requests on reload or shutdown.')
+@click.option('--pid', 'pidfile', help='PID file of the parent process.')
+@click.option('--access-log/--no-access-log', default=False, show_default=True, help='Log requests to stdout.')
+@click.option('--warm-up/--no-warm-up', default=True, show_default=True,
+              help='Replay warmup.WARM_UP_PATHS in the parent before listening.')
+def main(bind, workers, threads, timeout, graceful_timeout, pidfile, access_log, warm_up):
+    """Serve the app on preloaded, warmed worker processes."""
+    if workers > 1:
+        # The 'local' broker would only see changes made by the same worker
+        os.environ.setdefault('RECIPE_STREAM_BROKER', 'changelog')
+    RecipeServer({
+        'bind': bind,
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'preload_app': True,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'keepalive': 5,
+        'pidfile': pidfile,
+        'accesslog': '-' if access_log else None,
+        'post_fork': _post_fork,
+        'worker_exit': _worker_exit,
+        'proc_name': 'recipe-app',
+    }, warm_up=warm_up).run()
+
+
+if __name__ == '__main__':
+    main()
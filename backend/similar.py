@@ -0,0 +1,220 @@
+# similar.py
+import threading
+from collections import defaultdict
+
+import numpy as np
+from flask import current_app
+
+from models import db, Recipe, RecipeIngredient, chunked
+import changelog
+
+# Hash functions are h(x) = (a * x + b) mod _PRIME over ingredient ids;
+# a * x stays below 2**63 for ids below 2**31.
+_PRIME = (1 << 31) - 1
+# Rows of ingredient pairs hashed at once while building, to bound memory
+_BUILD_BATCH = 2000
+# Candidates re-ranked exactly per query; larger candidate sets are cut
+# down to this many by the Jaccard estimate from the signatures first.
+MAX_EXACT_CANDIDATES = 1000
+
+
+class SimilarityIndex:
+    """
+    MinHash/LSH index over the ingredient sets of recipes.
+
+    Each recipe's set of ingredient ids is reduced to a signature of
+    `bands * rows` minimum hashes, kept in one uint32 NumPy matrix. The
+    signature is cut into `bands` bands and the recipe is filed in one
+    bucket per band, so recipes with Jaccard similarity s share a bucket
+    with probability 1 - (1 - s**rows)**bands: 24 bands of 3 rows find 96%
+    of pairs at 0.5 and 18% at 0.2. A query re-ranks the recipes sharing a
+    bucket by exact Jaccard similarity.
+
+    Every worker process holds its own index. It is built on first use and
+    kept current by replaying the recipe change log (see changelog.py), so
+    writes made by any worker reach every index.
+    """
+
+    def __init__(self, bands=24, rows=3, seed=1):
+        self.bands = bands
+        self.rows = rows
+        random = np.random.default_rng(seed)
+        self._a = random.integers(1, _PRIME, bands * rows, dtype=np.uint64)
+        self._b = random.integers(0, _PRIME, bands * rows, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._signatures = np.zeros((0, self.bands * self.rows), dtype=np.uint32)
+        self._row_of = {}
+        self._free_rows = []
+        self._sets = {}
+        self._versions = {}
+        self._buckets = [defaultdict(set) for _ in range(self.bands)]
+        # Change-log position the index is current to; None until built
+        self.seq = None
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def signatures(self, ingredient_sets):
+        """
+        MinHash signatures of non-empty sets of ingredient ids, as a
+        (len(ingredient_sets), bands * rows) uint32 matrix.
+        """
+        lengths = np.fromiter((len(s) for s in ingredient_sets), dtype=np.int64, count=len(ingredient_sets))
+        values = np.fromiter((x for s in ingredient_sets for x in s), dtype=np.uint64, count=int(lengths.sum()))
+        hashes = (values[:, None] * self._a + self._b) % _PRIME
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return np.minimum.reduceat(hashes, starts, axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _remove(self, recipe_id):
+        row = self._row_of.pop(recipe_id, None)
+        if row is None:
+            return
+        for band, key in enumerate(self._band_keys(self._signatures[row])):
+            bucket = self._buckets[band][key]
+            bucket.discard(recipe_id)
+            if not bucket:
+                del self._buckets[band][key]
+        self._free_rows.append(row)
+        del self._sets[recipe_id]
+        del self._versions[recipe_id]
+
+    def _add_all(self, entries):
+        """
+        Files (recipe_id, version, ingredient_ids) entries, replacing any
+        earlier entry of the same recipes. Recipes without ingredients are
+        only removed.
+        """
+        for recipe_id, _, _ in entries:
+            self._remove(recipe_id)
+        entries = [entry for entry in entries if entry[2]]
+        if not entries:
+            return
+        signatures = self.signatures([ingredient_ids for _, _, ingredient_ids in entries])
+        needed = len(entries) - len(self._free_rows)
+        if needed > 0:
+            grown = max(needed, len(self._signatures))
+            self._free_rows.extend(range(len(self._signatures) + grown - 1, len(self._signatures) - 1, -1))
+            self._signatures = np.concatenate(
+                (self._signatures, np.zeros((grown, self.bands * self.rows), dtype=np.uint32)))
+        for (recipe_id, version, ingredient_ids), signature in zip(entries, signatures):
+            row = self._free_rows.pop()
+            self._signatures[row] = signature
+            self._row_of[recipe_id] = row
+            self._sets[recipe_id] = frozenset(ingredient_ids)
+            self._versions[recipe_id] = version
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band][key].add(recipe_id)
+
+    def _build(self):
+        self._clear()
+        # Read the position first: changes made during the build are replayed
+        self.seq = changelog.latest_seq()
+        versions = dict(db.session.query(Recipe.id, Recipe.version))
+        rows = db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id) \
+            .order_by(RecipeIngredient.recipe_id) \
+            .execution_options(yield_per=10000)
+        batch, current_id, current = [], None, []
+        for recipe_id, ingredient_id in rows:
+            if recipe_id != current_id:
+                if current_id in versions:
+                    batch.append((current_id, versions[current_id], current))
+                current_id, current = recipe_id, []
+                if len(batch) >= _BUILD_BATCH:
+                    self._add_all(batch)
+                    batch = []
+            current.append(ingredient_id)
+        if current_id in versions:
+            batch.append((current_id, versions[current_id], current))
+        self._add_all(batch)
+
+    def _load(self, recipe_ids):
+        ingredient_ids = defaultdict(list)
+        versions = {}
+        for chunk in chunked(recipe_ids):
+            versions.update(db.session.query(Recipe.id, Recipe.version).filter(Recipe.id.in_(chunk)))
+            rows = db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id) \
+                .filter(RecipeIngredient.recipe_id.in_(chunk))
+            for recipe_id, ingredient_id in rows:
+                ingredient_ids[recipe_id].append(ingredient_id)
+        return versions, ingredient_ids
+
+    def refresh(self):
+        """
+        Builds the index on first use and afterwards applies the change-log
+        entries written since the last refresh. Recipes whose content
+        version is unchanged (like count changes) are skipped. Must run
+        inside an app context.
+        """
+        with self._lock:
+            if self.seq is None:
+                self._build()
+                return
+            while True:
+                batch = changelog.read_changes(self.seq, current_app.config['RECIPE_CHANGES_PAGE_SIZE'])
+                if batch.resync:
+                    self._build()
+                    return
+                for recipe_id in batch.deleted:
+                    self._remove(recipe_id)
+                versions, ingredient_ids = self._load(batch.upserted) if batch.upserted else ({}, {})
+                for recipe_id in batch.upserted:
+                    if recipe_id not in versions:
+                        self._remove(recipe_id)
+                changed = [
+                    (recipe_id, version, ingredient_ids.get(recipe_id, []))
+                    for recipe_id, version in versions.items() if self._versions.get(recipe_id) != version
+                ]
+                self._add_all(changed)
+                self.seq = batch.next_since
+                if not batch.has_more:
+                    return
+
+    def query(self, recipe_id, k=10):
+        """
+        Returns up to `k` (recipe_id, jaccard) pairs most similar to the
+        recipe, best first, ties broken by lower id.
+        """
+        with self._lock:
+            row = self._row_of.get(recipe_id)
+            if row is None:
+                return []
+            signature = self._signatures[row]
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+            candidates.discard(recipe_id)
+            candidates = list(candidates)
+            if len(candidates) > MAX_EXACT_CANDIDATES:
+                rows = np.fromiter((self._row_of[c] for c in candidates), dtype=np.int64, count=len(candidates))
+                estimates = (self._signatures[rows] == signature).sum(axis=1)
+                keep = np.argpartition(-estimates, MAX_EXACT_CANDIDATES)[:MAX_EXACT_CANDIDATES]
+                candidates = [candidates[i] for i in keep]
+            target = self._sets[recipe_id]
+            scored = []
+            for candidate in candidates:
+                other = self._sets[candidate]
+                shared = len(target & other)
+                if shared:
+                    scored.append((shared / (len(target) + len(other) - shared), candidate))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(candidate, score) for score, candidate in scored[:k]]
+
+
+def similar_recipes(recipe_id, k=10):
+    """
+    Returns up to `k` (recipe_id, jaccard) pairs for the recipes whose
+    ingredients are most like the given recipe's, from an up-to-date index.
+    """
+    index = current_app.extensions['similar_index']
+    index.refresh()
+    return index.query(recipe_id, k)
+
+
+def init_app(app):
+    app.extensions['similar_index'] = SimilarityIndex(app.config['SIMILAR_BANDS'], app.config['SIMILAR_ROWS'])
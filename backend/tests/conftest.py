@@ -0,0 +1,69 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other by their flat names
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, User, Recipe  # noqa: E402
+from ingredients import sync_recipe_ingredients  # noqa: E402
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return str(tmp_path / 'test.db')
+
+
+@pytest.fixture
+def app_env():
+    """
+    Extra environment for create_app; override in a test module to change it.
+    """
+    return {}
+
+
+@pytest.fixture
+def app(database_path, app_env, monkeypatch):
+    """
+    An app on a fresh, migrated SQLite file, without background threads.
+    """
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///' + database_path)
+    monkeypatch.setenv('ASSETS_BUILD_ON_STARTUP', '0')
+    monkeypatch.setenv('PASSWORD_HASH_WORKERS', '0')
+    monkeypatch.setenv('RECIPE_STREAM_ENABLED', '0')
+    for name, value in app_env.items():
+        monkeypatch.setenv(name, value)
+    from app import create_app
+    app = create_app(background=False)
+    app.config['TESTING'] = True
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(email):
+        with app.app_context():
+            user = User(email=email, password_hash='unused')
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def make_recipe(app):
+    def make_recipe(creator_id, title='Recipe', ingredients='salt\npepper'):
+        with app.app_context():
+            recipe = Recipe(title=title, description='A recipe.', ingredients=ingredients,
+                            instructions='Cook it.', creator_id=creator_id)
+            db.session.add(recipe)
+            db.session.flush()
+            sync_recipe_ingredients(recipe.id, ingredients)
+            db.session.commit()
+            return recipe.id
+    return make_recipe
@@ -0,0 +1,67 @@
+# tests/test_admission.py
+import pytest
+
+from admission import AdaptiveLimiter, Overloaded, TokenBuckets
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+
+def test_empty_token_bucket_answers_429(app, make_user, make_recipe):
+    user_id = make_user('liker@example.com')
+    recipe_id = make_recipe(user_id)
+    app.extensions['rate_limits']['toggle'] = TokenBuckets(rate=0.1, burst=2)
+    client = app.test_client()
+    _login(client, user_id)
+
+    for _ in range(2):
+        assert client.post(f'/api/recipes/{recipe_id}/like').status_code == 200
+    response = client.post(f'/api/recipes/{recipe_id}/like')
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 10
+
+    # Buckets are per user
+    _login(client, make_user('other@example.com'))
+    assert client.post(f'/api/recipes/{recipe_id}/like').status_code == 200
+
+
+def test_full_limiter_answers_503_with_retry_after(app, make_user, make_recipe):
+    recipe_id = make_recipe(make_user('creator@example.com'))
+    limiter = AdaptiveLimiter('interactive', initial=1, minimum=1, maximum=1, queue=1, max_wait=0.05, target=1.0)
+    app.extensions['admission']['interactive'] = limiter
+    client = app.test_client()
+    assert client.get(f'/api/recipes/{recipe_id}').status_code == 200
+
+    # Another request holds the only slot
+    limiter.acquire()
+    response = client.get(f'/api/recipes/{recipe_id}')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    # Critical endpoints are never limited
+    assert client.get('/healthz/live').status_code == 200
+    limiter.release()
+    assert client.get(f'/api/recipes/{recipe_id}').status_code == 200
+    assert limiter.stats() == {'limit': 1, 'inflight': 0, 'waiting': 0}
+
+
+def test_limiter_rejects_beyond_its_queue():
+    limiter = AdaptiveLimiter('write', initial=1, minimum=1, maximum=1, queue=0, max_wait=5.0, target=1.0)
+    limiter.acquire()
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.reason == 'queue_full'
+
+
+def test_upload_offset_is_not_queued_behind_writes(app, make_user):
+    user_id = make_user('uploader@example.com')
+    write = app.extensions['admission']['write']
+    for _ in range(int(write.limit)):
+        write.acquire()
+    write.waiting = write.queue
+    client = app.test_client()
+    _login(client, user_id)
+
+    assert client.get('/api/uploads/unknown').status_code == 404
+    assert client.post('/api/uploads', json={'size': 10}).status_code == 503
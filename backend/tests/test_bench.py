@@ -0,0 +1,52 @@
+# tests/test_bench.py
+import copy
+import json
+import random
+
+from bench import datagen, driver, report
+from models import db, Recipe, User
+
+
+def test_generate_fills_the_database(app):
+    with app.app_context():
+        summary = datagen.generate(users=20, recipes=60, likes_per_user=3, saves_per_user=1, seed=7)
+        assert summary['users'] == db.session.query(User).count() == 20
+        assert summary['recipes'] == db.session.query(Recipe).count() == 60
+        liked = db.session.query(db.func.sum(Recipe.likes)).scalar()
+        assert liked == summary['likes'] > 0
+
+
+def test_recipe_lines_depend_only_on_the_seed():
+    def lines(seed):
+        # created_at is relative to the current time
+        return [dict(json.loads(line), created_at=None) for line in datagen.recipe_lines(random.Random(seed), 60, 20)]
+    assert lines(7) == lines(7)
+    assert lines(7) != lines(8)
+
+
+def test_run_report_and_compare(app):
+    with app.app_context():
+        datagen.generate(users=10, recipes=40, likes_per_user=2, saves_per_user=1, seed=3)
+    samples, elapsed = driver.run(app, concurrency=2, requests=40, warmup=5, seed=1)
+    assert len(samples) == 40
+    assert all(sample.status < 500 for sample in samples)
+
+    result = report.build_report(samples, elapsed, {'requests': 40})
+    assert result['overall']['requests'] == 40
+    assert report.compare(result, result) == []
+
+    # A baseline twice as fast makes every latency percentile a regression
+    faster = copy.deepcopy(result)
+    for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+        faster['overall'][metric] = max(result['overall'][metric], report.LATENCY_FLOOR_MS) / 2
+    regressions = report.compare(result, faster)
+    assert [line.split(':')[1].split()[0] for line in regressions if line.startswith('overall')] == \
+        ['p50_ms', 'p95_ms', 'p99_ms']
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert report.percentile(values, 0.50) == 50
+    assert report.percentile(values, 0.95) == 95
+    assert report.percentile(values, 1.0) == 100
+    assert report.percentile([], 0.5) is None
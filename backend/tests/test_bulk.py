@@ -0,0 +1,27 @@
+# tests/test_bulk.py
+import pytest
+
+
+@pytest.fixture
+def client(app, make_user):
+    user_id = make_user('cook@example.com')
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    client.user_id = user_id
+    return client
+
+
+@pytest.mark.parametrize('ids', [[True], [1, False], ['1'], [1.0], []])
+def test_batch_rejects_ids_that_are_not_integers(client, make_recipe, ids):
+    make_recipe(client.user_id)
+    response = client.post('/api/recipes/batch', json={'action': 'delete', 'ids': ids})
+    assert response.status_code == 400
+    assert client.get('/api/recipes').json['recipes']
+
+
+def test_batch_deletes_own_recipes(client, make_recipe):
+    ids = [make_recipe(client.user_id), make_recipe(client.user_id)]
+    response = client.post('/api/recipes/batch', json={'action': 'delete', 'ids': ids})
+    assert response.status_code == 200
+    assert client.get('/api/recipes').json['recipes'] == []
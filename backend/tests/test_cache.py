@@ -0,0 +1,53 @@
+# tests/test_cache.py
+import threading
+import time
+
+from cache import Entry, LocalCache, ResponseCache
+
+
+def test_list_pages_follow_likes(app, make_user, make_recipe):
+    user_id = make_user('cook@example.com')
+    recipe_id = make_recipe(user_id)
+    client = app.test_client()
+    assert client.get('/api/recipes').json['recipes'][0]['likes'] == 0
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    assert client.post(f'/api/recipes/{recipe_id}/like').status_code == 200
+    assert client.get('/api/recipes').json['recipes'][0]['likes'] == 1
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache(LocalCache(), ttl=60)
+    calls, results = [], []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return b'value'
+
+    def get():
+        start.wait()
+        results.append(cache.get_or_compute('key', compute))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [b'value'] * 8
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_near_expiry_are_refreshed_early():
+    cache = ResponseCache(LocalCache(), ttl=60)
+    now = time.monotonic()
+    assert cache._should_refresh_early(Entry(b'v', now, 0.5))
+    assert not cache._should_refresh_early(Entry(b'v', now + 3600, 0.001))
+
+    # Expiring now: one caller recomputes, the value is replaced
+    cache.backend.set('key', Entry(b'old', now + 0.001, 10.0), 60)
+    assert cache.get_or_compute('key', lambda: b'new') == b'new'
+    assert cache.early_refreshes == 1
+    assert cache.get_or_compute('key', lambda: b'newer') == b'new'
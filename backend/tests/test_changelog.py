@@ -0,0 +1,62 @@
+# tests/test_changelog.py
+import changelog
+from models import db
+
+
+def _record(app, recipe_ids, kind=changelog.UPSERT):
+    with app.app_context():
+        changelog.record_changes(recipe_ids, kind)
+        db.session.commit()
+
+
+def test_position_below_the_floor_must_resync(app):
+    _record(app, [1, 2, 3])
+    with app.app_context():
+        assert not changelog.read_changes(0, 100).resync
+        # Every entry is past a retention of 0 seconds
+        assert changelog.compact(0) == 3
+        batch = changelog.read_changes(0, 100)
+        assert batch.resync
+        assert batch.latest == batch.next_since == 3
+        assert not changelog.read_changes(3, 100).resync
+
+
+def test_resync_entry_makes_clients_resync(app):
+    _record(app, [1])
+    with app.app_context():
+        since = changelog.latest_seq()
+        changelog.record_resync()
+        db.session.commit()
+        batch = changelog.read_changes(since, 100)
+        assert batch.resync
+        assert batch.next_since == changelog.latest_seq()
+
+
+def test_compact_drops_superseded_entries_without_a_resync(app):
+    _record(app, [1, 2])
+    _record(app, [1])
+    _record(app, [1, 3])
+    with app.app_context():
+        assert changelog.compact(3600) == 2
+        batch = changelog.read_changes(0, 100)
+        assert not batch.resync
+        assert sorted(batch.upserted) == [1, 2, 3]
+        assert batch.next_since == 5
+
+
+def test_upsert_then_delete_is_reported_deleted(app, make_user, make_recipe):
+    user_id = make_user('cook@example.com')
+    recipe_id = make_recipe(user_id)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    since = client.get('/api/recipes/changes').json['latest']
+
+    assert client.put(f'/api/recipes/{recipe_id}', data={'title': 'Renamed'}).status_code == 200
+    assert client.delete(f'/api/recipes/{recipe_id}').status_code == 200
+
+    response = client.get(f'/api/recipes/changes?since={since}')
+    assert response.status_code == 200
+    assert response.json['recipes'] == []
+    assert response.json['deleted'] == [recipe_id]
+    assert response.json['next_since'] == response.json['latest']
@@ -0,0 +1,97 @@
+# tests/test_counters.py
+import threading
+
+import counters
+from counters import CatalogBumper, LikeCounterBuffer, toggle_membership, apply_like_delta
+from models import db, Recipe, user_liked_recipes
+from versions import CATALOG, counter_state
+
+
+def _toggle_likes(app, user_ids, recipe_id, toggles, threads_per_user=1):
+    errors = []
+
+    def run(user_id):
+        try:
+            for _ in range(toggles):
+                with app.app_context():
+                    _, delta = toggle_membership(user_liked_recipes, user_id, recipe_id)
+                    apply_like_delta(recipe_id, delta)
+                    db.session.commit()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(user_id,)) for user_id in user_ids for _ in range(threads_per_user)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def _likes_and_rows(app, recipe_id):
+    with app.app_context():
+        likes = db.session.get(Recipe, recipe_id).likes
+        rows = db.session.query(user_liked_recipes).filter_by(recipe_id=recipe_id).count()
+    return likes, rows
+
+
+def test_concurrent_toggles_keep_the_count_exact(app, make_user, make_recipe):
+    user_ids = [make_user(f'user{i}@example.com') for i in range(8)]
+    recipe_id = make_recipe(user_ids[0])
+
+    # Three threads per user racing on the same row, 3 toggles each: 9
+    # toggles per user, so every user ends up liking the recipe
+    _toggle_likes(app, user_ids, recipe_id, toggles=3, threads_per_user=3)
+
+    assert _likes_and_rows(app, recipe_id) == (len(user_ids), len(user_ids))
+
+
+def test_failed_buffer_flush_is_merged_back(app, make_user, make_recipe, monkeypatch):
+    user_ids = [make_user(f'user{i}@example.com') for i in range(8)]
+    recipe_id = make_recipe(user_ids[0])
+    buffer = app.extensions['like_counter'] = LikeCounterBuffer(app, interval=3600, max_pending=10 ** 6)
+    try:
+        _toggle_likes(app, user_ids, recipe_id, toggles=1)
+        pending = buffer.pending(recipe_id)
+        assert pending == _likes_and_rows(app, recipe_id)[1] == len(user_ids)
+
+        def fail(recipe_ids):
+            raise RuntimeError('flush failed')
+
+        monkeypatch.setattr(counters.changelog, 'record_changes', fail)
+        assert buffer.flush() == 0
+        assert buffer.pending(recipe_id) == pending
+        assert _likes_and_rows(app, recipe_id)[0] == 0
+
+        # Unlikes arrive before the retry and merge with the restored delta
+        _toggle_likes(app, user_ids[:3], recipe_id, toggles=1)
+        monkeypatch.undo()
+        assert buffer.flush() == 1
+        assert buffer.pending(recipe_id) == 0
+        assert _likes_and_rows(app, recipe_id) == (len(user_ids) - 3, len(user_ids) - 3)
+    finally:
+        buffer.stop()
+        del app.extensions['like_counter']
+
+
+def test_likes_bump_the_catalog_once_per_interval(app, make_user, make_recipe):
+    user_ids = [make_user(f'user{i}@example.com') for i in range(5)]
+    recipe_id = make_recipe(user_ids[0])
+    bumper = CatalogBumper(app, interval=3600)
+    app.extensions['catalog_bumper'] = bumper
+    with app.app_context():
+        before, _ = counter_state(CATALOG)
+
+    client = app.test_client()
+    for user_id in user_ids:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        assert client.post(f'/api/recipes/{recipe_id}/like').status_code == 200
+    with app.app_context():
+        assert counter_state(CATALOG)[0] == before
+
+    assert bumper.bump()
+    assert not bumper.bump()
+    bumper.stop()
+    with app.app_context():
+        assert counter_state(CATALOG)[0] == before + 1
@@ -0,0 +1,60 @@
+# tests/test_database.py
+import sqlite3
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+
+from database import READ_BIND
+from models import db
+
+
+@pytest.fixture
+def app_env():
+    return {'DATABASE_READ_POOL': '1'}
+
+
+def test_read_only_view_runs_while_a_write_transaction_is_open(app, database_path, make_user, make_recipe):
+    recipe_id = make_recipe(make_user('creator@example.com'))
+    with app.app_context():
+        read_engine = db.engines[READ_BIND]
+    read_statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        read_statements.append(statement)
+
+    writer = sqlite3.connect(database_path, isolation_level=None)
+    # EXCLUSIVE locks readers out unless the database is in WAL mode
+    writer.execute('BEGIN EXCLUSIVE')
+    writer.execute('UPDATE recipe SET likes = 99 WHERE id = ?', (recipe_id,))
+    event.listen(read_engine, 'before_cursor_execute', count)
+    try:
+        result = {}
+
+        def read():
+            started = time.perf_counter()
+            try:
+                response = app.test_client().get(f'/api/recipes/{recipe_id}')
+            except Exception as e:
+                result['error'] = e
+                return
+            result['seconds'] = time.perf_counter() - started
+            result['status'] = response.status_code
+            result['body'] = response.get_json()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(10)
+        assert not reader.is_alive()
+        # Blocking on the writer would take the 5 s busy timeout or fail
+        # with "database is locked"
+        assert 'error' not in result, result.get('error')
+        assert result['status'] == 200, result['body']
+        assert result['seconds'] < 1.0
+        assert result['body']['likes'] == 0
+        assert read_statements, 'the read_only view did not use the read pool'
+    finally:
+        event.remove(read_engine, 'before_cursor_execute', count)
+        writer.execute('ROLLBACK')
+        writer.close()
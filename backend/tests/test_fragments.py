@@ -0,0 +1,44 @@
+# tests/test_fragments.py
+import json
+
+from fragments import FragmentCache
+from models import db, Recipe
+from versions import touch_recipe
+
+# JSON-escaped inside a string, so it must not be taken for the likes key
+TRICKY_TITLE = 'Pie "likes":0 of the house'
+
+
+def _render(app, cache, recipe_id):
+    with app.app_context():
+        recipe = db.session.get(Recipe, recipe_id)
+        return json.loads(cache.render([recipe])[0])
+
+
+def test_like_changes_the_spliced_count_without_a_version_bump(app, make_user, make_recipe):
+    recipe_id = make_recipe(make_user('cook@example.com'), TRICKY_TITLE)
+    cache = FragmentCache()
+    first = _render(app, cache, recipe_id)
+    assert (first['title'], first['likes']) == (TRICKY_TITLE, 0)
+
+    with app.app_context():
+        version = db.session.get(Recipe, recipe_id).version
+        db.session.execute(Recipe.__table__.update().where(Recipe.id == recipe_id).values(likes=42))
+        db.session.commit()
+        assert db.session.get(Recipe, recipe_id).version == version
+    second = _render(app, cache, recipe_id)
+    assert second == dict(first, likes=42)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_version_bump_misses_the_fragment_cache(app, make_user, make_recipe):
+    recipe_id = make_recipe(make_user('cook@example.com'))
+    cache = FragmentCache()
+    _render(app, cache, recipe_id)
+    with app.app_context():
+        recipe = db.session.get(Recipe, recipe_id)
+        recipe.title = 'Renamed'
+        touch_recipe(recipe)
+        db.session.commit()
+    assert _render(app, cache, recipe_id)['title'] == 'Renamed'
+    assert (cache.hits, cache.misses) == (0, 2)
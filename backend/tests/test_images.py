@@ -0,0 +1,57 @@
+# tests/test_images.py
+import hashlib
+import io
+import os
+
+import pytest
+
+import images
+from models import db, ImageBlob
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _store_blob(app, tmp_path, content, ext):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = tmp_path / ImageBlob.blob_path(sha256, ext)
+    os.makedirs(path.parent, exist_ok=True)
+    path.write_bytes(content)
+    with app.app_context():
+        db.session.add(ImageBlob(sha256=sha256, ext=ext, size=len(content), ref_count=1))
+        db.session.commit()
+    return sha256
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _status(app, sha256):
+    with app.app_context():
+        return db.session.get(ImageBlob, sha256).status
+
+
+def test_variants_are_generated(app, tmp_path):
+    sha256 = _store_blob(app, tmp_path, _png(400, 300), 'png')
+    with app.app_context():
+        images._generate_variants(sha256)
+    assert _status(app, sha256) == 'ready'
+
+
+def test_truncated_image_is_marked_failed(app, tmp_path):
+    sha256 = _store_blob(app, tmp_path, b'\x89PNG\r\n\x1a\n' + b'x' * 100, 'png')
+    with app.app_context():
+        images._generate_variants(sha256)
+    assert _status(app, sha256) == 'failed'
+
+
+def test_decompression_bomb_is_marked_failed(app, tmp_path, monkeypatch):
+    # Over twice the limit raises DecompressionBombError, not OSError
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    sha256 = _store_blob(app, tmp_path, _png(400, 300), 'png')
+    with app.app_context():
+        images._generate_variants(sha256)
+    assert _status(app, sha256) == 'failed'
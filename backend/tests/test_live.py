@@ -0,0 +1,64 @@
+# tests/test_live.py
+import json
+import socket
+import time
+
+import pytest
+
+from live import LiveHub, LocalBroker, STREAM_PATH
+
+
+@pytest.fixture
+def hub(app):
+    hub = LiveHub(app, LocalBroker(), min_interval=0.5, heartbeat=0.1)
+    hub.ensure_started('127.0.0.1', 0)
+    app.extensions['live_hub'] = hub
+    yield hub
+    deadline = time.monotonic() + 5
+    while hub.connections and time.monotonic() < deadline:
+        time.sleep(0.01)
+    hub.stop()
+
+
+def _read_events(sock, until, deadline):
+    buffer, events = b'', []
+    while time.monotonic() < deadline and not until(events):
+        try:
+            data = sock.recv(4096)
+        except socket.timeout:
+            continue
+        if not data:
+            break
+        buffer += data
+        while b'\n\n' in buffer:
+            block, buffer = buffer.split(b'\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.decode().split('\n') if ': ' in line)
+            if 'event' in fields:
+                events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_burst_of_likes_is_coalesced(app, hub, make_user, make_recipe):
+    user_ids = [make_user(f'user{i}@example.com') for i in range(6)]
+    recipe_id = make_recipe(user_ids[0])
+
+    sock = socket.create_connection(('127.0.0.1', hub.port))
+    sock.settimeout(0.1)
+    sock.sendall(f'GET {STREAM_PATH}?ids={recipe_id} HTTP/1.1\r\nHost: test\r\n\r\n'.encode())
+    deadline = time.monotonic() + 5
+    while recipe_id not in hub._states and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    client = app.test_client()
+    for user_id in user_ids:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        assert client.post(f'/api/recipes/{recipe_id}/like').status_code == 200
+
+    events = _read_events(sock, lambda events: events and events[-1][1]['likes'] == 6, time.monotonic() + 5)
+    sock.close()
+    # Six likes within one interval: the first is announced at once, the
+    # rest as one event with the latest count
+    assert events[-1] == ('likes', {'id': recipe_id, 'likes': 6})
+    assert len(events) <= 2
+    assert all(kind == 'likes' for kind, _ in events)
@@ -0,0 +1,47 @@
+# tests/test_migrations.py
+import sqlite3
+
+import pytest
+
+from migrations import HOT_QUERIES, LATEST_VERSION, check_query_plans, current_version
+from models import db
+
+# Schema of the first release, before any migration existed
+_LEGACY_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, email VARCHAR(120) NOT NULL, password_hash VARCHAR(128) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (email)
+);
+CREATE TABLE recipe (
+    id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, description TEXT, ingredients TEXT,
+    instructions TEXT NOT NULL, image_filename VARCHAR(255), likes INTEGER, created_at DATETIME,
+    creator_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(creator_id) REFERENCES user (id)
+);
+CREATE TABLE user_saved_recipes (
+    user_id INTEGER NOT NULL, recipe_id INTEGER NOT NULL, PRIMARY KEY (user_id, recipe_id),
+    FOREIGN KEY(user_id) REFERENCES user (id), FOREIGN KEY(recipe_id) REFERENCES recipe (id)
+);
+CREATE TABLE user_liked_recipes (
+    user_id INTEGER NOT NULL, recipe_id INTEGER NOT NULL, PRIMARY KEY (user_id, recipe_id),
+    FOREIGN KEY(user_id) REFERENCES user (id), FOREIGN KEY(recipe_id) REFERENCES recipe (id)
+);
+"""
+
+
+@pytest.fixture(params=['fresh', 'legacy'])
+def database_path(request, tmp_path):
+    path = str(tmp_path / 'test.db')
+    if request.param == 'legacy':
+        with sqlite3.connect(path) as connection:
+            connection.executescript(_LEGACY_SCHEMA)
+    return path
+
+
+def test_hot_queries_use_indexes_after_upgrade(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert current_version(connection) == LATEST_VERSION
+        failures = check_query_plans()
+    assert not failures, '\n'.join(f'{name}: {"; ".join(scans)}' for name, scans in failures.items())
+    assert len(HOT_QUERIES) > 0
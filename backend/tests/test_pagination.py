@@ -0,0 +1,47 @@
+# tests/test_pagination.py
+from sqlalchemy import event
+
+from models import db
+
+
+def _statements_for(app, path):
+    client = app.test_client()
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(path)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+
+def test_list_page_statement_count_does_not_grow_with_page_size(app, make_user, make_recipe):
+    creators = [make_user(f'creator{i}@example.com') for i in range(10)]
+    for i in range(60):
+        make_recipe(creators[i % len(creators)], title=f'Recipe {i}')
+
+    counts = {}
+    for limit in (5, 20, 50):
+        body, counts[limit] = _statements_for(app, f'/api/recipes?limit={limit}')
+        assert len(body['recipes']) == limit
+        assert len({recipe['creatorEmail'] for recipe in body['recipes']}) > 1
+    assert counts[5] == counts[20] == counts[50]
+
+
+def test_crafted_cursor_values_are_rejected(app):
+    from pagination import encode_cursor
+    client = app.test_client()
+    for path, sort in (('/api/recipes?sort=likes', 'likes'), ('/api/recipes/trending', 'trending'),
+                       ('/api/recipes/search?q=soup', 'search')):
+        for value in ([1], {'a': 1}, 'x', True):
+            response = client.get(f'{path}&cursor={encode_cursor(sort, value, 1)}'.replace('&', '?', '?' not in path))
+            assert response.status_code == 400, (path, value)
@@ -0,0 +1,38 @@
+# tests/test_passwords.py
+import os
+
+import pytest
+
+from passwords import HashingBusy, PasswordHasher
+
+
+def _crash():
+    os._exit(1)
+
+
+def _double(value):
+    return value * 2
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, timeout=30)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_broken_pool_is_rebuilt_once(hasher):
+    assert hasher._run(_double, 2) == 4
+    # A pool process dies between two calls
+    for process in list(hasher._pool._processes.values()):
+        process.kill()
+        process.join()
+    assert hasher._run(_double, 3) == 6
+
+
+def test_pool_that_keeps_breaking_is_reported_busy(hasher):
+    with pytest.raises(HashingBusy) as excinfo:
+        hasher._run(_crash)
+    assert excinfo.value.reason == 'broken'
+    # The slot was released and the next call gets a fresh pool
+    assert hasher.verify(hasher.hash('secret'), 'secret')
@@ -0,0 +1,27 @@
+# tests/test_similar.py
+from similar import similar_recipes
+
+INGREDIENTS = 'flour\nsugar\nbutter\neggs\nmilk\nvanilla'
+
+
+def test_refresh_applies_updates_and_deletes(app, make_user, make_recipe):
+    user_id = make_user('baker@example.com')
+    cake = make_recipe(user_id, 'Cake', INGREDIENTS)
+    sponge = make_recipe(user_id, 'Sponge', INGREDIENTS)
+    muffins = make_recipe(user_id, 'Muffins', INGREDIENTS)
+    with app.app_context():
+        assert similar_recipes(cake) == [(sponge, 1.0), (muffins, 1.0)]
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    response = client.put(f'/api/recipes/{sponge}', data={'ingredients': 'salt\npepper\nolive oil'})
+    assert response.status_code == 200
+    with app.app_context():
+        assert similar_recipes(cake) == [(muffins, 1.0)]
+        assert similar_recipes(sponge) == []
+
+    assert client.delete(f'/api/recipes/{muffins}').status_code == 200
+    with app.app_context():
+        assert similar_recipes(cake) == []
+        assert similar_recipes(muffins) == []
@@ -0,0 +1,60 @@
+# tests/test_uploads.py
+import hashlib
+
+import pytest
+
+import upload_routes
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 8
+
+
+@pytest.fixture
+def client(app, make_user, tmp_path):
+    app.config['UPLOAD_PARTIAL_FOLDER'] = str(tmp_path)
+    user_id = make_user('uploader@example.com')
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def _start(client):
+    response = client.post('/api/uploads', json={'size': len(PNG)})
+    assert response.status_code == 201
+    return response.json['token']
+
+
+def test_put_at_a_claimed_offset_is_rejected(app, client):
+    token = _start(client)
+    with app.app_context():
+        # Another request is streaming the chunk at offset 0
+        lease = upload_routes._claim_chunk(token, 0)
+    assert lease is not None
+
+    response = client.put(f'/api/uploads/{token}?offset=0', data=PNG)
+    assert response.status_code == 409
+    assert response.json['offset'] == 0
+
+    with app.app_context():
+        assert upload_routes._release_chunk(token, lease, 0)
+    response = client.put(f'/api/uploads/{token}?offset=0', data=PNG)
+    assert response.status_code == 200
+    assert response.json['offset'] == len(PNG)
+    response = client.post(f'/api/uploads/{token}/finalize')
+    assert response.status_code == 200
+    assert response.json['sha256'] == hashlib.sha256(PNG).hexdigest()
+
+
+def test_finalize_uses_the_streamed_hash_or_reads_the_file(app, client):
+    first, second = _start(client), _start(client)
+    for token in (first, second):
+        assert client.put(f'/api/uploads/{token}?offset=0', data=PNG).status_code == 200
+    # The second upload's chunks went to another worker
+    with upload_routes._hashers_lock:
+        upload_routes._hashers.pop(second)
+
+    for token in (first, second):
+        response = client.post(f'/api/uploads/{token}/finalize')
+        assert response.status_code == 200
+        assert response.json['sha256'] == hashlib.sha256(PNG).hexdigest()
+    assert first not in upload_routes._hashers
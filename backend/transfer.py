@@ -0,0 +1,229 @@
+# transfer.py
+import datetime
+import json
+import re
+
+import click
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Recipe, User, ImageBlob, chunked
+from ingredients import add_recipe_ingredients
+from search import reindex_recipes
+from versions import bump_catalog_version
+import images
+import trending
+import changelog
+
+# Recipes move between environments as NDJSON: one JSON object per line with
+# the fields below. Creators are referenced by email and images by content
+# hash, so the target needs the same users and image blobs; ids are not
+# preserved.
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+# Only this many per-line errors are reported in detail; all are counted
+MAX_REPORTED_ERRORS = 1000
+_OUTPUT_BUFFER_SIZE = 64 * 1024
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def export_lines(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields every recipe as an NDJSON line, in id order. Rows are streamed
+    from the database `batch_size` at a time, so memory use does not grow
+    with the catalog.
+    """
+    query = select(
+        Recipe.id, Recipe.title, Recipe.description, Recipe.ingredients, Recipe.instructions,
+        Recipe.image_hash, Recipe.created_at, User.email
+    ).join(User, User.id == Recipe.creator_id).order_by(Recipe.id)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for row in result:
+        yield json.dumps({
+            'id': row.id,
+            'title': row.title,
+            'description': row.description,
+            'ingredients': row.ingredients,
+            'instructions': row.instructions,
+            'image_hash': row.image_hash,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'creatorEmail': row.email,
+        }, separators=(',', ':')) + '\n'
+
+
+def buffered(lines, size=_OUTPUT_BUFFER_SIZE):
+    """
+    Joins lines into chunks of about `size` characters, so a streamed
+    response is not written one small line at a time.
+    """
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _parse(raw):
+    """
+    Validates one NDJSON line and returns (row values, creator email, image hash).
+    Raises ValueError with a message for the import report.
+    """
+    record = json.loads(raw)
+    if not isinstance(record, dict):
+        raise ValueError("line is not a JSON object")
+    for field in ('title', 'instructions', 'creatorEmail'):
+        if not isinstance(record.get(field), str) or not record[field].strip():
+            raise ValueError(f"{field} is required")
+    if len(record['title']) > 100:
+        raise ValueError("title is longer than 100 characters")
+    for field in ('description', 'ingredients'):
+        if record.get(field) is not None and not isinstance(record[field], str):
+            raise ValueError(f"{field} must be a string")
+    image_hash = record.get('image_hash')
+    if image_hash is not None and (not isinstance(image_hash, str) or not _SHA256.match(image_hash)):
+        raise ValueError("image_hash must be a sha256 hex digest")
+    created_at = datetime.datetime.utcnow()
+    if record.get('created_at'):
+        try:
+            created_at = datetime.datetime.fromisoformat(record['created_at'])
+        except (TypeError, ValueError):
+            raise ValueError("created_at must be an ISO 8601 timestamp")
+    values = {
+        'title': record['title'],
+        'description': record.get('description'),
+        'ingredients': record.get('ingredients') or '',
+        'instructions': record['instructions'],
+        'likes': 0,
+        'created_at': created_at,
+        'updated_at': created_at,
+        'version': 1,
+        'image_hash': image_hash,
+    }
+    return values, record['creatorEmail'], image_hash
+
+
+class ImportReport:
+    """
+    Running totals of an import: recipes imported and per-line errors.
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def _resolve_creators(emails, creators):
+    # `creators` caches email -> user id (None for unknown) across batches
+    missing = [email for email in emails if email not in creators]
+    for chunk in chunked(missing):
+        creators.update(db.session.query(User.email, User.id).filter(User.email.in_(chunk)))
+    for email in missing:
+        creators.setdefault(email, None)
+
+
+def _known_blobs(hashes):
+    known = {}
+    for chunk in chunked(hashes):
+        known.update(db.session.query(ImageBlob.sha256, ImageBlob.ext).filter(ImageBlob.sha256.in_(chunk)))
+    return known
+
+
+def _import_batch(batch, report, creators):
+    parsed = []
+    for line, raw in batch:
+        try:
+            parsed.append((line,) + _parse(raw))
+        except ValueError as e:
+            report.error(line, str(e))
+
+    _resolve_creators({email for _, _, email, _ in parsed}, creators)
+    blobs = _known_blobs({image_hash for _, _, _, image_hash in parsed if image_hash})
+
+    lines, rows = [], []
+    for line, values, email, image_hash in parsed:
+        if creators[email] is None:
+            report.error(line, f"unknown creatorEmail {email}")
+            continue
+        if image_hash and image_hash not in blobs:
+            report.error(line, f"unknown image_hash {image_hash}")
+            continue
+        values['creator_id'] = creators[email]
+        values['image_filename'] = ImageBlob.blob_path(image_hash, blobs[image_hash]) if image_hash else None
+        lines.append(line)
+        rows.append(values)
+    if not rows:
+        return
+
+    try:
+        insert = Recipe.__table__.insert().returning(Recipe.__table__.c.id, sort_by_parameter_order=True)
+        ids = [row[0] for row in db.session.execute(insert, rows)]
+        add_recipe_ingredients({recipe_id: row['ingredients'] for recipe_id, row in zip(ids, rows)})
+        reindex_recipes(ids)
+        trending.add_recipes(ids)
+        images.retain_images([row['image_hash'] for row in rows if row['image_hash']])
+        changelog.record_changes(ids)
+        bump_catalog_version()
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        for line in lines:
+            report.error(line, f"batch failed: {e.__class__.__name__}: {e.orig if hasattr(e, 'orig') else e}")
+        return
+    report.imported += len(rows)
+
+
+def import_recipes(stream, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Imports recipes from an iterable of NDJSON lines (str or bytes), reading
+    it incrementally. Each batch of `batch_size` lines is inserted with
+    executemany statements and committed on its own; invalid lines are
+    reported and skipped without affecting the rest of their batch.
+    Returns an ImportReport.
+    """
+    report = ImportReport()
+    creators = {}
+    batch = []
+    for line, raw in enumerate(stream, 1):
+        if not raw.strip():
+            continue
+        batch.append((line, raw))
+        if len(batch) >= batch_size:
+            _import_batch(batch, report, creators)
+            batch = []
+    if batch:
+        _import_batch(batch, report, creators)
+    return report
+
+
+def init_app(app):
+    @app.cli.command('export-recipes')
+    @click.argument('output', type=click.File('w'), default='-')
+    def export_recipes_command(output):
+        """Write every recipe as NDJSON to OUTPUT (default stdout)."""
+        for chunk in buffered(export_lines()):
+            output.write(chunk)
+
+    @app.cli.command('import-recipes')
+    @click.argument('source', type=click.File('rb'), default='-')
+    @click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+    def import_recipes_command(source, batch_size):
+        """Import NDJSON recipes from SOURCE (default stdin)."""
+        report = import_recipes(source, batch_size=batch_size)
+        for error in report.errors:
+            click.echo(f"line {error['line']}: {error['error']}", err=True)
+        click.echo(f'Imported {report.imported} recipes, {report.failed} lines failed.')
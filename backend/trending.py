@@ -0,0 +1,189 @@
+# trending.py
+import datetime
+import threading
+
+import click
+from flask import current_app
+from sqlalchemy import and_, literal, or_, select
+from sqlalchemy.orm import load_only
+
+from models import db, Recipe, RecipeTrending, insert_ignore, chunked
+from counters import current_likes
+from pagination import Page, FIELD_COLUMNS, encode_cursor, decode_cursor
+from versions import bump_catalog_version
+
+# Scores follow the Hacker News formula: likes / (age in hours + 2) ^ gravity.
+# A higher gravity makes older recipes sink faster. Because the score decays
+# with time, stored scores are refreshed in two ways: incrementally whenever a
+# recipe's like count changes, and for the whole catalog by a periodic batch
+# job (TrendingRescorer / `flask rescore-trending`).
+
+
+def trending_score(likes, created_at, now, gravity):
+    age_hours = max(0.0, (now - (created_at or now)).total_seconds() / 3600)
+    return max(0, likes or 0) / (age_hours + 2) ** gravity
+
+
+def rescore_recipe(recipe_id):
+    """
+    Recomputes one recipe's trending score from its current like count.
+    Runs inside the caller's transaction, after the like count change.
+    """
+    now = datetime.datetime.utcnow()
+    created_at = db.session.query(Recipe.created_at).filter_by(id=recipe_id).scalar()
+    score = trending_score(current_likes(recipe_id), created_at, now, current_app.config['TRENDING_GRAVITY'])
+    inserted = db.session.execute(
+        insert_ignore(RecipeTrending.__table__).values(recipe_id=recipe_id, score=score, scored_at=now)
+    ).rowcount
+    if not inserted:
+        db.session.execute(
+            RecipeTrending.__table__.update()
+            .where(RecipeTrending.recipe_id == recipe_id)
+            .values(score=score, scored_at=now)
+        )
+
+
+def add_recipes(recipe_ids):
+    """
+    Adds new, not yet liked recipes to the trending table with one
+    executemany. Runs inside the caller's transaction.
+    """
+    now = datetime.datetime.utcnow()
+    if recipe_ids:
+        db.session.execute(
+            RecipeTrending.__table__.insert(),
+            [{'recipe_id': recipe_id, 'score': 0.0, 'scored_at': now} for recipe_id in recipe_ids]
+        )
+
+
+def remove_recipes(recipe_ids):
+    """
+    Drops recipes from the trending table. Runs inside the caller's transaction.
+    """
+    for chunk in chunked(recipe_ids):
+        db.session.execute(RecipeTrending.__table__.delete().where(RecipeTrending.recipe_id.in_(chunk)))
+
+
+def rescore_all(batch_size=500):
+    """
+    Applies time decay to every stored score, `batch_size` recipes per
+    transaction so writers are never blocked for long. Recipes without a
+    trending row are added first. Recipes with no likes keep their score of 0
+    and are skipped. Returns the number of recipes rescored.
+    """
+    now = datetime.datetime.utcnow()
+    gravity = current_app.config['TRENDING_GRAVITY']
+    buffer = current_app.extensions.get('like_counter')
+
+    missing = select(Recipe.id, literal(0.0), literal(now, db.DateTime)).where(
+        ~select(RecipeTrending.recipe_id).where(RecipeTrending.recipe_id == Recipe.id).exists()
+    )
+    db.session.execute(RecipeTrending.__table__.insert().from_select(['recipe_id', 'score', 'scored_at'], missing))
+    db.session.commit()
+
+    update = RecipeTrending.__table__.update() \
+        .where(RecipeTrending.recipe_id == db.bindparam('id')) \
+        .values(score=db.bindparam('score'), scored_at=now)
+    rescored = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Recipe.id, Recipe.likes, Recipe.created_at) \
+            .filter(Recipe.id > last_id, Recipe.likes > 0) \
+            .order_by(Recipe.id).limit(batch_size).all()
+        if not rows:
+            break
+        params = []
+        for recipe_id, likes, created_at in rows:
+            if buffer is not None:
+                likes += buffer.pending(recipe_id)
+            params.append({'id': recipe_id, 'score': trending_score(likes, created_at, now, gravity)})
+        db.session.execute(update, params)
+        db.session.commit()
+        rescored += len(rows)
+        last_id = rows[-1][0]
+
+    # The trending feed's order changed, so cached pages must not be reused
+    bump_catalog_version()
+    db.session.commit()
+    return rescored
+
+
+def paginate_trending(cursor=None, limit=24, fields=None):
+    """
+    Returns one page of recipes in trending order. Reads the precomputed
+    (score, recipe_id) index only; nothing is scored or sorted per request.
+    """
+    query = db.session.query(Recipe, RecipeTrending.score) \
+        .join(RecipeTrending, RecipeTrending.recipe_id == Recipe.id)
+    if fields is not None:
+        columns = {Recipe.id, Recipe.version}
+        for field in fields:
+            columns.update(FIELD_COLUMNS.get(field, []))
+        query = query.options(load_only(*columns))
+
+    if cursor:
+        score, last_id = decode_cursor(cursor, 'trending')
+        query = query.filter(or_(
+            RecipeTrending.score < score,
+            and_(RecipeTrending.score == score, RecipeTrending.recipe_id < last_id)
+        ))
+
+    rows = query.order_by(RecipeTrending.score.desc(), RecipeTrending.recipe_id.desc()).limit(limit + 1).all()
+    items = [recipe for recipe, _ in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last, score = rows[limit - 1]
+        next_cursor = encode_cursor('trending', score, last.id)
+    return Page(items, next_cursor)
+
+
+class TrendingRescorer:
+    """
+    Background thread running rescore_all every `interval` seconds.
+    Each worker process runs its own; set TRENDING_RESCORE_INTERVAL to 0
+    and schedule `flask rescore-trending` instead to rescore from one place.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trending-rescore', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    rescore_all(self.app.config['TRENDING_BATCH_SIZE'])
+                except Exception:
+                    self.app.logger.exception("Trending rescore failed")
+                    db.session.rollback()
+
+
+def start_background(app):
+    """
+    Starts the periodic rescorer unless TRENDING_RESCORE_INTERVAL is 0.
+    """
+    if app.config['TRENDING_RESCORE_INTERVAL']:
+        app.extensions['trending_rescorer'] = TrendingRescorer(app, app.config['TRENDING_RESCORE_INTERVAL'])
+
+
+def init_app(app):
+    """
+    Fills the trending table for recipes created before it existed and
+    registers the rescore CLI command.
+    """
+    @app.cli.command('rescore-trending')
+    def rescore_trending_command():
+        """Recompute time-decayed trending scores for all recipes."""
+        count = rescore_all(app.config['TRENDING_BATCH_SIZE'])
+        click.echo(f'Rescored {count} recipes.')
+
+    with app.app_context():
+        if db.session.query(RecipeTrending.recipe_id).first() is None \
+                and db.session.query(Recipe.id).first() is not None:
+            rescore_all(app.config['TRENDING_BATCH_SIZE'])
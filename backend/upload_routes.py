@@ -0,0 +1,300 @@
+# upload_routes.py
+import datetime
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+import click
+from flask import Blueprint, request, jsonify, session, current_app
+from sqlalchemy import and_, or_
+
+from models import db, UploadSession
+from auth_routes import login_required
+from images import MAGIC_LENGTH, detect_image_type
+
+# Blueprint for resumable chunked image uploads:
+#   POST /uploads                   start an upload, returns a token
+#   GET  /uploads/<token>           current offset, to resume after a failure
+#   PUT  /uploads/<token>?offset=N  append the request body at offset N
+#   POST /uploads/<token>/finalize  check the size and compute the content hash
+# The token is then passed as `upload_token` to the recipe create/update routes.
+upload_bp = Blueprint('upload_bp', __name__)
+
+READ_SIZE = 64 * 1024
+# Seconds a PUT owns an upload while it streams its chunk. The claim of a
+# worker that died mid-chunk can be taken over after this.
+CHUNK_LEASE_SECONDS = 120
+
+# Running hashes of uploads this process is receiving, keyed by token, as
+# (offset hashed so far, hashlib object). A chunk handled by another worker,
+# or a restart, just means the file prefix is re-hashed once from disk.
+_hashers = {}
+_hashers_lock = threading.Lock()
+_last_collection = [0.0]
+
+
+def partial_path(token):
+    return os.path.join(current_app.config['UPLOAD_PARTIAL_FOLDER'], f'{token}.part')
+
+
+def _hasher_at(token, offset):
+    """
+    Returns a sha256 object that has consumed exactly the first `offset`
+    bytes of the upload.
+    """
+    with _hashers_lock:
+        cached = _hashers.pop(token, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(partial_path(token), 'rb') as f:
+        remaining = offset
+        while remaining:
+            chunk = f.read(min(READ_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest
+
+
+def _claim_chunk(token, offset):
+    """
+    Marks the upload as being written by this request if `offset` is still
+    the number of bytes received, or if the previous writer's lease ran out.
+    Commits at once and returns the lease (the claim time), or None when
+    another request owns the upload or the offset is stale.
+    """
+    now = datetime.datetime.utcnow()
+    expired = now - datetime.timedelta(seconds=CHUNK_LEASE_SECONDS)
+    table = UploadSession.__table__
+    claimed = db.session.execute(
+        table.update()
+        .where(
+            table.c.token == token,
+            table.c.received == offset,
+            or_(table.c.status == 'open', and_(table.c.status == 'writing', table.c.updated_at < expired)),
+        )
+        .values(status='writing', updated_at=now)
+    ).rowcount
+    db.session.commit()
+    return now if claimed else None
+
+
+def _release_chunk(token, lease, received, ext=None):
+    """
+    Records the bytes received and reopens the upload, if this request
+    still holds `lease`. Returns False when the lease was taken over.
+    """
+    table = UploadSession.__table__
+    values = dict(status='open', received=received, updated_at=datetime.datetime.utcnow())
+    if ext is not None:
+        values['ext'] = ext
+    released = db.session.execute(
+        table.update()
+        .where(table.c.token == token, table.c.status == 'writing', table.c.updated_at == lease)
+        .values(**values)
+    ).rowcount
+    db.session.commit()
+    return bool(released)
+
+
+def _own_session(token):
+    upload = db.session.get(UploadSession, token)
+    if upload is None or upload.user_id != session.get('user_id'):
+        return None
+    return upload
+
+
+@upload_bp.route('', methods=['POST'])
+@login_required
+def start_upload():
+    """
+    Starts a chunked upload. Expects JSON {"size": <total bytes>}.
+    """
+    data = request.get_json(silent=True) or {}
+    size = data.get('size')
+    if not isinstance(size, int) or size <= 0:
+        return jsonify(message="size must be a positive integer."), 400
+    if size > current_app.config['UPLOAD_MAX_SIZE']:
+        return jsonify(message="File is too large."), 413
+
+    collect_expired_uploads(throttle=True)
+
+    token = uuid.uuid4().hex
+    open(partial_path(token), 'wb').close()
+    upload = UploadSession(token=token, user_id=session['user_id'], total_size=size)
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(dict(upload.to_dict(), chunk_size=current_app.config['UPLOAD_CHUNK_SIZE'])), 201
+
+
+@upload_bp.route('/<token>', methods=['GET'])
+@login_required
+def get_upload(token):
+    """
+    Reports how many bytes have been received, so a client can resume.
+    """
+    upload = _own_session(token)
+    if upload is None:
+        return jsonify(message="Upload not found."), 404
+    return jsonify(upload.to_dict()), 200
+
+
+@upload_bp.route('/<token>', methods=['PUT'])
+@login_required
+def put_chunk(token):
+    """
+    Appends the raw request body at `offset`, which must equal the number of
+    bytes received so far. The body is streamed to disk and hashed as it
+    arrives; the first chunk must start with PNG, JPEG or GIF magic bytes.
+    The upload is claimed for the duration of the write, so concurrent or
+    retried PUTs at the same offset get a 409 instead of mixing their bytes.
+    """
+    upload = _own_session(token)
+    if upload is None:
+        return jsonify(message="Upload not found."), 404
+    if upload.status == 'complete':
+        return jsonify(message="Upload is already finalized."), 409
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify(message="offset is required."), 400
+    lease = _claim_chunk(token, offset)
+    if lease is None:
+        db.session.refresh(upload)
+        return jsonify(message="Offset does not match the bytes received.", offset=upload.received), 409
+
+    received, ext, error = offset, None, None
+    try:
+        digest = _hasher_at(token, offset)
+        written = 0
+        head = b''
+        with open(partial_path(token), 'r+b') as out:
+            out.seek(offset)
+            out.truncate()
+            while True:
+                chunk = request.stream.read(READ_SIZE)
+                if not chunk:
+                    break
+                if offset + written + len(chunk) > upload.total_size:
+                    out.truncate(offset)
+                    error = jsonify(message="Chunk goes past the declared size.", offset=offset), 400
+                    break
+                if offset == 0 and len(head) < MAGIC_LENGTH:
+                    head += chunk[:MAGIC_LENGTH - len(head)]
+                    if len(head) >= MAGIC_LENGTH and detect_image_type(head) is None:
+                        out.truncate(0)
+                        error = jsonify(message="File is not a PNG, JPEG or GIF image."), 415
+                        break
+                out.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+            if error is None and offset == 0 and written:
+                ext = detect_image_type(head)
+                if ext is None:
+                    out.truncate(0)
+                    error = jsonify(message="File is not a PNG, JPEG or GIF image."), 415
+        if error is None:
+            received = offset + written
+    finally:
+        released = _release_chunk(token, lease, received, ext)
+
+    if error is not None:
+        return error
+    if not released:
+        db.session.refresh(upload)
+        return jsonify(message="Another request took over this upload.", offset=upload.received), 409
+    with _hashers_lock:
+        _hashers[token] = (received, digest)
+    db.session.refresh(upload)
+    return jsonify(upload.to_dict()), 200
+
+
+@upload_bp.route('/<token>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(token):
+    """
+    Completes an upload once every byte has arrived and records its hash.
+    The hash is the one computed while the chunks streamed in; the file is
+    only read back when they went to another worker or a restart lost it.
+    """
+    upload = _own_session(token)
+    if upload is None:
+        return jsonify(message="Upload not found."), 404
+    if upload.status == 'complete':
+        return jsonify(upload.to_dict()), 200
+    if upload.status != 'open' or upload.received != upload.total_size:
+        return jsonify(message="Upload is incomplete.", offset=upload.received), 409
+
+    sha256 = _hasher_at(token, upload.total_size).hexdigest()
+
+    table = UploadSession.__table__
+    finalized = db.session.execute(
+        table.update()
+        .where(table.c.token == token, table.c.status == 'open', table.c.received == upload.total_size)
+        .values(sha256=sha256, status='complete', updated_at=datetime.datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    db.session.refresh(upload)
+    if not finalized:
+        return jsonify(message="Upload is incomplete.", offset=upload.received), 409
+    return jsonify(upload.to_dict()), 200
+
+
+def claim_upload(token, user_id):
+    """
+    Hands a finalized upload to a recipe: returns (path, sha256, size, ext)
+    and deletes the session in the caller's transaction. Raises ValueError
+    if the token is unknown, belongs to someone else or is not finalized.
+    """
+    upload = db.session.get(UploadSession, token)
+    if upload is None or upload.user_id != user_id:
+        raise ValueError("Unknown upload token.")
+    if upload.status != 'complete':
+        raise ValueError("Upload has not been finalized.")
+    db.session.delete(upload)
+    return partial_path(token), upload.sha256, upload.total_size, upload.ext
+
+
+def collect_expired_uploads(throttle=False):
+    """
+    Deletes upload sessions idle for longer than UPLOAD_SESSION_TTL seconds,
+    along with their partial files. With `throttle`, runs at most once a
+    minute per process so it can be called from request handlers.
+    """
+    now = time.monotonic()
+    if throttle and now - _last_collection[0] < 60:
+        return 0
+    _last_collection[0] = now
+
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=current_app.config['UPLOAD_SESSION_TTL'])
+    expired = [row[0] for row in db.session.query(UploadSession.token).filter(UploadSession.updated_at < cutoff).limit(500)]
+    if not expired:
+        return 0
+    UploadSession.query.filter(UploadSession.token.in_(expired)).delete(synchronize_session=False)
+    db.session.commit()
+    for token in expired:
+        with _hashers_lock:
+            _hashers.pop(token, None)
+        path = partial_path(token)
+        if os.path.exists(path):
+            os.remove(path)
+    return len(expired)
+
+
+def init_app(app):
+    os.makedirs(app.config['UPLOAD_PARTIAL_FOLDER'], exist_ok=True)
+
+    @app.cli.command('gc-uploads')
+    def gc_uploads_command():
+        """Delete abandoned partial uploads."""
+        total = 0
+        while True:
+            removed = collect_expired_uploads()
+            total += removed
+            if not removed:
+                break
+        click.echo(f'Removed {total} abandoned uploads.')
@@ -0,0 +1,114 @@
+# versions.py
+import datetime
+import hashlib
+from functools import wraps
+
+from flask import current_app, g, request
+
+from models import db, Counter, Recipe, insert_ignore
+
+CATALOG = 'catalog'
+
+
+def bump_counter(name):
+    """
+    Increments a named counter. Runs inside the caller's transaction.
+    """
+    db.session.execute(insert_ignore(Counter.__table__).values(name=name, value=0, updated_at=datetime.datetime.utcnow()))
+    db.session.execute(
+        Counter.__table__.update()
+        .where(Counter.name == name)
+        .values(value=Counter.value + 1, updated_at=datetime.datetime.utcnow())
+    )
+
+
+def counter_state(name):
+    """
+    Returns (value, updated_at) for a named counter, or (0, None) if it has
+    never been bumped.
+    """
+    row = db.session.query(Counter.value, Counter.updated_at).filter_by(name=name).first()
+    return (row.value, row.updated_at) if row else (0, None)
+
+
+def bump_catalog_version():
+    """
+    Marks the recipe catalog as changed: any recipe was created, edited,
+    deleted or had its like count change.
+    """
+    bump_counter(CATALOG)
+
+
+def touch_recipe(recipe, content_changed=True):
+    """
+    Updates a recipe's validators. `content_changed` bumps the content
+    version as well as updated_at.
+    """
+    recipe.updated_at = datetime.datetime.utcnow()
+    if content_changed:
+        recipe.version = Recipe.version + 1
+
+
+def _http_date(value):
+    # HTTP dates have one-second resolution
+    return value.replace(microsecond=0, tzinfo=datetime.timezone.utc) if value else None
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Evaluates the request's conditional headers. If-None-Match takes
+    precedence over If-Modified-Since, as in RFC 9110.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _http_date(last_modified) <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified, weak=False):
+    response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = _http_date(last_modified)
+    response.headers['Cache-Control'] = \
+        f"public, max-age={current_app.config['RECIPES_CACHE_MAX_AGE']}, must-revalidate"
+    return response
+
+
+def not_modified_response(etag, last_modified, weak=False):
+    return set_validators(current_app.response_class(status=304), etag, last_modified, weak=weak)
+
+
+def recipe_validators(recipe_id):
+    """
+    Returns (etag, last_modified) for one recipe by reading only its version
+    columns, or None if the recipe does not exist.
+    """
+    row = db.session.query(Recipe.version, Recipe.likes, Recipe.updated_at, Recipe.created_at) \
+        .filter_by(id=recipe_id).first()
+    if row is None:
+        return None
+    return f"r{recipe_id}-v{row.version}-l{row.likes or 0}", row.updated_at or row.created_at
+
+
+def catalog_conditional(view):
+    """
+    Decorator for list views whose output depends only on the catalog and
+    the query string. A request whose ETag matches the current catalog
+    version gets a 304 without the view running. There is no Last-Modified:
+    the catalog changes several times a second (likes are bumped on a
+    timer), and If-Modified-Since would miss changes within its second.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        version, _ = counter_state(CATALOG)
+        g.catalog_version = version
+        args_key = hashlib.sha1(request.query_string).hexdigest()[:12]
+        etag = f"c{version}-{args_key}"
+        if is_not_modified(etag, None):
+            return not_modified_response(etag, None, weak=True)
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            set_validators(response, etag, None, weak=True)
+        return response
+    return decorated_function
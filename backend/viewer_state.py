@@ -0,0 +1,67 @@
+# viewer_state.py
+from sqlalchemy import or_, select
+
+from models import db, User, user_liked_recipes, user_saved_recipes, chunked
+
+ENCODINGS = ('list', 'delta', 'ranges')
+
+
+def bump_state_version(user_id):
+    """
+    Marks a user's liked/saved state as changed. Runs inside the caller's transaction.
+    """
+    db.session.execute(
+        User.__table__.update()
+        .where(User.id == user_id)
+        .values(state_version=User.state_version + 1)
+    )
+
+
+def bump_state_versions_for_recipes(recipe_ids):
+    """
+    Marks the state of every user who liked or saved any of `recipe_ids` as
+    changed, e.g. before the recipes are deleted.
+    """
+    for chunk in chunked(recipe_ids):
+        affected = or_(
+            User.id.in_(select(user_liked_recipes.c.user_id).where(user_liked_recipes.c.recipe_id.in_(chunk))),
+            User.id.in_(select(user_saved_recipes.c.user_id).where(user_saved_recipes.c.recipe_id.in_(chunk))),
+        )
+        db.session.execute(User.__table__.update().where(affected).values(state_version=User.state_version + 1))
+
+
+def state_version(user_id):
+    return db.session.query(User.state_version).filter_by(id=user_id).scalar()
+
+
+def recipe_ids(table, user_id, only=None):
+    """
+    Returns the sorted recipe ids in an association table for one user,
+    optionally restricted to the ids in `only`. Reads only the table's
+    (user_id, recipe_id) primary key index.
+    """
+    query = select(table.c.recipe_id).where(table.c.user_id == user_id)
+    if only is not None:
+        query = query.where(table.c.recipe_id.in_(only))
+    return [row[0] for row in db.session.execute(query.order_by(table.c.recipe_id))]
+
+
+def encode_ids(ids, encoding):
+    """
+    Encodes a sorted id list.
+
+    list   -- the ids as-is
+    delta  -- the first id followed by the gaps between consecutive ids
+    ranges -- [start, length] pairs for each run of consecutive ids
+    """
+    if encoding == 'delta':
+        return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])] if ids else []
+    if encoding == 'ranges':
+        ranges = []
+        for recipe_id in ids:
+            if ranges and ranges[-1][0] + ranges[-1][1] == recipe_id:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([recipe_id, 1])
+        return ranges
+    return ids
@@ -0,0 +1,37 @@
+# warmup.py
+from models import db, Recipe
+
+# Read requests replayed before a server takes traffic. They compile and
+# cache the SQL of the hot routes, fill the response and fragment caches,
+# build the similar-recipes index and load the frontend entry page.
+# {recipe_id} is the newest recipe.
+WARM_UP_PATHS = (
+    '/api/recipes',
+    '/api/recipes?sort=likes',
+    '/api/recipes/trending',
+    '/api/recipes/{recipe_id}',
+    '/api/recipes/{recipe_id}/similar',
+    '/api/recipes/search?q=chicken',
+    '/api/recipes/by-ingredients?any=salt',
+    '/api/recipes/changes',
+    '/api/auth/status',
+    '/healthz/ready',
+    '/',
+)
+
+
+def warm_up(app, paths=WARM_UP_PATHS):
+    """
+    Sends `paths` through the test client and returns {path: status}. Only
+    GET requests are made, so nothing is written. The request metrics are
+    cleared afterwards, so /metrics only counts real traffic.
+    """
+    with app.app_context():
+        recipe_id = db.session.query(db.func.max(Recipe.id)).scalar() or 0
+    client = app.test_client()
+    results = {}
+    for path in paths:
+        path = path.format(recipe_id=recipe_id)
+        results[path] = client.get(path).status_code
+    app.extensions['metrics'].reset()
+    return results
@@ -5,7 +5,11 @@ import {
     currentUser,
     allRecipes,
     savedRecipeIds,
+    nextRecipesCursor,
+    changeSeq,
     setAllRecipes,
+    setNextRecipesCursor,
+    setChangeSeq,
     setSavedRecipeIds,
     setLikedRecipeIds,
     setCurrentUser
@@ -19,11 +23,16 @@ import {
 } from './main.js'; // Import from main.js to avoid circular dependency
 import {
     renderRecipes,
+    appendRecipes,
+    prependRecipes,
+    replaceRecipeCard,
+    removeRecipeCard,
     resetAddEditForm
 } from './render.js';
 import {
     recipeListContainer,
     noRecipesMessage,
+    loadMoreRecipesBtn,
     savedRecipeListContainer,
     noSavedRecipesMessage,
     loginToViewSavedMessage
@@ -75,31 +84,141 @@ export async function checkAuthStatus() {
 }
 
 /**
- * Fetches all recipes from the backend and renders them.
+ * Fetches a page of recipes from the backend.
+ * @param {string|null} cursor The cursor returned with the previous page, or null for the first page.
+ * @returns {Promise<{recipes: Array, next_cursor: string|null}>} The page of recipes.
+ */
+async function fetchRecipePage(cursor) {
+    const params = new URLSearchParams();
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    const response = await fetch(`${API_BASE_URL}/api/recipes?${params}`);
+    if (!response.ok) {
+        throw new Error(response.statusText);
+    }
+    return response.json();
+}
+
+/**
+ * Fetches the recipes whose ingredients are most like the given recipe's.
+ * @param {number} recipeId The recipe to find similar recipes for.
+ * @param {number} k The number of recipes to fetch.
+ * @returns {Promise<Array>} The similar recipes (id and title only), most similar first.
+ */
+export async function fetchSimilarRecipes(recipeId, k = 4) {
+    const response = await fetch(`${API_BASE_URL}/api/recipes/${recipeId}/similar?k=${k}&fields=title`);
+    if (!response.ok) {
+        throw new Error(response.statusText);
+    }
+    return (await response.json()).recipes;
+}
+
+/**
+ * Fetches the first page of recipes from the backend and renders them.
  */
 export async function fetchAllRecipes() {
     try {
-        const response = await fetch(`${API_BASE_URL}/api/recipes`);
-        if (response.ok) {
-            let recipes = await response.json();
-            // Process the recipes to fix image URLs before setting state
-            recipes = processRecipesForDisplay(recipes);
-            setAllRecipes(recipes);
-            renderRecipes(allRecipes, recipeListContainer);
-            if (allRecipes.length === 0) {
-                noRecipesMessage.classList.remove('hidden');
-            } else {
-                noRecipesMessage.classList.add('hidden');
-            }
+        // Read the change-log position first, so changes made while the page loads are replayed later
+        const positionResponse = await fetch(`${API_BASE_URL}/api/recipes/changes`);
+        const position = positionResponse.ok ? await positionResponse.json() : { latest: null };
+        const page = await fetchRecipePage(null);
+        // Process the recipes to fix image URLs before setting state
+        setAllRecipes(processRecipesForDisplay(page.recipes));
+        setNextRecipesCursor(page.next_cursor);
+        setChangeSeq(position.latest);
+        renderRecipes(allRecipes, recipeListContainer);
+        if (allRecipes.length === 0) {
+            noRecipesMessage.classList.remove('hidden');
         } else {
-            showMessage(`Error fetching recipes: ${response.statusText}`, 'error');
+            noRecipesMessage.classList.add('hidden');
         }
+        loadMoreRecipesBtn.classList.toggle('hidden', !nextRecipesCursor);
+    } catch (error) {
+        showMessage(`Error fetching recipes: ${error.message}`, 'error');
+        console.error("Error fetching recipes:", error);
+    }
+}
+
+/**
+ * Fetches the next page of recipes and appends it to the list.
+ */
+export async function fetchMoreRecipes() {
+    if (!nextRecipesCursor) {
+        return;
+    }
+    try {
+        const page = await fetchRecipePage(nextRecipesCursor);
+        const recipes = processRecipesForDisplay(page.recipes);
+        setAllRecipes(allRecipes.concat(recipes));
+        setNextRecipesCursor(page.next_cursor);
+        appendRecipes(recipes, recipeListContainer);
+        loadMoreRecipesBtn.classList.toggle('hidden', !nextRecipesCursor);
     } catch (error) {
         showMessage(`Error fetching recipes: ${error.message}`, 'error');
         console.error("Error fetching recipes:", error);
     }
 }
 
+/**
+ * Applies the recipe changes made since the list was loaded, updating only the affected cards.
+ * Falls back to reloading the list when the server asks for a resync.
+ */
+export async function syncRecipeChanges() {
+    if (changeSeq === null) {
+        return fetchAllRecipes();
+    }
+    try {
+        let hasMore = true;
+        while (hasMore) {
+            const response = await fetch(`${API_BASE_URL}/api/recipes/changes?since=${changeSeq}`);
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            const changes = await response.json();
+            if (changes.resync) {
+                return fetchAllRecipes();
+            }
+            applyRecipeChanges(processRecipesForDisplay(changes.recipes), changes.deleted);
+            setChangeSeq(changes.next_since);
+            hasMore = changes.has_more;
+        }
+    } catch (error) {
+        console.error("Error syncing recipe changes:", error);
+    }
+}
+
+/**
+ * Patches allRecipes and the rendered cards with changed and deleted recipes.
+ * Recipes newer than the loaded list are added at the top; other recipes that
+ * are not loaded are ignored until their page is fetched.
+ * @param {Array} recipes The created or updated recipes.
+ * @param {Array<number>} deletedIds The ids of deleted recipes.
+ */
+function applyRecipeChanges(recipes, deletedIds) {
+    const deleted = new Set(deletedIds);
+    let updated = allRecipes.filter(recipe => !deleted.has(recipe.id));
+    deletedIds.forEach(id => removeRecipeCard(id, recipeListContainer));
+
+    const positions = new Map(updated.map((recipe, index) => [recipe.id, index]));
+    const newest = updated.length > 0 ? updated[0].created_at : '';
+    const added = [];
+    recipes.forEach(recipe => {
+        if (positions.has(recipe.id)) {
+            updated[positions.get(recipe.id)] = recipe;
+            replaceRecipeCard(recipe, recipeListContainer);
+        } else if (recipe.created_at > newest) {
+            added.push(recipe);
+        }
+    });
+    added.sort((a, b) => (a.created_at < b.created_at ? 1 : -1));
+    updated = added.concat(updated);
+    prependRecipes(added, recipeListContainer);
+
+    setAllRecipes(updated);
+    noRecipesMessage.classList.toggle('hidden', allRecipes.length > 0);
+}
+
 /**
  * Fetches the recipes saved by the current user.
  */
@@ -137,8 +256,24 @@ export async function fetchSavedRecipes() {
     }
 }
 
+/**
+ * Expands a list of [start, length] id ranges into a Set of ids.
+ * @param {Array<Array<number>>} ranges The ranges returned by /api/me/recipe-state?encoding=ranges.
+ * @returns {Set<number>} The ids covered by the ranges.
+ */
+function expandIdRanges(ranges) {
+    const ids = new Set();
+    ranges.forEach(([start, length]) => {
+        for (let id = start; id < start + length; id++) {
+            ids.add(id);
+        }
+    });
+    return ids;
+}
+
 /**
  * Fetches the liked and saved status for the current user's recipes.
+ * The browser revalidates the response with its ETag, so an unchanged state costs a 304.
  */
 export async function fetchUserRecipeStatuses() {
     if (!currentUser) {
@@ -147,19 +282,13 @@ export async function fetchUserRecipeStatuses() {
         return;
     }
     try {
-        const likedRes = await fetch(`${API_BASE_URL}/api/my-liked-recipes-status`, { credentials: 'include' });
-        if (likedRes.ok) {
-            const likedData = await likedRes.json();
-            setLikedRecipeIds(new Set(likedData.likedRecipeIds));
-        } else {
-            console.error("Failed to fetch liked recipe status:", likedRes.statusText);
-        }
-        const savedRes = await fetch(`${API_BASE_URL}/api/my-saved-recipes-status`, { credentials: 'include' });
-        if (savedRes.ok) {
-            const savedData = await savedRes.json();
-            setSavedRecipeIds(new Set(savedData.savedRecipeIds));
+        const response = await fetch(`${API_BASE_URL}/api/me/recipe-state?encoding=ranges`, { credentials: 'include' });
+        if (response.ok) {
+            const state = await response.json();
+            setLikedRecipeIds(expandIdRanges(state.liked));
+            setSavedRecipeIds(expandIdRanges(state.saved));
         } else {
-            console.error("Failed to fetch saved recipe status:", savedRes.statusText);
+            console.error("Failed to fetch recipe state:", response.statusText);
         }
     } catch (error) {
         console.error("Error fetching user recipe statuses:", error);
@@ -167,6 +296,64 @@ export async function fetchUserRecipeStatuses() {
     renderRecipes(allRecipes, recipeListContainer);
 }
 
+/**
+ * Uploads an image in chunks so a dropped connection only costs the current chunk.
+ * On a network error the upload asks the server how much it has and resumes from there.
+ * @param {File} file The image file to upload.
+ * @returns {Promise<string>} The upload token to send with the recipe form.
+ */
+export async function uploadImageInChunks(file) {
+    const maxRetries = 5;
+    const startResponse = await fetch(`${API_BASE_URL}/api/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ size: file.size }),
+        credentials: 'include'
+    });
+    const upload = await startResponse.json();
+    if (!startResponse.ok) {
+        throw new Error(upload.message || 'Could not start upload.');
+    }
+
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/uploads/${upload.token}?offset=${offset}`, {
+                method: 'PUT',
+                body: chunk,
+                credentials: 'include'
+            });
+            const data = await response.json();
+            if (!response.ok && response.status !== 409) {
+                throw new Error(data.message || 'Upload failed.');
+            }
+            // A 409 means the server has a different offset; continue from there
+            offset = data.offset;
+            retries = 0;
+        } catch (error) {
+            if (!(error instanceof TypeError) || ++retries > maxRetries) {
+                throw error;
+            }
+            // Network error: ask the server how far it got before retrying
+            const statusResponse = await fetch(`${API_BASE_URL}/api/uploads/${upload.token}`, { credentials: 'include' });
+            if (statusResponse.ok) {
+                offset = (await statusResponse.json()).offset;
+            }
+        }
+    }
+
+    const finalizeResponse = await fetch(`${API_BASE_URL}/api/uploads/${upload.token}/finalize`, {
+        method: 'POST',
+        credentials: 'include'
+    });
+    if (!finalizeResponse.ok) {
+        throw new Error((await finalizeResponse.json()).message || 'Could not finalize upload.');
+    }
+    return upload.token;
+}
+
 /**
  * Submits the add/edit recipe form data to the backend.
  * @param {Event} e The form submission event.
@@ -217,7 +404,7 @@ export async function handleRecipeFormSubmit(e) {
         if (response.ok) {
             showMessage(data.message, 'success');
             resetAddEditForm();
-            fetchAllRecipes();
+            syncRecipeChanges();
             showSection('home-section');
         } else {
             showMessage(`Error ${isEditing ? 'updating' : 'adding'} recipe: ${data.message || 'Unknown error'}`, 'error');
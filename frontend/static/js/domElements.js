@@ -25,6 +25,7 @@ export const authSection = document.getElementById('auth-section');
 // Recipe List Elements
 export const recipeListContainer = document.getElementById('recipe-list-container');
 export const noRecipesMessage = document.getElementById('no-recipes-message');
+export const loadMoreRecipesBtn = document.getElementById('load-more-recipes-btn');
 
 // Add/Edit Recipe Form Elements
 export const addRecipeSectionTitle = document.getElementById('add-edit-recipe-title');
@@ -0,0 +1,97 @@
+// live.js
+// This module keeps the recipe cards on screen current through the server-sent event
+// stream at /api/recipes/stream: like counts are patched in place, and edits and
+// deletions are applied through the change-log sync.
+import {
+    API_BASE_URL,
+    allRecipes
+} from './state.js';
+import {
+    syncRecipeChanges
+} from './api.js';
+
+// Wait for scrolling to settle before reconnecting with a new set of recipes
+const RESUBSCRIBE_DELAY_MS = 1000;
+// Must not exceed RECIPE_STREAM_MAX_IDS on the server
+const MAX_WATCHED_RECIPES = 500;
+
+const visibleRecipeIds = new Set();
+let eventSource = null;
+let subscribedIds = '';
+let resubscribeTimer = null;
+
+const cardObserver = new IntersectionObserver((entries) => {
+    entries.forEach((entry) => {
+        const recipeId = Number(entry.target.dataset.id);
+        if (entry.isIntersecting) {
+            visibleRecipeIds.add(recipeId);
+        } else {
+            visibleRecipeIds.delete(recipeId);
+        }
+    });
+    scheduleResubscribe();
+}, { rootMargin: '200px' });
+
+/**
+ * Starts tracking whether a recipe card is on screen, so its recipe is watched while it is.
+ * @param {HTMLElement} card The recipe card element (with data-id set).
+ */
+export function watchRecipeCard(card) {
+    cardObserver.observe(card);
+}
+
+function scheduleResubscribe() {
+    clearTimeout(resubscribeTimer);
+    resubscribeTimer = setTimeout(resubscribe, RESUBSCRIBE_DELAY_MS);
+}
+
+/**
+ * Opens a stream for the recipes currently on screen, replacing the previous one.
+ * No stream is kept open while the page is hidden or no recipe is visible.
+ */
+function resubscribe() {
+    const ids = document.hidden ? '' : [...visibleRecipeIds].sort((a, b) => a - b).slice(0, MAX_WATCHED_RECIPES).join(',');
+    if (ids === subscribedIds && (eventSource === null || eventSource.readyState !== EventSource.CLOSED)) {
+        return;
+    }
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    subscribedIds = ids;
+    if (!ids) {
+        return;
+    }
+    eventSource = new EventSource(`${API_BASE_URL}/api/recipes/stream?ids=${ids}`);
+    eventSource.addEventListener('likes', (event) => {
+        const { id, likes } = JSON.parse(event.data);
+        updateLikeCount(id, likes);
+    });
+    // Edits and deletions need the full recipe, which the change-log sync fetches
+    eventSource.addEventListener('update', () => syncRecipeChanges());
+    eventSource.addEventListener('delete', () => syncRecipeChanges());
+    eventSource.addEventListener('error', () => {
+        // The browser retries dropped streams itself; a refused one (e.g. live updates
+        // disabled) stays closed and the periodic change-log sync keeps the list current
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            console.warn('Live recipe updates are unavailable.');
+        }
+    });
+}
+
+/**
+ * Shows a new like count on every card of the recipe and in the loaded recipes.
+ * @param {number} recipeId The id of the recipe.
+ * @param {number} likes The new like count.
+ */
+function updateLikeCount(recipeId, likes) {
+    document.querySelectorAll(`[data-likes-count="${recipeId}"]`).forEach((span) => {
+        span.textContent = `Likes: ${likes}`;
+    });
+    const recipe = allRecipes.find(r => r.id === recipeId);
+    if (recipe) {
+        recipe.likes = likes;
+    }
+}
+
+document.addEventListener('visibilitychange', resubscribe);
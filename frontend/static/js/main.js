@@ -13,7 +13,6 @@ import {
     setIsLoginMode,
     setSavedRecipeIds,
     setLikedRecipeIds,
-    allRecipes,
     setAllRecipes
 } from './state.js';
 import {
@@ -23,11 +22,13 @@ import {
 import {
     checkAuthStatus,
     fetchAllRecipes,
+    fetchMoreRecipes,
+    syncRecipeChanges,
     fetchSavedRecipes,
+    uploadImageInChunks,
     fetchUserRecipeStatuses // Added this import to call after login/register
 } from './api.js';
 import {
-    renderRecipes,
     resetAddEditForm,
     confirmDeleteRecipe
 } from './render.js';
@@ -52,6 +53,7 @@ import {
     confirmDeleteBtn,
     cancelDeleteBtn,
     currentUserIdSpan,
+    loadMoreRecipesBtn,
     recipeIdInput // Added to get the recipe ID from the hidden input
 } from './domElements.js';
 
@@ -81,9 +83,11 @@ export function updateNavVisibility() {
 // Navigation
 navAllRecipesBtn.addEventListener('click', () => {
     showSection('home-section');
-    fetchAllRecipes();
+    syncRecipeChanges();
 });
 
+loadMoreRecipesBtn.addEventListener('click', fetchMoreRecipes);
+
 navAddRecipeBtn.addEventListener('click', () => {
     if (currentUser) {
         resetAddEditForm();
@@ -210,6 +214,13 @@ addRecipeForm.addEventListener('submit', async (e) => {
 
 
     try {
+        // Send the image through the resumable chunked upload API instead of inline
+        const imageFile = formData.get('image');
+        formData.delete('image');
+        if (imageFile && imageFile.size > 0) {
+            formData.append('upload_token', await uploadImageInChunks(imageFile));
+        }
+
         const response = await fetch(url, {
             method: method,
             body: formData,
@@ -220,8 +231,7 @@ addRecipeForm.addEventListener('submit', async (e) => {
         if (response.ok) {
             showMessage(data.message, 'success');
             resetAddEditForm();
-            await fetchAllRecipes();
-            renderRecipes(allRecipes, document.getElementById('recipe-list-container'));
+            await syncRecipeChanges();
             showSection('home-section');
         } else {
             showMessage(`Error: ${data.message || 'Unknown error'}`, 'error');
@@ -246,3 +256,16 @@ cancelDeleteBtn.addEventListener('click', () => {
 
 // Initial application load
 window.addEventListener('load', checkAuthStatus);
+
+// Keep the loaded recipes current by polling the change log while the page is visible
+const RECIPE_SYNC_INTERVAL_MS = 15000;
+setInterval(() => {
+    if (!document.hidden) {
+        syncRecipeChanges();
+    }
+}, RECIPE_SYNC_INTERVAL_MS);
+document.addEventListener('visibilitychange', () => {
+    if (!document.hidden) {
+        syncRecipeChanges();
+    }
+});
@@ -27,12 +27,17 @@ import {
     recipeIngredientsInput,
     recipeInstructionsInput,
     deleteModal,
-    recipeListContainer
+    recipeListContainer,
+    noRecipesMessage
 } from './domElements.js';
 import {
     fetchSavedRecipes,
-    fetchAllRecipes
+    fetchAllRecipes,
+    fetchSimilarRecipes
 } from './api.js';
+import {
+    watchRecipeCard
+} from './live.js';
 
 /**
  * Creates a single recipe card DOM element.
@@ -59,12 +64,23 @@ export function createRecipeCard(recipe) {
     
     // Set the image source based on whether a filename exists.
     let imageUrl;
-    if (recipe.image_filename) {
+    if (recipe.image) {
+        imageUrl = `${API_BASE_URL}${recipe.image.url}`;
+        // Let the browser pick a resized WebP variant once they have been generated
+        if (recipe.image.srcset && recipe.image.srcset.webp) {
+            imageElement.srcset = recipe.image.srcset.webp
+                .split(', ')
+                .map(entry => `${API_BASE_URL}${entry}`)
+                .join(', ');
+            imageElement.sizes = '(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw';
+        }
+    } else if (recipe.image_filename) {
         imageUrl = `${API_BASE_URL}/uploads/${recipe.image_filename}`;
     } else {
         imageUrl = 'https://placehold.co/400x200/cccccc/333333?text=No+Image';
     }
     imageElement.src = imageUrl;
+    imageElement.loading = 'lazy';
     console.log('Final image URL:', imageUrl);
     // --- END DEBUGGING LOGS ---
 
@@ -167,6 +183,15 @@ export function createRecipeCard(recipe) {
     instructionsText.className = 'text-gray-700 whitespace-pre-wrap';
     instructionsText.textContent = recipe.instructions;
     detailsSection.appendChild(instructionsText);
+
+    const similarTitle = document.createElement('h4');
+    similarTitle.className = 'text-lg font-semibold text-red-800 mt-4 mb-2';
+    similarTitle.textContent = 'More like this:';
+    detailsSection.appendChild(similarTitle);
+
+    const similarList = document.createElement('ul');
+    similarList.className = 'list-disc list-inside text-gray-700 space-y-1';
+    detailsSection.appendChild(similarList);
     card.appendChild(detailsSection);
 
     const viewDetailsBtn = card.querySelector('.view-details-btn');
@@ -178,9 +203,30 @@ export function createRecipeCard(recipe) {
 
 
     // Add event listeners for dynamic interactions
-    viewDetailsBtn.addEventListener('click', () => {
+    let similarLoaded = false;
+    viewDetailsBtn.addEventListener('click', async () => {
         detailsSection.classList.toggle('hidden');
         viewDetailsBtn.textContent = detailsSection.classList.contains('hidden') ? 'View Details' : 'Hide Details';
+        // Load the similar recipes the first time the details are opened
+        if (similarLoaded || detailsSection.classList.contains('hidden')) {
+            return;
+        }
+        similarLoaded = true;
+        try {
+            const similarRecipes = await fetchSimilarRecipes(recipe.id);
+            similarList.innerHTML = '';
+            similarRecipes.forEach((similarRecipe) => {
+                const listItem = document.createElement('li');
+                listItem.textContent = similarRecipe.title;
+                similarList.appendChild(listItem);
+            });
+            if (similarRecipes.length === 0) {
+                similarList.innerHTML = '<li>No similar recipes found.</li>';
+            }
+        } catch (error) {
+            console.error('Error fetching similar recipes:', error);
+            similarLoaded = false;
+        }
     });
 
     if (saveRecipeBtn) {
@@ -275,6 +321,8 @@ export function createRecipeCard(recipe) {
         });
     }
 
+    // Receive live like counts and edits while the card is on screen
+    watchRecipeCard(card);
     return card;
 }
 
@@ -294,6 +342,53 @@ export function renderRecipes(recipes, containerElement) {
     });
 }
 
+/**
+ * Appends recipes to a container without clearing the cards already in it.
+ * @param {Array<Object>} recipes The array of recipe objects to append.
+ * @param {HTMLElement} containerElement The container to append the cards to.
+ */
+export function appendRecipes(recipes, containerElement) {
+    recipes.forEach(recipe => {
+        const card = createRecipeCard(recipe);
+        containerElement.appendChild(card);
+    });
+}
+
+/**
+ * Inserts recipes at the top of a container, keeping their order.
+ * @param {Array<Object>} recipes The array of recipe objects to insert.
+ * @param {HTMLElement} containerElement The container to insert the cards into.
+ */
+export function prependRecipes(recipes, containerElement) {
+    const fragment = document.createDocumentFragment();
+    recipes.forEach(recipe => fragment.appendChild(createRecipeCard(recipe)));
+    containerElement.prepend(fragment);
+}
+
+/**
+ * Re-renders the card of one recipe in place, if it is in the container.
+ * @param {Object} recipe The updated recipe.
+ * @param {HTMLElement} containerElement The container holding the card.
+ */
+export function replaceRecipeCard(recipe, containerElement) {
+    const card = containerElement.querySelector(`.recipe-card[data-id="${recipe.id}"]`);
+    if (card) {
+        card.replaceWith(createRecipeCard(recipe));
+    }
+}
+
+/**
+ * Removes the card of one recipe, if it is in the container.
+ * @param {number} recipeId The id of the recipe.
+ * @param {HTMLElement} containerElement The container holding the card.
+ */
+export function removeRecipeCard(recipeId, containerElement) {
+    const card = containerElement.querySelector(`.recipe-card[data-id="${recipeId}"]`);
+    if (card) {
+        card.remove();
+    }
+}
+
 /**
  * Resets the add/edit recipe form to its default 'Add' state.
  */
@@ -331,8 +426,7 @@ export async function confirmDeleteRecipe() {
             // Also update the allRecipes array
             const newRecipes = allRecipes.filter(r => r.id !== recipeToDeleteId);
             setAllRecipes(newRecipes);
-            // Re-render to update the "no recipes" message if needed
-            renderRecipes(allRecipes, recipeListContainer);
+            noRecipesMessage.classList.toggle('hidden', allRecipes.length > 0);
 
         } else {
             showMessage(`Error deleting recipe: ${data.message || 'Unknown error'}`, 'error');
@@ -5,7 +5,9 @@
 export const API_BASE_URL = window.location.origin;
 
 export let currentUser = null; // Stores { id, email } of the logged-in user
-export let allRecipes = []; // Cache for all recipes
+export let allRecipes = []; // Cache for the recipes loaded so far
+export let nextRecipesCursor = null; // Cursor for the next page of recipes, null when there is none
+export let changeSeq = null; // Change-log position allRecipes is current to, null before the first load
 export let savedRecipeIds = new Set(); // Set of IDs of recipes saved by the current user
 export let likedRecipeIds = new Set(); // Set of IDs of recipes liked by the current user
 export let recipeToDeleteId = null; // Stores the ID of the recipe to be deleted
@@ -21,6 +23,14 @@ export function setAllRecipes(recipes) {
     allRecipes = recipes;
 }
 
+export function setNextRecipesCursor(cursor) {
+    nextRecipesCursor = cursor;
+}
+
+export function setChangeSeq(seq) {
+    changeSeq = seq;
+}
+
 export function setSavedRecipeIds(ids) {
     savedRecipeIds = ids;
 }